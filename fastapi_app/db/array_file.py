@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Tuple
+import json
+import logging
+import mmap
+import os
+import struct
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tablice w pliku zaczynają się na granicy linii pamięci podręcznej
+ALIGNMENT = 64
+
+
+def _data_start(magic: bytes, header_len: int) -> int:
+    end = len(magic) + 8 + header_len
+    return -(-end // ALIGNMENT) * ALIGNMENT
+
+
+def write_array_file(path: str, magic: bytes, header: dict, arrays: Dict[str, np.ndarray]):
+    """Zapisuje nagłówek JSON i tablice numpy do pliku binarnego (atomowo, przez plik tymczasowy).
+
+    Układ: magic, długość nagłówka (<Q), nagłówek z tabelą tablic (dtype,
+    shape, offset), a od wyrównanego przesunięcia kolejne tablice.
+    """
+    table = {}
+    offset = 0
+    contiguous = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        contiguous[name] = array
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    encoded = json.dumps({**header, "arrays": table}).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        f.write(b"\0" * (_data_start(magic, len(encoded)) - f.tell()))
+        for array in contiguous.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * (-array.nbytes % ALIGNMENT))
+    os.replace(tmp_path, path)
+
+
+def map_array_file(path: str, magic: bytes) -> Optional[Tuple[dict, Dict[str, np.ndarray]]]:
+    """Mapuje plik (mmap) i zwraca (nagłówek, tablice jako widoki bez kopiowania).
+
+    Zwraca None, gdy plik nie istnieje, jest pusty, ma inny magic albo jest
+    uszkodzony (obcięty nagłówek lub tablice) - wołający budują go wtedy od nowa.
+    """
+    if not os.path.exists(path):
+        return None
+    size = os.path.getsize(path)
+    if size == 0:
+        return None
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(magic)] != magic:
+        return None
+    try:
+        (header_len,) = struct.unpack_from("<Q", buffer, len(magic))
+        start = len(magic) + 8
+        header = json.loads(buffer[start:start + header_len])
+
+        data_start = _data_start(magic, header_len)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            offset = data_start + spec["offset"]
+            if spec["offset"] < 0 or offset + count * dtype.itemsize > size:
+                raise ValueError(f"array {name} ends past the end of the file")
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(spec["shape"])
+    except (ValueError, json.JSONDecodeError, struct.error, KeyError, TypeError) as e:
+        logger.warning("Ignoring damaged array file %s: %s", path, e)
+        return None
+    return header, arrays
@@ -1,11 +1,15 @@
-from models.database_models import Notification, User, Train, Stop, Line, Edge, Event, LatLng, IncidentType, Schedule
+from models.database_models import Notification, User, Train, Stop, Line, Edge, Event, LatLng, IncidentType, Schedule, ServiceCalendar
 from datetime import datetime, time
-from typing import Dict, List
+from typing import Deque, Dict, List
 import logging
 
 # Simulacja tabel bazodanowych jako słowniki
 # Klucze to ID, wartości to obiekty modeli
-notifications: list[Notification] = []
+# Skrzynki powiadomień: user_id -> ostatnie powiadomienia (bufor cykliczny, deque z maxlen)
+notification_inboxes: Dict[int, Deque[Notification]] = {}
+
+# Tokeny urządzeń do powiadomień push: user_id -> token
+device_tokens: Dict[int, str] = {}
 
 # Tabela Users
 users: Dict[int, User] = {
@@ -1079,6 +1083,9 @@ lines: Dict[int, Line] = {
     ),
 }
 
+# Tabela Calendars - kalendarze kursowania (service_id -> dni tygodnia i zakres dat)
+calendars: Dict[str, ServiceCalendar] = {}
+
 # Tabela Trains
 trains: Dict[int, Train] = {
     101: Train(id=101, line_id=1, current_edge=15),
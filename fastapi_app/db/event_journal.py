@@ -0,0 +1,179 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import fcntl
+import json
+import logging
+import os
+import threading
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+Applier = Callable[[dict], None]
+# Zrzut stanu do punktu kontrolnego: treści wpisów (bez "op"), które ten stan odtwarzają
+Dumper = Callable[[], Iterable[dict]]
+
+# Co ile bajtów dziennika zapisywany jest punkt kontrolny stanu (0 - nigdy)
+CHECKPOINT_BYTES = int(os.environ.get("EVENT_JOURNAL_CHECKPOINT_BYTES", str(1 << 20)))
+
+
+class EventJournal:
+    """Dziennik zmian stanu w pamięci współdzielony przez procesy workerów.
+
+    Zdarzenia i głosy są w SQLite (EventStore); dziennik niesie resztę stanu
+    workerów: poziomy użytkowników, przypisania i ruchy pociągów, powiadomienia
+    i tokeny urządzeń. Każda zmiana to jeden wiersz JSON dopisywany do pliku.
+    Zapis odbywa się pod wyłącznym flock, więc w danej chwili pisze tylko jeden
+    worker, a pozostałe odtwarzają nowe wiersze (sync) przed odczytem stanu.
+    Bez ścieżki dziennik działa tylko w pamięci bieżącego procesu. Wątki jednego
+    procesu dzielą deskryptor (a więc i flock), dlatego zapis i synchronizację
+    chroni dodatkowo blokada wątków.
+
+    Co CHECKPOINT_BYTES zapisu pisarz zrzuca cały stan (dumpers) do punktu
+    kontrolnego {path}.checkpoint z przesunięciem w dzienniku, na którym go
+    zrobiono. Nowy worker wczytuje punkt kontrolny i odtwarza tylko dalsze
+    wiersze, zamiast całej historii.
+    """
+
+    def __init__(self, path: Optional[str], appliers: Dict[str, Applier],
+                 dumpers: Optional[Dict[str, Dumper]] = None, checkpoint_bytes: int = CHECKPOINT_BYTES):
+        self.path = path
+        self.appliers = appliers
+        self.dumpers: Dict[str, Dumper] = dumpers if dumpers is not None else {}
+        self.checkpoint_bytes = checkpoint_bytes
+        self._offset = 0
+        self._checkpoint_offset = 0
+        self._restored = False
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.RLock()
+
+    @property
+    def checkpoint_path(self) -> str:
+        return f"{self.path}.checkpoint"
+
+    def _file(self) -> Optional[int]:
+        """Deskryptor pliku otwierany osobno w każdym procesie (flock po fork byłby wspólny)"""
+        if not self.path:
+            return None
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _apply(self, record: dict):
+        applier = self.appliers.get(record.get("op"))
+        if applier is None:
+            logger.warning("Skipping unknown event journal record %r", record.get("op"))
+            return
+        applier(record)
+
+    def sync(self):
+        """Odtwarza wiersze dopisane przez inne procesy od ostatniej synchronizacji"""
+        fd = self._file()
+        if fd is None:
+            return
+        with self._lock:
+            if not self._restored:
+                self._restore(fd)
+            size = os.fstat(fd).st_size
+            if size <= self._offset:
+                return
+            data = os.pread(fd, size - self._offset, self._offset)
+            # Niedokończony ostatni wiersz zostaje na następną synchronizację
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping corrupted event journal line at offset %d", self._offset)
+                    continue
+                self._apply(record)
+            self._offset += end
+
+    @contextmanager
+    def writer(self) -> Iterator[Callable[..., None]]:
+        """Blok zapisu: stan jest zsynchronizowany i zablokowany dla innych workerów.
+
+        Zwracana funkcja write(op, **payload) od razu stosuje zmianę lokalnie;
+        wiersze trafiają do pliku jednym zapisem przy wyjściu z bloku (także po
+        wyjątku, by lokalny stan nie rozjechał się z dziennikiem).
+        """
+        pending: List[bytes] = []
+
+        def write(op: str, **payload):
+            record = {"op": op, **{key: _to_json(value) for key, value in payload.items()}}
+            self._apply(record)
+            pending.append(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        fd = self._file()
+        if fd is None:
+            with self._lock:
+                yield write
+            return
+
+        with self._lock:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self.sync()
+                # Urwany wiersz po awarii innego procesu - zamykamy go, by nie skleić z naszym
+                size = os.fstat(fd).st_size
+                if size > self._offset:
+                    pending.append(b"\n")
+                    self._offset = size
+                try:
+                    yield write
+                finally:
+                    if pending:
+                        data = b"".join(pending)
+                        os.write(fd, data)
+                        self._offset += len(data)
+                        if self.checkpoint_bytes and self._offset - self._checkpoint_offset >= self.checkpoint_bytes:
+                            self._write_checkpoint(fd)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _write_checkpoint(self, fd: int):
+        """Zrzuca stan (zsynchronizowany do self._offset, pod flock) do punktu kontrolnego, atomowo"""
+        stat = os.fstat(fd)
+        header = {"offset": self._offset, "file": [stat.st_dev, stat.st_ino]}
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                for op, dump in self.dumpers.items():
+                    for payload in dump():
+                        record = {"op": op, **{key: _to_json(value) for key, value in payload.items()}}
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.warning("Could not write event journal checkpoint %s: %s", self.checkpoint_path, e)
+            return
+        self._checkpoint_offset = self._offset
+
+    def _restore(self, fd: int):
+        """Przy pierwszej synchronizacji procesu: stan z punktu kontrolnego, jeśli pasuje do tego dziennika"""
+        self._restored = True
+        if self._offset:
+            return
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                stat = os.fstat(fd)
+                if header.get("file") != [stat.st_dev, stat.st_ino] or header.get("offset", 0) > stat.st_size:
+                    logger.warning("Ignoring event journal checkpoint %s made for another journal", self.checkpoint_path)
+                    return
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning("Ignoring damaged event journal checkpoint %s: %s", self.checkpoint_path, e)
+            return
+        for record in records:
+            self._apply(record)
+        self._offset = self._checkpoint_offset = header["offset"]
+
+def _to_json(value):
+    return value.model_dump(mode="json") if isinstance(value, BaseModel) else value
@@ -0,0 +1,231 @@
+from models.database_models import Event, IncidentType
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import asyncio
+import fcntl
+import logging
+import os
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Ile zapisów z kolejki trafia do jednej transakcji
+WRITE_BATCH_SIZE = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    upvotes INTEGER NOT NULL DEFAULT 0,
+    downvotes INTEGER NOT NULL DEFAULT 0,
+    is_resolved INTEGER NOT NULL DEFAULT 0,
+    reported_by INTEGER NOT NULL,
+    edge_affected INTEGER,
+    time TEXT,
+    event_type TEXT,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_events_edge_type ON events (edge_affected, type, is_resolved);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_revision ON events (revision);
+"""
+
+# Każdy zapis dostaje kolejny numer rewizji - pozwala workerom dociągać tylko zmiany
+NEXT_REVISION = "(SELECT COALESCE(MAX(revision), 0) + 1 FROM events)"
+
+COLUMNS = ("id", "type", "title", "description", "timestamp", "lat", "lng", "upvotes", "downvotes",
+           "is_resolved", "reported_by", "edge_affected", "time", "event_type")
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[object]]
+
+
+def _event_to_row(event: Event) -> Tuple:
+    return (event.id, event.type.value, event.title, event.description, event.timestamp.isoformat(),
+            event.location.lat, event.location.lng, event.upvotes, event.downvotes, int(event.isResolved),
+            event.reportedBy, event.edge_affected, event.time.isoformat() if event.time else None, event.event_type)
+
+
+def _row_to_event(row: Sequence) -> Event:
+    (event_id, event_type, title, description, timestamp, lat, lng, upvotes, downvotes,
+     is_resolved, reported_by, edge_affected, event_time, legacy_type) = row
+    return Event.model_validate({
+        "id": event_id, "type": event_type, "title": title, "description": description,
+        "timestamp": timestamp, "location": {"lat": lat, "lng": lng}, "upvotes": upvotes,
+        "downvotes": downvotes, "isResolved": bool(is_resolved), "reportedBy": reported_by,
+        "edge_affected": edge_affected, "time": event_time, "event_type": legacy_type,
+    })
+
+
+@contextmanager
+def _setup_lock(path: str):
+    """Wyłączna blokada (flock) na zakładanie bazy; dla bazy w pamięci lub bez dostępu - bez blokady"""
+    if path == ":memory:":
+        yield
+        return
+    try:
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError as e:
+        logger.warning("Could not open event store lock for %s: %s", path, e)
+        yield
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class EventStore:
+    """Trwały magazyn zdarzeń w SQLite (WAL) z kolejką zapisów wsadowych.
+
+    Odczyty idą osobnym połączeniem (WAL pozwala czytać w trakcie zapisu),
+    a zapisy trafiają do kolejki, z której jedno zadanie wykonuje je
+    paczkami w pojedynczych transakcjach. Wiele workerów może dzielić plik -
+    SQLite sam serializuje piszących.
+    """
+
+    def __init__(self, path: str, batch_size: int = WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._reader: Optional[aiosqlite.Connection] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self, seed: Iterable[Event] = ()):
+        """Otwiera bazę, zakłada schemat i wstawia zdarzenia startowe (jeśli ich brak)"""
+        self._writer = await self._connect()
+        # Przełączenie na WAL i zmiany schematu nie czekają na busy_timeout - workery
+        # startujące równocześnie na świeżej bazie robią to po kolei
+        with _setup_lock(self.path):
+            await self._writer.execute("PRAGMA journal_mode=WAL")
+            await self._writer.executescript(SCHEMA)
+            await self._migrate()
+            await self._writer.executescript(INDEXES)
+            await self._writer.executemany(
+                f"INSERT OR IGNORE INTO events ({', '.join(COLUMNS)}, revision) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))}, {NEXT_REVISION})",
+                [_event_to_row(event) for event in seed])
+        self._reader = await self._connect()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._write_loop())
+
+    async def _migrate(self):
+        """Dodaje kolumnę revision do baz założonych przed jej wprowadzeniem"""
+        async with self._writer.execute("PRAGMA table_info(events)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "revision" not in columns:
+            await self._writer.execute("ALTER TABLE events ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+            await self._writer.execute("UPDATE events SET revision = id")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # isolation_level=None: transakcje prowadzimy jawnie (BEGIN IMMEDIATE w pętli zapisu)
+        connection = await aiosqlite.connect(self.path, isolation_level=None)
+        await connection.execute("PRAGMA busy_timeout=5000")
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    async def close(self):
+        """Kończy zapisy z kolejki i zamyka połączenia"""
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            self._task = None
+        for connection in (self._reader, self._writer):
+            if connection is not None:
+                await connection.close()
+        self._reader = self._writer = None
+
+    async def _submit(self, op: WriteOp):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, future))
+        return await future
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                results = await self._write_batch(batch)
+            except Exception as e:
+                logger.exception("Event store write batch failed")
+                results = [(None, e)] * len(batch)
+            for (_, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write_batch(self, batch) -> List[Tuple[object, Optional[Exception]]]:
+        """Wykonuje paczkę zapisów w jednej transakcji; błąd jednego zapisu cofa tylko jego"""
+        results = []
+        await self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            for op, _ in batch:
+                await self._writer.execute("SAVEPOINT write_op")
+                try:
+                    results.append((await op(self._writer), None))
+                    await self._writer.execute("RELEASE write_op")
+                except Exception as e:
+                    await self._writer.execute("ROLLBACK TO write_op")
+                    await self._writer.execute("RELEASE write_op")
+                    results.append((None, e))
+            await self._writer.execute("COMMIT")
+        except BaseException:
+            await self._writer.execute("ROLLBACK")
+            raise
+        return results
+
+    async def add(self, event: Event) -> Event:
+        """Zapisuje nowe zdarzenie; ID nadaje baza (AUTOINCREMENT)"""
+        async def op(db: aiosqlite.Connection) -> Event:
+            row = _event_to_row(event)[1:]
+            cursor = await db.execute(
+                f"INSERT INTO events ({', '.join(COLUMNS[1:])}, revision) "
+                f"VALUES ({', '.join('?' * len(row))}, {NEXT_REVISION})", row)
+            return event.model_copy(update={"id": cursor.lastrowid})
+        return await self._submit(op)
+
+    async def _update(self, event_id: int, assignment: str) -> Optional[Event]:
+        async def op(db: aiosqlite.Connection) -> Optional[Event]:
+            await db.execute(f"UPDATE events SET {assignment}, revision = {NEXT_REVISION} WHERE id = ?", (event_id,))
+            return await self._fetch_one(db, event_id)
+        return await self._submit(op)
+
+    async def vote(self, event_id: int, upvote: bool) -> Optional[Event]:
+        """Dodaje głos za/przeciw; zwraca zaktualizowane zdarzenie lub None"""
+        return await self._update(event_id, "upvotes = upvotes + 1" if upvote else "downvotes = downvotes + 1")
+
+    async def resolve(self, event_id: int) -> Optional[Event]:
+        """Oznacza zdarzenie jako rozwiązane; zwraca je lub None"""
+        return await self._update(event_id, "is_resolved = 1")
+
+    @staticmethod
+    async def _fetch_one(db: aiosqlite.Connection, event_id: int) -> Optional[Event]:
+        async with db.execute(f"SELECT {', '.join(COLUMNS)} FROM events WHERE id = ?", (event_id,)) as cursor:
+            row = await cursor.fetchone()
+        return _row_to_event(row) if row else None
+
+    async def get(self, event_id: int) -> Optional[Event]:
+        """Zwraca zdarzenie po ID"""
+        return await self._fetch_one(self._reader, event_id)
+
+    async def changes_since(self, revision: int) -> List[Tuple[int, Event]]:
+        """Zdarzenia zmienione po danej rewizji jako (rewizja, zdarzenie), rosnąco"""
+        async with self._reader.execute(
+                f"SELECT {', '.join(COLUMNS)}, revision FROM events WHERE revision > ? ORDER BY revision",
+                (revision,)) as cursor:
+            return [(row[-1], _row_to_event(row[:-1])) for row in await cursor.fetchall()]
@@ -0,0 +1,250 @@
+from models.database_models import Stop, Edge, Line, Schedule, ServiceCalendar, Train
+from db.dicts import stops, edges, lines, schedules, calendars, trains
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import date, time
+import csv
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Identyfikatory nienumeryczne z GTFS dostają ID od tej wartości w górę
+GENERATED_ID_BASE = 1_000_000_000
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+class GtfsIdMap:
+    """Mapuje identyfikatory GTFS (tekstowe) na ID całkowite używane w modelach"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._next = GENERATED_ID_BASE
+
+    def get(self, raw: str) -> Optional[int]:
+        return self._ids.get(raw)
+
+    def assign(self, raw: str) -> int:
+        if raw not in self._ids:
+            if raw.isdigit():
+                self._ids[raw] = int(raw)
+            else:
+                self._ids[raw] = self._next
+                self._next += 1
+        return self._ids[raw]
+
+
+def _read_rows(feed_path: str, name: str, required: bool = True) -> Iterator[Dict[str, str]]:
+    """Czyta plik GTFS wiersz po wierszu (bez wczytywania całości do pamięci)"""
+    path = os.path.join(feed_path, name)
+    if not os.path.exists(path):
+        if required:
+            raise FileNotFoundError(f"GTFS feed is missing {name}: {path}")
+        return
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            yield {key.strip(): (value or "").strip() for key, value in row.items() if key}
+
+
+def _parse_gtfs_time(value: str) -> Tuple[time, int]:
+    """Parsuje czas GTFS HH:MM:SS na (godzina w dobie, liczba dób po dniu kursowania) - godziny mogą przekraczać 24"""
+    hours, minutes, seconds = (int(part) for part in value.split(":"))
+    return time(hours % 24, minutes, seconds), hours // 24
+
+
+def _parse_gtfs_date(value: str) -> date:
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def _load_stops(feed_path: str, stop_ids: GtfsIdMap) -> Dict[int, Stop]:
+    result = {}
+    for row in _read_rows(feed_path, "stops.txt"):
+        # Pomijamy stacje nadrzędne, wejścia itp. - tylko miejsca zatrzymania
+        if row.get("location_type", "") not in ("", "0"):
+            continue
+        stop_id = stop_ids.assign(row["stop_id"])
+        result[stop_id] = Stop(
+            id=stop_id,
+            code=row.get("stop_code") or row["stop_id"],
+            name=row.get("stop_name", ""),
+            description=row.get("stop_desc") or None,
+            lat=float(row["stop_lat"]),
+            lon=float(row["stop_lon"]),
+        )
+    return result
+
+
+def _load_routes(feed_path: str, route_ids: GtfsIdMap) -> Dict[int, Line]:
+    result = {}
+    for row in _read_rows(feed_path, "routes.txt"):
+        line_id = route_ids.assign(row["route_id"])
+        number = row.get("route_short_name") or None
+        result[line_id] = Line(
+            id=line_id,
+            name=row.get("route_long_name") or number or row["route_id"],
+            number=number,
+            edges=[],
+            time_table=[],
+        )
+    return result
+
+
+def _load_trips(feed_path: str, route_ids: GtfsIdMap) -> Dict[str, Tuple[int, str]]:
+    """trip_id -> (line_id, service_id)"""
+    result = {}
+    for row in _read_rows(feed_path, "trips.txt"):
+        line_id = route_ids.get(row["route_id"])
+        if line_id is not None:
+            result[row["trip_id"]] = (line_id, row.get("service_id", ""))
+    return result
+
+
+def _load_calendars(feed_path: str) -> Dict[str, ServiceCalendar]:
+    result = {}
+    for row in _read_rows(feed_path, "calendar.txt", required=False):
+        result[row["service_id"]] = ServiceCalendar(
+            service_id=row["service_id"],
+            start_date=_parse_gtfs_date(row["start_date"]),
+            end_date=_parse_gtfs_date(row["end_date"]),
+            **{day: row.get(day) == "1" for day in WEEKDAYS},
+        )
+
+    # Wyjątki: dodatkowe i odwołane dni; usługa może istnieć tylko w calendar_dates.txt
+    for row in _read_rows(feed_path, "calendar_dates.txt", required=False):
+        day = _parse_gtfs_date(row["date"])
+        calendar = result.get(row["service_id"])
+        if calendar is None:
+            calendar = result[row["service_id"]] = ServiceCalendar(
+                service_id=row["service_id"], start_date=day, end_date=day, **dict.fromkeys(WEEKDAYS, False))
+        if row.get("exception_type") == "1":
+            calendar.added_dates.append(day)
+        elif row.get("exception_type") == "2":
+            calendar.removed_dates.append(day)
+    return result
+
+
+def _iter_trip_stop_times(feed_path: str) -> Iterator[Tuple[str, List[Tuple[int, str, str]]]]:
+    """Strumieniowo grupuje stop_times.txt po trip_id.
+
+    W pamięci trzymany jest tylko bieżący kurs; plik musi być pogrupowany
+    po trip_id (tak jak w praktycznie każdym feedzie GTFS).
+    """
+    current_trip: Optional[str] = None
+    buffer: List[Tuple[int, str, str]] = []
+    finished = set()
+
+    for row in _read_rows(feed_path, "stop_times.txt"):
+        trip_id = row["trip_id"]
+        if trip_id != current_trip:
+            if current_trip is not None:
+                yield current_trip, buffer
+                finished.add(current_trip)
+            if trip_id in finished:
+                raise ValueError(f"stop_times.txt is not grouped by trip_id (trip {trip_id} appears twice)")
+            current_trip = trip_id
+            buffer = []
+        departure = row.get("departure_time") or row.get("arrival_time")
+        if departure:
+            buffer.append((int(row["stop_sequence"]), row["stop_id"], departure))
+
+    if current_trip is not None:
+        yield current_trip, buffer
+
+
+def reset_demo_trains():
+    """Pociągi demonstracyjne: po jednym na początku każdej linii"""
+    trains.clear()
+    for i, line in enumerate(line for line in lines.values() if line.edges):
+        train_id = 101 + i
+        trains[train_id] = Train(id=train_id, line_id=line.id, current_edge=line.edges[0].id)
+
+
+def load_gtfs_feed(feed_path: str) -> Dict[str, int]:
+    """Wczytuje feed GTFS (katalog z plikami .txt) do tabel stops/edges/lines/schedules.
+
+    Tabele w db.dicts wypełniane są w miejscu, więc moduły, które je
+    zaimportowały, widzą nową sieć. Po wczytaniu należy przebudować indeksy
+    (rebuild_network_indexes).
+    """
+    stop_ids = GtfsIdMap()
+    route_ids = GtfsIdMap()
+
+    new_stops = _load_stops(feed_path, stop_ids)
+    new_lines = _load_routes(feed_path, route_ids)
+    trip_info = _load_trips(feed_path, route_ids)
+    new_calendars = _load_calendars(feed_path)
+
+    new_edges: Dict[int, Edge] = {}
+    edge_by_pair: Dict[Tuple[int, int], int] = {}
+    new_schedules: Dict[int, Schedule] = {}
+    line_trip_edges: Dict[int, List[List[int]]] = {}
+
+    for trip_id, rows in _iter_trip_stop_times(feed_path):
+        if trip_id not in trip_info or len(rows) < 2:
+            continue
+        line_id, service_id = trip_info[trip_id]
+        rows.sort()
+
+        stop_to_time = {}
+        day_offset = 0
+        for _, raw_stop_id, departure in rows:
+            stop_id = stop_ids.get(raw_stop_id)
+            if stop_id is not None and stop_id in new_stops and stop_id not in stop_to_time:
+                stop_to_time[stop_id], days = _parse_gtfs_time(departure)
+                if len(stop_to_time) == 1:
+                    day_offset = days
+        if len(stop_to_time) < 2:
+            continue
+
+        trip_edges = []
+        sequence = list(stop_to_time)
+        for pair in zip(sequence, sequence[1:]):
+            if pair not in edge_by_pair:
+                edge_id = len(new_edges) + 1
+                edge_by_pair[pair] = edge_id
+                new_edges[edge_id] = Edge(id=edge_id, from_stop=pair[0], to_stop=pair[1])
+            trip_edges.append(edge_by_pair[pair])
+
+        schedule = Schedule(id=len(new_schedules) + 1, stop_to_time=stop_to_time, service_id=service_id or None,
+                            day_offset=day_offset)
+        new_schedules[schedule.id] = schedule
+        new_lines[line_id].time_table.append(schedule)
+        line_trip_edges.setdefault(line_id, []).append(trip_edges)
+
+    # Krawędzie linii: najpierw najdłuższy wariant, potem brakujące odcinki
+    # (kierunek powrotny pomijany, jak w ręcznie opisanych liniach)
+    for line_id, trip_edges in line_trip_edges.items():
+        line = new_lines[line_id]
+        seen_pairs = set()
+        for edge_list in sorted(trip_edges, key=len, reverse=True):
+            for edge_id in edge_list:
+                edge = new_edges[edge_id]
+                if (edge.from_stop, edge.to_stop) in seen_pairs or (edge.to_stop, edge.from_stop) in seen_pairs:
+                    continue
+                seen_pairs.add((edge.from_stop, edge.to_stop))
+                line.edges.append(edge)
+
+    new_lines = {line_id: line for line_id, line in new_lines.items() if line.time_table}
+
+    stops.clear()
+    stops.update(new_stops)
+    edges.clear()
+    edges.update(new_edges)
+    schedules.clear()
+    schedules.update(new_schedules)
+    lines.clear()
+    lines.update(new_lines)
+    calendars.clear()
+    calendars.update(new_calendars)
+
+    reset_demo_trains()
+
+    counts = {
+        "stops": len(stops),
+        "edges": len(edges),
+        "lines": len(lines),
+        "schedules": len(schedules),
+        "calendars": len(calendars),
+    }
+    logger.info("Loaded GTFS feed %s: %s", feed_path, counts)
+    return counts
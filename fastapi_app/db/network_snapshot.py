@@ -0,0 +1,275 @@
+from models.database_models import Stop, Edge, Line, Schedule, ServiceCalendar
+from db.dicts import stops, edges, lines, schedules, calendars
+from db.gtfs_import import load_gtfs_feed, reset_demo_trains
+from repositiories.timetable_store import TimetableStore, TripPattern, get_timetable_store, seconds_to_time
+from repositiories.network import network_index_arrays, rebuild_network_indexes
+from db.array_file import write_array_file, map_array_file
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"JRNETSNP"
+# Zmiana formatu pliku wymaga podbicia wersji - stare migawki zostaną odrzucone
+SNAPSHOT_VERSION = 4
+_loaded: Optional[Tuple[str, str]] = None  # (ścieżka, skrót feedu) migawki bieżącej sieci
+
+FEED_FILES = ("stops.txt", "routes.txt", "trips.txt", "stop_times.txt", "calendar.txt", "calendar_dates.txt")
+
+
+def feed_hash(feed_path: str) -> str:
+    """Skrót SHA-256 plików feedu GTFS (i wersji formatu migawki)"""
+    digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}".encode())
+    for name in FEED_FILES:
+        path = os.path.join(feed_path, name)
+        if not os.path.exists(path):
+            continue
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pack_strings(values: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pakuje napisy do jednego bufora UTF-8 z tablicą przesunięć (None -> pusty napis)"""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return [raw[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+
+def _csr(groups: List[List[int]], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """Listy list -> (płaska tablica, przesunięcia)"""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=offsets[1:])
+    flat = np.fromiter((value for group in groups for value in group), dtype=dtype, count=int(offsets[-1]))
+    return flat, offsets
+
+
+def _collect_arrays(store: TimetableStore) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, np.ndarray] = {}
+
+    stop_list = list(stops.values())
+    arrays["stop_id"] = np.array([stop.id for stop in stop_list], dtype=np.int64)
+    arrays["stop_lat"] = np.array([stop.lat for stop in stop_list], dtype=np.float64)
+    arrays["stop_lon"] = np.array([stop.lon for stop in stop_list], dtype=np.float64)
+    for field in ("code", "name", "description"):
+        arrays[f"stop_{field}"], arrays[f"stop_{field}_offsets"] = _pack_strings([getattr(stop, field) for stop in stop_list])
+
+    edge_list = list(edges.values())
+    arrays["edge_id"] = np.array([edge.id for edge in edge_list], dtype=np.int64)
+    arrays["edge_from"] = np.array([edge.from_stop for edge in edge_list], dtype=np.int64)
+    arrays["edge_to"] = np.array([edge.to_stop for edge in edge_list], dtype=np.int64)
+
+    line_list = list(lines.values())
+    arrays["line_id"] = np.array([line.id for line in line_list], dtype=np.int64)
+    arrays["line_name"], arrays["line_name_offsets"] = _pack_strings([line.name for line in line_list])
+    arrays["line_number"], arrays["line_number_offsets"] = _pack_strings([line.number for line in line_list])
+    arrays["line_edges"], arrays["line_edge_offsets"] = _csr(
+        [[edge.id for edge in line.edges or []] for line in line_list], np.int64)
+    arrays["line_schedules"], arrays["line_schedule_offsets"] = _csr(
+        [[schedule.id for schedule in line.time_table or []] for line in line_list], np.int64)
+
+    patterns = store.patterns
+    arrays["pattern_line"] = np.array([pattern.line.id for pattern in patterns], dtype=np.int64)
+    arrays["pattern_stops"], arrays["pattern_stop_offsets"] = _csr(
+        [pattern.stops.tolist() for pattern in patterns], np.int32)
+    arrays["pattern_trip_ids"], arrays["pattern_trip_offsets"] = _csr(
+        [pattern.trip_ids.tolist() for pattern in patterns], np.int32)
+    arrays["pattern_times"] = (np.concatenate([pattern.times.ravel() for pattern in patterns])
+                               if patterns else np.zeros(0, dtype=np.int32)).astype(np.int32)
+    arrays["trip_service"], arrays["trip_service_offsets"] = _pack_strings(
+        [schedule.service_id for pattern in patterns for schedule in pattern.schedules])
+    return arrays
+
+
+def write_snapshot(path: str, digest: str, store: Optional[TimetableStore] = None):
+    """Zapisuje skompilowaną sieć do pliku binarnego (atomowo, przez plik tymczasowy).
+
+    Poza rozkładem trafiają tam indeksy bieżącej sieci (network_index_arrays),
+    więc wołający buduje je przed zapisem (rebuild_network_indexes).
+    """
+    write_array_file(path, SNAPSHOT_MAGIC, {
+        "version": SNAPSHOT_VERSION,
+        "feed_hash": digest,
+        "calendars": [calendar.model_dump(mode="json") for calendar in calendars.values()],
+    }, {**_collect_arrays(store or get_timetable_store()), **network_index_arrays()})
+
+
+def open_snapshot(path: str, digest: Optional[str] = None) -> Optional[Tuple[dict, Dict[str, np.ndarray]]]:
+    """Mapuje migawkę (mmap) i zwraca (nagłówek, tablice jako widoki bez kopiowania).
+
+    Zwraca None, gdy plik nie istnieje, ma inną wersję lub nie pasuje do feedu.
+    """
+    opened = map_array_file(path, SNAPSHOT_MAGIC)
+    if opened is None:
+        return None
+    header = opened[0]
+    if header.get("version") != SNAPSHOT_VERSION or (digest is not None and header.get("feed_hash") != digest):
+        return None
+    return opened
+
+
+def load_snapshot(path: str, digest: Optional[str] = None
+                  ) -> Optional[Tuple[TimetableStore, Dict[str, np.ndarray]]]:
+    """Wczytuje migawkę do tabel db.dicts i zwraca (rozkład kolumnowy, tablice migawki).
+
+    Modele tworzone są przez model_construct (bez walidacji), a tablice
+    rozkładu pozostają widokami na zmapowany plik. Słowniki Schedule.stop_to_time
+    odtwarzane są z macierzy czasów. Tablice przekazuje się do
+    rebuild_network_indexes, która odtwarza z nich siatkę, dojścia, sąsiedztwo
+    i ograniczenia ALT; pozostałe indeksy budowane są w każdym workerze.
+    """
+    opened = open_snapshot(path, digest)
+    if opened is None:
+        return None
+    header, a = opened
+
+    new_stops = {
+        stop_id: Stop.model_construct(id=stop_id, code=code, name=name, description=description or None,
+                                      lat=lat, lon=lon)
+        for stop_id, code, name, description, lat, lon in zip(
+            a["stop_id"].tolist(),
+            _unpack_strings(a["stop_code"], a["stop_code_offsets"]),
+            _unpack_strings(a["stop_name"], a["stop_name_offsets"]),
+            _unpack_strings(a["stop_description"], a["stop_description_offsets"]),
+            a["stop_lat"].tolist(), a["stop_lon"].tolist())
+    }
+    new_edges = {
+        edge_id: Edge.model_construct(id=edge_id, from_stop=from_stop, to_stop=to_stop)
+        for edge_id, from_stop, to_stop in zip(a["edge_id"].tolist(), a["edge_from"].tolist(), a["edge_to"].tolist())
+    }
+
+    # Harmonogramy odtwarzane z macierzy czasów wariantów
+    time_cache: Dict[int, object] = {}
+    services = _unpack_strings(a["trip_service"], a["trip_service_offsets"])
+    stop_offsets = a["pattern_stop_offsets"].tolist()
+    trip_offsets = a["pattern_trip_offsets"].tolist()
+    pattern_blocks = []
+    new_schedules: Dict[int, Schedule] = {}
+    time_offset = 0
+    for p in range(len(a["pattern_line"])):
+        pattern_stops = a["pattern_stops"][stop_offsets[p]:stop_offsets[p + 1]]
+        trip_ids = a["pattern_trip_ids"][trip_offsets[p]:trip_offsets[p + 1]]
+        n_trips, n_stops = len(trip_ids), len(pattern_stops)
+        times = a["pattern_times"][time_offset:time_offset + n_trips * n_stops].reshape(n_trips, n_stops)
+        time_offset += n_trips * n_stops
+
+        stop_list = pattern_stops.tolist()
+        pattern_schedules = []
+        for row, (trip_id, trip_times) in enumerate(zip(trip_ids.tolist(), times.tolist())):
+            stop_to_time = {}
+            for stop_id, seconds in zip(stop_list, trip_times):
+                t = time_cache.get(seconds)
+                if t is None:
+                    t = time_cache[seconds] = seconds_to_time(seconds)
+                stop_to_time[stop_id] = t
+            schedule = Schedule.model_construct(id=trip_id, stop_to_time=stop_to_time,
+                                                service_id=services[trip_offsets[p] + row] or None,
+                                                day_offset=trip_times[0] // 86400)
+            new_schedules[trip_id] = schedule
+            pattern_schedules.append(schedule)
+        pattern_blocks.append((pattern_stops, times, trip_ids, pattern_schedules))
+
+    edge_offsets = a["line_edge_offsets"].tolist()
+    schedule_offsets = a["line_schedule_offsets"].tolist()
+    line_edges = a["line_edges"].tolist()
+    line_schedules = a["line_schedules"].tolist()
+    new_lines = {}
+    for i, (line_id, name, number) in enumerate(zip(
+            a["line_id"].tolist(),
+            _unpack_strings(a["line_name"], a["line_name_offsets"]),
+            _unpack_strings(a["line_number"], a["line_number_offsets"]))):
+        new_lines[line_id] = Line.model_construct(
+            id=line_id, name=name, number=number or None,
+            edges=[new_edges[edge_id] for edge_id in line_edges[edge_offsets[i]:edge_offsets[i + 1]]],
+            time_table=[new_schedules[schedule_id]
+                        for schedule_id in line_schedules[schedule_offsets[i]:schedule_offsets[i + 1]]
+                        if schedule_id in new_schedules],
+            stops=None,
+        )
+
+    store = TimetableStore()
+    for p, (line_id, (pattern_stops, times, trip_ids, pattern_schedules)) in enumerate(
+            zip(a["pattern_line"].tolist(), pattern_blocks)):
+        store.add_pattern(TripPattern.from_arrays(p, new_lines[line_id], pattern_stops, times, trip_ids,
+                                                  pattern_schedules))
+
+    stops.clear()
+    stops.update(new_stops)
+    edges.clear()
+    edges.update(new_edges)
+    schedules.clear()
+    schedules.update(new_schedules)
+    lines.clear()
+    lines.update(new_lines)
+    calendars.clear()
+    calendars.update({item["service_id"]: ServiceCalendar.model_validate(item) for item in header["calendars"]})
+    reset_demo_trains()
+    return store, a
+
+
+def loaded_snapshot() -> Optional[Tuple[str, str]]:
+    """(ścieżka, skrót feedu) migawki, z której pochodzi bieżąca sieć - np. dla procesów puli"""
+    return _loaded
+
+
+def load_network(feed_path: str, snapshot_path: Optional[str] = None):
+    """Ładuje sieć z migawki, a gdy jej brak lub feed się zmienił - z GTFS, zapisując nową migawkę"""
+    global _loaded
+    _loaded = None
+    snapshot_path = snapshot_path or os.environ.get("NETWORK_SNAPSHOT_PATH") or os.path.join(feed_path, "network.snapshot")
+    digest = feed_hash(feed_path)
+
+    loaded = load_snapshot(snapshot_path, digest)
+    if loaded is not None:
+        logger.info("Loaded network snapshot %s", snapshot_path)
+        rebuild_network_indexes(*loaded)
+        _loaded = (snapshot_path, digest)
+        return
+
+    # Workery startujące równolegle: import robi tylko jeden, reszta czeka i mapuje jego migawkę
+    with _build_lock(snapshot_path):
+        loaded = load_snapshot(snapshot_path, digest)
+        if loaded is not None:
+            logger.info("Loaded network snapshot %s built by another worker", snapshot_path)
+            rebuild_network_indexes(*loaded)
+            _loaded = (snapshot_path, digest)
+            return
+
+        logger.info("Network snapshot %s missing or stale, importing GTFS feed %s", snapshot_path, feed_path)
+        load_gtfs_feed(feed_path)
+        rebuild_network_indexes()
+        try:
+            write_snapshot(snapshot_path, digest)
+            _loaded = (snapshot_path, digest)
+        except OSError as e:
+            logger.warning("Could not write network snapshot %s: %s", snapshot_path, e)
+
+
+@contextmanager
+def _build_lock(snapshot_path: str):
+    """Wyłączna blokada (flock) na budowę migawki; bez możliwości jej utworzenia - bez blokady"""
+    try:
+        fd = os.open(f"{snapshot_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError as e:
+        logger.warning("Could not open snapshot lock for %s: %s", snapshot_path, e)
+        yield
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
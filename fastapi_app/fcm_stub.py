@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the FCM legacy HTTP endpoint, for testing push notifications.
+
+Run:   uvicorn fcm_stub:app --port 8090
+Then:  NOTIFICATION_BACKEND=fcm FCM_SERVER_KEY=local FCM_ENDPOINT=http://localhost:8090/fcm/send uvicorn main:app
+Sent messages can be listed with GET http://localhost:8090/messages
+"""
+
+from fastapi import FastAPI, Header, HTTPException, Request
+
+app = FastAPI()
+
+MESSAGES = []
+
+
+@app.post("/fcm/send")
+async def send(request: Request, authorization: str = Header(None)):
+    """Accept a message the way FCM does (Authorization: key=<server key>)"""
+    if not authorization or not authorization.startswith("key="):
+        raise HTTPException(status_code=401, detail="Missing server key")
+    message = await request.json()
+    MESSAGES.append(message)
+    print(f"Push to {message.get('to')}: {message.get('notification', {}).get('body')}")
+    return {"multicast_id": len(MESSAGES), "success": 1, "failure": 0, "results": [{"message_id": str(len(MESSAGES))}]}
+
+
+@app.get("/messages")
+async def messages():
+    """Messages received so far"""
+    return MESSAGES
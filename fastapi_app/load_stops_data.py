@@ -0,0 +1,13 @@
+"""Wczytuje feed GTFS i wypisuje linie, np.: python load_stops_data.py ../research/gtfs"""
+import sys
+from db.dicts import lines, my_print
+from db.gtfs_import import load_gtfs_feed
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python load_stops_data.py <gtfs_feed_dir>")
+        sys.exit(1)
+
+    counts = load_gtfs_feed(sys.argv[1])
+    my_print(lines)
+    print(counts)
@@ -1,4 +1,6 @@
 from fastapi import FastAPI, Request
+import asyncio
+import os
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -13,20 +15,45 @@ app.add_middleware(
 )
 
 from routers.info_route import router as info_router
-from routers.trains_route import router as trains_router
+from routers.trains_route import router as trains_router, vehicle_simulation_loop
+from routers.live_route import router as live_router, live_sync_loop
+from repositiories.network import rebuild_network_indexes
+from db.network_snapshot import load_network
+from repositiories.event_repository import open_event_store, close_event_store, sync_shared_state
+from repositiories.notification_service import start_notifications, stop_notifications
+from repositiories.batch_planner import shutdown_batch_pool
+from repositiories.vehicle_simulation import SIMULATION_TICK_SECONDS
 
 app.include_router(info_router)
 app.include_router(trains_router)
+app.include_router(live_router)
 
 
 @app.on_event("startup")
 async def startup_event():
-    pass
+    """Load the network (GTFS feed or its snapshot if GTFS_FEED_PATH is set) and build routing indexes"""
+    feed_path = os.environ.get("GTFS_FEED_PATH")
+    if feed_path:
+        load_network(feed_path)
+    else:
+        rebuild_network_indexes()
+    await open_event_store()
+    # Odtworzenie zmian użytkowników i powiadomień zapisanych przez inne workery (EVENT_JOURNAL_PATH)
+    sync_shared_state()
+    start_notifications()
+    app.state.live_sync = asyncio.create_task(live_sync_loop())
+    # Symulacja pojazdów w tle tylko przy SIMULATION_TICK_SECONDS > 0 (inaczej tick przy odczycie pozycji)
+    app.state.vehicle_simulation = asyncio.create_task(vehicle_simulation_loop()) if SIMULATION_TICK_SECONDS else None
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close database connection on shutdown"""
-    pass
+    app.state.live_sync.cancel()
+    if app.state.vehicle_simulation is not None:
+        app.state.vehicle_simulation.cancel()
+    await stop_notifications()
+    shutdown_batch_pool()
+    await close_event_store()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime, time
+from datetime import date, datetime, time
 from enum import Enum
 
 class IncidentType(str, Enum):
@@ -65,6 +65,12 @@ class EventVote(BaseModel):
     userId: int
     voteType: str  # "upvote" or "downvote"
 
+class RouteQuery(BaseModel):
+    start: int  # stop ID
+    end: int  # stop ID
+    start_time: time = time(6, 0)
+    service_date: Optional[date] = None  # defaults to today
+
 class Edge(BaseModel):
     id: int
     from_stop: int  # Stop ID
@@ -74,6 +80,22 @@ class Edge(BaseModel):
 class Schedule(BaseModel):
     id: int
     stop_to_time: dict[int, time]
+    service_id: Optional[str] = None
+    day_offset: int = 0  # doby od dnia kursowania do odjazdu z pierwszego przystanku (GTFS: godziny >= 24)
+
+class ServiceCalendar(BaseModel):
+    service_id: str
+    monday: bool
+    tuesday: bool
+    wednesday: bool
+    thursday: bool
+    friday: bool
+    saturday: bool
+    sunday: bool
+    start_date: date
+    end_date: date
+    added_dates: List[date] = []    # calendar_dates.txt, exception_type 1
+    removed_dates: List[date] = []  # calendar_dates.txt, exception_type 2
 
 class LineResponse(BaseModel):
     id: int
@@ -0,0 +1,141 @@
+from models.database_models import Line
+from db.dicts import lines
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+from types import MappingProxyType
+import numpy as np
+
+
+class LineNeighbours(NamedTuple):
+    """Sąsiednie przystanki danego przystanku na jednej linii"""
+    line_id: int
+    neighbours: Tuple[int, ...]   # w kolejności krawędzi linii
+    next_stops: Tuple[int, ...]   # krawędzie wychodzące (from_stop == przystanek)
+    prev_stops: Tuple[int, ...]   # krawędzie wchodzące (to_stop == przystanek)
+
+
+AdjacencyIndex = Mapping[int, Tuple[LineNeighbours, ...]]
+# line_id -> (edge_id -> pozycja krawędzi w line.edges)
+EdgePositions = Mapping[int, Mapping[int, int]]
+
+
+def build_adjacency_index(lines_dict: Dict[int, Line]) -> AdjacencyIndex:
+    """Buduje niezmienny indeks: stop_id -> linie obsługujące przystanek i ich sąsiedzi"""
+    per_stop: Dict[int, Dict[int, Tuple[list, list, list]]] = {}
+
+    for line in lines_dict.values():
+        if not line or not line.edges:
+            continue
+        for edge in line.edges:
+            neighbours, next_stops, _ = per_stop.setdefault(edge.from_stop, {}).setdefault(line.id, ([], [], []))
+            neighbours.append(edge.to_stop)
+            next_stops.append(edge.to_stop)
+
+            neighbours, _, prev_stops = per_stop.setdefault(edge.to_stop, {}).setdefault(line.id, ([], [], []))
+            neighbours.append(edge.from_stop)
+            prev_stops.append(edge.from_stop)
+
+    index = {
+        stop_id: tuple(
+            LineNeighbours(line_id, tuple(neighbours), tuple(next_stops), tuple(prev_stops))
+            for line_id, (neighbours, next_stops, prev_stops) in by_line.items()
+        )
+        for stop_id, by_line in per_stop.items()
+    }
+    return MappingProxyType(index)
+
+
+def adjacency_to_arrays(index: AdjacencyIndex) -> Dict[str, np.ndarray]:
+    """Indeks jako płaskie tablice do zapisania w migawce sieci: wpis (przystanek, linia) i trzy listy CSR"""
+    entries = [(stop_id, entry) for stop_id, by_line in index.items() for entry in by_line]
+    arrays = {
+        "adjacency_stop": np.array([stop_id for stop_id, _ in entries], dtype=np.int64),
+        "adjacency_line": np.array([entry.line_id for _, entry in entries], dtype=np.int64),
+    }
+    for field in ("neighbours", "next_stops", "prev_stops"):
+        groups = [getattr(entry, field) for _, entry in entries]
+        offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+        np.cumsum([len(group) for group in groups], out=offsets[1:])
+        arrays[f"adjacency_{field}"] = np.array([stop_id for group in groups for stop_id in group], dtype=np.int64)
+        arrays[f"adjacency_{field}_offsets"] = offsets
+    return arrays
+
+
+def adjacency_from_arrays(arrays: Dict[str, np.ndarray]) -> Optional[AdjacencyIndex]:
+    """Odtwarza indeks z tablic adjacency_to_arrays; None, gdy migawka ich nie zawiera"""
+    if "adjacency_stop" not in arrays:
+        return None
+    columns: List[List[Tuple[int, ...]]] = []
+    for field in ("neighbours", "next_stops", "prev_stops"):
+        flat = arrays[f"adjacency_{field}"].tolist()
+        offsets = arrays[f"adjacency_{field}_offsets"].tolist()
+        columns.append([tuple(flat[start:end]) for start, end in zip(offsets, offsets[1:])])
+
+    per_stop: Dict[int, List[LineNeighbours]] = {}
+    for stop_id, line_id, neighbours, next_stops, prev_stops in zip(
+            arrays["adjacency_stop"].tolist(), arrays["adjacency_line"].tolist(), *columns):
+        per_stop.setdefault(stop_id, []).append(LineNeighbours(line_id, neighbours, next_stops, prev_stops))
+    return MappingProxyType({stop_id: tuple(entries) for stop_id, entries in per_stop.items()})
+
+
+def build_edge_positions(lines_dict: Dict[int, Line]) -> EdgePositions:
+    """Buduje niezmienny indeks pozycji krawędzi na liniach (następna krawędź w O(1))"""
+    return MappingProxyType({
+        line.id: MappingProxyType({edge.id: i for i, edge in enumerate(line.edges)})
+        for line in lines_dict.values() if line and line.edges
+    })
+
+
+_index: Optional[AdjacencyIndex] = None
+_edge_positions: Optional[EdgePositions] = None
+
+
+def get_adjacency_index() -> AdjacencyIndex:
+    """Zwraca indeks sąsiedztwa, budując go przy pierwszym użyciu"""
+    global _index
+    if _index is None:
+        _index = build_adjacency_index(lines)
+    return _index
+
+
+def rebuild_adjacency_index(arrays: Optional[Dict[str, np.ndarray]] = None) -> AdjacencyIndex:
+    """Buduje indeks sąsiedztwa i pozycji krawędzi od nowa (np. po zmianie linii).
+
+    Z tablicami migawki sieci (adjacency_to_arrays) indeks sąsiedztwa jest tylko odtwarzany.
+    """
+    global _index, _edge_positions
+    _index = adjacency_from_arrays(arrays) if arrays is not None else None
+    if _index is None:
+        _index = build_adjacency_index(lines)
+    _edge_positions = build_edge_positions(lines)
+    return _index
+
+
+def get_edge_positions() -> EdgePositions:
+    """Zwraca indeks pozycji krawędzi na liniach, budując go przy pierwszym użyciu"""
+    global _edge_positions
+    if _edge_positions is None:
+        _edge_positions = build_edge_positions(lines)
+    return _edge_positions
+
+
+def edge_position(line_id: int, edge_id: int) -> Optional[int]:
+    """Pozycja krawędzi w line.edges albo None, gdy linia nią nie jedzie"""
+    return get_edge_positions().get(line_id, {}).get(edge_id)
+
+
+def get_lines_at_stop(stop_id: int) -> Tuple[LineNeighbours, ...]:
+    """Zwraca linie obsługujące przystanek wraz z sąsiadami"""
+    return get_adjacency_index().get(stop_id, ())
+
+
+def get_line_neighbours(line_id: int, stop_id: int) -> Tuple[int, ...]:
+    """Zwraca sąsiednie przystanki na danej linii"""
+    for entry in get_lines_at_stop(stop_id):
+        if entry.line_id == line_id:
+            return entry.neighbours
+    return ()
+
+
+def line_serves_stop(line_id: int, stop_id: int) -> bool:
+    """Sprawdza, czy linia zatrzymuje się na przystanku"""
+    return any(entry.line_id == line_id for entry in get_lines_at_stop(stop_id))
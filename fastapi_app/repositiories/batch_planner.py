@@ -0,0 +1,154 @@
+from repositiories.journey_planner import JourneyLeg, Leg, find_journeys_range, leg_times
+from repositiories.route_cache import get_route_cache
+from repositiories.timetable_store import seconds_to_time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+import multiprocessing
+import os
+
+# Liczba procesów liczących partie tras
+BATCH_WORKERS = int(os.environ.get("ROUTE_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# Ile grup (start, dzień) trafia do jednego zadania puli
+BATCH_CHUNK_SIZE = 4
+# Mniejsze partie liczone są w bieżącym procesie - start puli kosztuje więcej niż zysk
+MIN_PARALLEL_GROUPS = 32
+MAX_BATCH_SIZE = 10000
+
+
+class BatchQuery(NamedTuple):
+    start_id: int
+    end_id: int
+    start_seconds: int
+    service_date: Optional[date] = None
+
+
+# Grupa zapytań z tym samym startem i dniem: (start, dzień, [(indeks zapytania, cel, czas)])
+QueryGroup = Tuple[int, Optional[date], List[Tuple[int, int, int]]]
+
+
+def group_queries(queries: Iterable[BatchQuery]) -> List[QueryGroup]:
+    """Łączy zapytania o ten sam start i dzień - jedno wyszukiwanie zakresowe obsługuje wszystkie ich cele i czasy"""
+    groups: Dict[Tuple[int, Optional[date]], List[Tuple[int, int, int]]] = {}
+    for index, query in enumerate(queries):
+        groups.setdefault((query.start_id, query.service_date), []).append(
+            (index, query.end_id, query.start_seconds))
+    return [(*key, targets) for key, targets in groups.items()]
+
+
+def plan_routes_batch(queries: Iterable[BatchQuery], workers: Optional[int] = None) -> Iterator[Dict[str, object]]:
+    """Wyznacza trasy dla wielu zapytań, zwracając wyniki w kolejności ukończenia.
+
+    Każdy wynik ma pole index - pozycję zapytania na wejściu. Zapytania z jednego
+    startu i dnia liczone są razem wyszukiwaniem zakresowym (find_journeys_range).
+    Duże partie dzielone są na zadania puli procesów, które przy starcie mapują
+    tę samą migawkę sieci co aplikacja (zob. _init_worker). Trasy liczone są
+    według rozkładu, bez kar za utrudnienia.
+    """
+    groups = group_queries(queries)
+    workers = BATCH_WORKERS if workers is None else workers
+    if workers <= 1 or len(groups) < MIN_PARALLEL_GROUPS:
+        for group in groups:
+            yield from _plan_groups([group])
+        return
+
+    pool = _get_pool(workers)
+    pending = {pool.submit(_plan_groups, groups[i:i + BATCH_CHUNK_SIZE])
+               for i in range(0, len(groups), BATCH_CHUNK_SIZE)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    finally:
+        # Klient się rozłączył albo zadanie zawiodło - reszta partii nie jest już potrzebna
+        for future in pending:
+            future.cancel()
+
+
+def _plan_groups(groups: List[QueryGroup]) -> List[Dict[str, object]]:
+    results = []
+    for start_id, service_date, targets in groups:
+        journeys = find_journeys_range(start_id, (end_id for _, end_id, _ in targets),
+                                       (start_seconds for _, _, start_seconds in targets), service_date)
+        for index, end_id, start_seconds in targets:
+            results.append(_result(index, start_id, end_id, start_seconds, service_date,
+                                   journeys[start_seconds][end_id]))
+    return results
+
+
+def _result(index: int, start_id: int, end_id: int, start_seconds: int, service_date: Optional[date],
+            legs: Optional[List[Leg]]) -> Dict[str, object]:
+    result: Dict[str, object] = {"index": index, "start": start_id, "end": end_id,
+                                 "service_date": service_date.isoformat() if service_date else None,
+                                 "start_time": seconds_to_time(start_seconds).isoformat(), "found": legs is not None}
+    if legs is None:
+        return result
+    # Start w celu: pusta podróż bez odjazdu
+    times = leg_times(legs, start_seconds)
+    departure = times[0][0] if legs else start_seconds
+    arrival = times[-1][1] if legs else start_seconds
+    rides = sum(isinstance(leg, JourneyLeg) for leg in legs)
+    result.update({
+        "departure": seconds_to_time(departure).isoformat(),
+        "arrival": seconds_to_time(arrival).isoformat(),
+        "duration_minutes": round((arrival - start_seconds) / 60, 1),
+        "transfers": max(rides - 1, 0),
+        "legs": [{"line_id": leg.line.id, "schedule_id": leg.schedule.id, "stop_ids": leg.stop_ids}
+                 if isinstance(leg, JourneyLeg) else
+                 {"walk": {"from_stop": leg.from_stop, "to_stop": leg.to_stop, "distance_m": leg.distance_m}}
+                 for leg in legs],
+    })
+    return result
+
+
+def _init_worker(feed_path: Optional[str], snapshot: Optional[Tuple[str, str]]):
+    """Wczytuje sieć w procesie puli tak jak przy starcie aplikacji (migawka feedu albo sieć demonstracyjna).
+
+    snapshot to (ścieżka, skrót feedu) migawki procesu głównego: proces puli mapuje
+    ją od razu, bez ponownego liczenia skrótu feedu.
+    """
+    from db.network_snapshot import load_network, load_snapshot
+    from repositiories.network import rebuild_network_indexes
+
+    loaded = load_snapshot(*snapshot) if snapshot is not None else None
+    if loaded is not None:
+        rebuild_network_indexes(*loaded)
+    elif feed_path:
+        load_network(feed_path)
+    else:
+        rebuild_network_indexes()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key: Optional[Tuple[int, int]] = None  # (wersja sieci, liczba procesów), dla których powstała pula
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Pula procesów dla bieżącego rozkładu; po przebudowie sieci powstaje nowa.
+
+    Procesy startują przez spawn, nie fork - serwer ma już wtedy wątki (aiosqlite,
+    pula wątków anyio), a fork procesu z wątkami może zakleszczyć potomka.
+    """
+    global _pool, _pool_key
+    key = (get_route_cache().version, workers)
+    if _pool is not None and _pool_key != key:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    if _pool is None:
+        from db.network_snapshot import loaded_snapshot
+
+        feed_path = os.environ.get("GTFS_FEED_PATH")
+        snapshot = loaded_snapshot() if feed_path else None
+        _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_init_worker, initargs=(feed_path, snapshot))
+        _pool_key = key
+    return _pool
+
+
+def shutdown_batch_pool():
+    """Zamyka pulę procesów (przy wyłączaniu aplikacji)"""
+    global _pool, _pool_key
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = _pool_key = None
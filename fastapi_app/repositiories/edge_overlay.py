@@ -0,0 +1,95 @@
+from models.database_models import Event, IncidentType
+from repositiories.journey_planner import BLOCKED, CompiledTimetable, get_compiled_timetable
+from typing import Dict, Iterable, List, Optional
+
+# Opóźnienie (minuty) wnoszone przez nierozwiązane zdarzenie danego typu; None - blokuje krawędź
+INCIDENT_DELAY_MINUTES: Dict[IncidentType, Optional[int]] = {
+    IncidentType.CANCELLATION: None,
+    IncidentType.ACCIDENT: 15,
+    IncidentType.DELAY: 10,
+    IncidentType.TECHNICAL_ISSUE: 10,
+    IncidentType.ROAD_WORKS: 5,
+    IncidentType.WEATHER: 5,
+    IncidentType.CROWDING: 2,
+    IncidentType.OTHER: 2,
+}
+# Zdarzenia z takim lub gorszym bilansem głosów (za - przeciw) są pomijane
+DISPUTED_SCORE = -3
+
+
+def event_weight(event: Event) -> float:
+    """Waga zdarzenia z bilansu głosów: 0 dla spornych, 0.5-2.0 dla pozostałych"""
+    score = event.upvotes - event.downvotes
+    if score <= DISPUTED_SCORE:
+        return 0.0
+    return 1.0 + 0.25 * min(max(score, -2), 4)
+
+
+def edge_penalty(events: Iterable[Event]) -> int:
+    """Kara krawędzi w sekundach (lub BLOCKED) z jej nierozwiązanych zdarzeń; liczy się najpoważniejsze"""
+    penalty = 0
+    for event in events:
+        weight = event_weight(event)
+        if weight == 0.0:
+            continue
+        minutes = INCIDENT_DELAY_MINUTES.get(event.type, 0)
+        if minutes is None:
+            return BLOCKED
+        penalty = max(penalty, round(minutes * 60 * weight))
+    return penalty
+
+
+class EdgeOverlay:
+    """Kary krawędzi ze zdarzeń jako tablica równoległa do slotów krawędzi rozkładu.
+
+    Planer w pętli połączeń czyta penalty[timetable.edge[c]] - jedno indeksowanie
+    listy zamiast przeglądania zdarzeń. Slot 0 (połączenie bez krawędzi) ma zawsze 0.
+    by_edge trzyma niezerowe kary po ID krawędzi, więc po przebudowie sieci
+    nakładkę można odtworzyć dla nowego rozkładu.
+    """
+
+    def __init__(self, timetable: CompiledTimetable, by_edge: Optional[Dict[int, int]] = None):
+        self.edge_slots = timetable.edge_slots
+        self.by_edge: Dict[int, int] = {}
+        self.penalty: List[int] = [0] * (len(timetable.edge_slots) + 1)
+        for edge_id, penalty in (by_edge or {}).items():
+            self.set_edge(edge_id, penalty)
+
+    @property
+    def active(self) -> bool:
+        """Czy jakakolwiek krawędź ma karę (bez kar planer używa zwykłej pętli)"""
+        return bool(self.by_edge)
+
+    def get(self, edge_id: int) -> int:
+        return self.by_edge.get(edge_id, 0)
+
+    def set_edge(self, edge_id: int, penalty: int) -> bool:
+        """Ustawia karę krawędzi; zwraca True, gdy się zmieniła"""
+        if self.by_edge.get(edge_id, 0) == penalty:
+            return False
+        if penalty:
+            self.by_edge[edge_id] = penalty
+        else:
+            del self.by_edge[edge_id]
+        slot = self.edge_slots.get(edge_id)
+        if slot is not None:
+            self.penalty[slot] = penalty
+        return True
+
+
+_overlay: Optional[EdgeOverlay] = None
+
+
+def get_edge_overlay() -> EdgeOverlay:
+    """Zwraca nakładkę kar krawędzi, budując ją przy pierwszym użyciu"""
+    global _overlay
+    if _overlay is None:
+        _overlay = EdgeOverlay(get_compiled_timetable())
+    return _overlay
+
+
+def rebuild_edge_overlay() -> EdgeOverlay:
+    """Przenosi kary na nowo skompilowany rozkład (np. po zmianie linii)"""
+    global _overlay
+    _overlay = EdgeOverlay(get_compiled_timetable(), _overlay.by_edge if _overlay is not None else None)
+    return _overlay
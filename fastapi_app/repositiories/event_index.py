@@ -0,0 +1,184 @@
+from models.database_models import Event, IncidentType
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime
+from bisect import bisect_left, insort
+import heapq
+
+IncidentKey = Tuple[int, IncidentType]
+
+
+class EventIndex:
+    """Indeksy zdarzeń w pamięci: po ID, krawędzi, typie, stanie i czasie.
+
+    Zdarzenia przychodzą z magazynu (EventStore.changes_since) razem z numerem
+    rewizji; starsza wersja zdarzenia nigdy nie nadpisuje nowszej.
+
+    Dla każdej pary (krawędź, typ) utrzymywana jest na bieżąco suma poziomów
+    zgłaszających nierozwiązane zdarzenia i ich zbiór; level_of podaje
+    bieżący poziom użytkownika (None - nieznany użytkownik, nie liczony).
+    """
+
+    def __init__(self, level_of: Callable[[int], Optional[int]] = lambda user_id: None):
+        self.by_id: Dict[int, Event] = {}
+        self.by_edge: Dict[int, Set[int]] = {}
+        self.by_type: Dict[IncidentType, Set[int]] = {}
+        self.unresolved: Set[int] = set()
+        self.resolved: Set[int] = set()
+        self.active: Dict[IncidentKey, Set[int]] = {}  # (krawędź, typ) -> nierozwiązane
+        self.timeline: List[Tuple[datetime, int]] = []  # (timestamp, id) rosnąco
+        self.total_upvotes = 0
+        self.total_downvotes = 0
+        self.revision = 0
+        self._revisions: Dict[int, int] = {}
+
+        self.level_of = level_of
+        self.reporter_counts: Dict[IncidentKey, Dict[int, int]] = {}  # klucz -> zgłaszający -> liczba zdarzeń
+        self.level_sums: Dict[IncidentKey, int] = {}
+        self.reporter_keys: Dict[int, Set[IncidentKey]] = {}  # zgłaszający -> klucze z jego zdarzeniami
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def apply(self, changes: Iterable[Tuple[int, Event]]) -> List[Tuple[Event, Optional[Event]]]:
+        """Nanosi zmiany (rewizja, zdarzenie) z magazynu; zwraca naniesione jako (nowe, poprzednie)"""
+        applied = []
+        for revision, event in changes:
+            if revision <= self._revisions.get(event.id, 0):
+                continue
+            self._revisions[event.id] = revision
+            self.revision = max(self.revision, revision)
+            previous = self.by_id.get(event.id)
+            self._remove(event.id)
+            self._add(event)
+            applied.append((event, previous))
+        return applied
+
+    def _add(self, event: Event):
+        self.by_id[event.id] = event
+        if event.edge_affected is not None:
+            self.by_edge.setdefault(event.edge_affected, set()).add(event.id)
+        self.by_type.setdefault(event.type, set()).add(event.id)
+        if event.isResolved:
+            self.resolved.add(event.id)
+        else:
+            self.unresolved.add(event.id)
+            if event.edge_affected is not None:
+                key = (event.edge_affected, event.type)
+                self.active.setdefault(key, set()).add(event.id)
+                self._count_reporter(key, event.reportedBy, 1)
+        insort(self.timeline, (event.timestamp, event.id))
+        self.total_upvotes += event.upvotes
+        self.total_downvotes += event.downvotes
+
+    def _remove(self, event_id: int):
+        event = self.by_id.pop(event_id, None)
+        if event is None:
+            return
+        _discard(self.by_edge, event.edge_affected, event_id)
+        _discard(self.by_type, event.type, event_id)
+        if event_id in self.unresolved and event.edge_affected is not None:
+            self._count_reporter((event.edge_affected, event.type), event.reportedBy, -1)
+        self.unresolved.discard(event_id)
+        self.resolved.discard(event_id)
+        _discard(self.active, (event.edge_affected, event.type), event_id)
+        key = (event.timestamp, event_id)
+        position = bisect_left(self.timeline, key)
+        if position < len(self.timeline) and self.timeline[position] == key:
+            del self.timeline[position]
+        self.total_upvotes -= event.upvotes
+        self.total_downvotes -= event.downvotes
+
+    def _count_reporter(self, key: IncidentKey, reporter: int, delta: int):
+        counts = self.reporter_counts.setdefault(key, {})
+        count = counts.get(reporter, 0) + delta
+        if count:
+            counts[reporter] = count
+            self.reporter_keys.setdefault(reporter, set()).add(key)
+        else:
+            counts.pop(reporter, None)
+            _discard(self.reporter_keys, reporter, key)
+            if not counts:
+                del self.reporter_counts[key]
+
+        level = self.level_of(reporter)
+        if level is not None:
+            self.level_sums[key] = self.level_sums.get(key, 0) + delta * level
+        if key not in self.reporter_counts:
+            self.level_sums.pop(key, None)
+
+    def on_level_change(self, user_id: int, old_level: int, new_level: int):
+        """Koryguje sumy poziomów po zmianie poziomu zgłaszającego"""
+        delta = new_level - old_level
+        for key in self.reporter_keys.get(user_id, ()):
+            self.level_sums[key] += delta * self.reporter_counts[key][user_id]
+
+    def reporter_level_sum(self, edge_id: int, incident_type: IncidentType) -> int:
+        """Suma poziomów zgłaszających nierozwiązane zdarzenia danego typu na krawędzi"""
+        return self.level_sums.get((edge_id, incident_type), 0)
+
+    def reporters(self, edge_id: int, incident_type: IncidentType) -> Set[int]:
+        """Znani użytkownicy zgłaszający nierozwiązane zdarzenia danego typu na krawędzi"""
+        return {reporter for reporter in self.reporter_counts.get((edge_id, incident_type), ())
+                if self.level_of(reporter) is not None}
+
+    def get(self, event_id: int) -> Optional[Event]:
+        return self.by_id.get(event_id)
+
+    def unresolved_on_edge(self, edge_id: int) -> List[Event]:
+        """Nierozwiązane zdarzenia wszystkich typów na krawędzi"""
+        return [self.by_id[event_id] for event_id in self.by_edge.get(edge_id, ()) if event_id in self.unresolved]
+
+    def active_on_edge(self, edge_id: int, incident_type: IncidentType) -> List[Event]:
+        """Nierozwiązane zdarzenia danego typu na krawędzi"""
+        return [self.by_id[event_id] for event_id in self.active.get((edge_id, incident_type), ())]
+
+    def query(self, edge_ids: Optional[Iterable[int]] = None, incident_type: Optional[IncidentType] = None,
+              is_resolved: Optional[bool] = None, limit: Optional[int] = 50) -> List[Event]:
+        """Zdarzenia spełniające filtry, od najnowszych.
+
+        Bez filtrów wynik to koniec osi czasu; z filtrami kandydaci pochodzą
+        z najmniejszego pasującego zbioru, a sortowane jest tylko limit najnowszych.
+        """
+        if limit is not None and limit <= 0:
+            return []
+
+        if edge_ids is None and incident_type is None and is_resolved is None:
+            keys = self.timeline if limit is None else self.timeline[-limit:]
+            return [self.by_id[event_id] for _, event_id in reversed(keys)]
+
+        candidate_sets: List[Set[int]] = []
+        if edge_ids is not None:
+            edge_sets = [self.by_edge.get(edge_id, set()) for edge_id in set(edge_ids)]
+            candidate_sets.append(set().union(*edge_sets) if len(edge_sets) != 1 else edge_sets[0])
+        if incident_type is not None:
+            candidate_sets.append(self.by_type.get(incident_type, set()))
+        if is_resolved is not None:
+            candidate_sets.append(self.resolved if is_resolved else self.unresolved)
+
+        candidate_sets.sort(key=len)
+        smallest, rest = candidate_sets[0], candidate_sets[1:]
+        candidates = [event_id for event_id in smallest if all(event_id in other for other in rest)]
+
+        events = (self.by_id[event_id] for event_id in candidates)
+        sort_key = lambda e: (e.timestamp, e.id)
+        if limit is None:
+            return sorted(events, key=sort_key, reverse=True)
+        return heapq.nlargest(limit, events, key=sort_key)
+
+    def stats(self) -> Dict[str, object]:
+        """Liczniki zdarzeń i głosów (bez przeglądania zdarzeń)"""
+        return {
+            "total": len(self.by_id),
+            "resolved": len(self.resolved),
+            "upvotes": self.total_upvotes,
+            "downvotes": self.total_downvotes,
+            "by_type": {incident_type.value: len(ids) for incident_type, ids in self.by_type.items()},
+        }
+
+
+def _discard(index: dict, key, event_id: int):
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(event_id)
+        if not ids:
+            del index[key]
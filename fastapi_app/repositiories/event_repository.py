@@ -0,0 +1,224 @@
+from models.database_models import Event, IncidentType
+from db.dicts import edges, events, stops, trains, users
+from db.event_journal import EventJournal
+from db.event_store import EventStore
+from repositiories.edge_overlay import edge_penalty, get_edge_overlay
+from repositiories.event_index import EventIndex
+from repositiories.live_hub import get_live_hub
+from repositiories.rider_index import get_rider_index
+from repositiories.route_cache import get_route_cache
+from repositiories.user_repository import update_user_level
+from typing import Dict, List, Optional, Sequence
+import os
+
+# Trwały magazyn zdarzeń (SQLite); plik współdzielony przez wszystkie workery
+EVENTS_DB_PATH = os.environ.get("EVENTS_DB_PATH", "events.db")
+
+_store: Optional[EventStore] = None
+
+
+def _user_level(user_id: int) -> Optional[int]:
+    user = users.get(user_id)
+    return user.level if user else None
+
+
+_index = EventIndex(level_of=_user_level)
+
+
+def get_event_index() -> EventIndex:
+    """Zwraca indeks zdarzeń w stanie z ostatniego odświeżenia (refresh_event_index)"""
+    return _index
+
+
+async def open_event_store(path: str = EVENTS_DB_PATH) -> EventStore:
+    """Otwiera magazyn zdarzeń (wywoływane przy starcie aplikacji)"""
+    global _store
+    if _store is None:
+        _store = EventStore(path)
+        await _store.open(seed=events.values())
+        await refresh_event_index()
+    return _store
+
+
+async def close_event_store():
+    """Zamyka magazyn zdarzeń, dopisując zaległe zapisy"""
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
+
+
+def get_event_store() -> EventStore:
+    """Zwraca otwarty magazyn zdarzeń"""
+    if _store is None:
+        raise RuntimeError("Event store is not open - call open_event_store() on startup")
+    return _store
+
+
+async def refresh_event_index() -> EventIndex:
+    """Dociąga do indeksu zdarzenia zmienione od ostatniej rewizji (także przez inne workery)"""
+    applied = _index.apply(await get_event_store().changes_since(_index.revision))
+    for event, previous in applied:
+        if event.edge_affected is not None:
+            # Nowa kara krawędzi (zgłoszenie, rozwiązanie, głosy) opóźnia kursy od tej krawędzi dalej,
+            # więc może zmienić każdą trasę wyznaczoną z karami
+            penalty = edge_penalty(_index.unresolved_on_edge(event.edge_affected))
+            if get_edge_overlay().set_edge(event.edge_affected, penalty):
+                get_route_cache().invalidate_penalized()
+        _publish_event(event, previous)
+    return _index
+
+
+def _publish_event(event: Event, previous: Optional[Event]):
+    """Kompaktowa zmiana zdarzenia do strumienia na żywo.
+
+    Zmiany dociągane z innych workerów mogą przyjść scalone, dlatego każda
+    ramka niesie pełne liczniki głosów, a nie tylko różnicę.
+    """
+    line_ids = get_rider_index().edge_lines.get(event.edge_affected, ()) if event.edge_affected is not None else ()
+    points = [(event.location.lat, event.location.lng)]
+    if previous is None:
+        get_live_hub().publish("event_created", {
+            "id": event.id, "type": event.type.value, "title": event.title,
+            "lat": event.location.lat, "lng": event.location.lng, "edge": event.edge_affected,
+            "ts": event.timestamp.isoformat(), "up": event.upvotes, "down": event.downvotes,
+            "resolved": event.isResolved,
+        }, line_ids, points)
+    elif previous.isResolved != event.isResolved:
+        get_live_hub().publish("event_resolved", {
+            "id": event.id, "resolved": event.isResolved, "up": event.upvotes, "down": event.downvotes,
+        }, line_ids, points)
+    else:
+        get_live_hub().publish("event_voted", {"id": event.id, "up": event.upvotes, "down": event.downvotes},
+                               line_ids, points)
+
+
+async def get_event(event_id: int) -> Optional[Event]:
+    """Zwraca zdarzenie po ID"""
+    return (await refresh_event_index()).get(event_id)
+
+
+async def add_event(event: Event) -> Event:
+    """Zapisuje nowe zdarzenie i zwraca je z nadanym ID"""
+    event = await get_event_store().add(event)
+    await refresh_event_index()
+    return event
+
+
+async def vote_event(event_id: int, user_id: int, upvote: bool) -> Optional[Event]:
+    """Zapisuje głos i aktualizuje poziom głosującego"""
+    event = await get_event_store().vote(event_id, upvote)
+    if event is not None:
+        await refresh_event_index()
+        with shared_state_writer() as write:
+            write("user_level", user_id=user_id, upvote=upvote)
+    return event
+
+
+async def resolve_event(event_id: int) -> Optional[Event]:
+    """Oznacza zdarzenie jako rozwiązane"""
+    event = await get_event_store().resolve(event_id)
+    if event is not None:
+        await refresh_event_index()
+    return event
+
+
+async def find_events(edge_ids: Optional[Sequence[int]] = None, incident_type: Optional[IncidentType] = None,
+                      is_resolved: Optional[bool] = None, limit: Optional[int] = 50) -> List[Event]:
+    """Zwraca zdarzenia wg filtrów, od najnowszych"""
+    return (await refresh_event_index()).query(edge_ids, incident_type, is_resolved, limit)
+
+
+async def event_stats() -> Dict[str, object]:
+    """Liczniki zdarzeń i głosów"""
+    return (await refresh_event_index()).stats()
+
+
+def _apply_user_level(record: dict):
+    user_id = record["user_id"]
+    if user_id in users:
+        old_level = users[user_id].level
+        new_level = update_user_level(user_id, record["upvote"]).level
+        _index.on_level_change(user_id, old_level, new_level)
+
+
+def _apply_user_state(record: dict):
+    user = users.get(record["user_id"])
+    if user is None:
+        return
+    old_level = user.level
+    user.level, user.reputation = record["level"], record["reputation"]
+    _index.on_level_change(user.id, old_level, user.level)
+    if user.current_train_id != record["current_train_id"]:
+        user.current_train_id = record["current_train_id"]
+        get_rider_index().update_rider(user.id)
+
+
+def _dump_users():
+    for user in users.values():
+        yield {"user_id": user.id, "level": user.level, "reputation": user.reputation,
+               "current_train_id": user.current_train_id}
+
+
+def _dump_trains():
+    for train in trains.values():
+        yield {"train_id": train.id, "edge_id": train.current_edge}
+
+
+def _apply_assign_train(record: dict):
+    if record["user_id"] in users:
+        users[record["user_id"]].current_train_id = record["train_id"]
+        get_rider_index().update_rider(record["user_id"])
+
+
+def _apply_move_train(record: dict):
+    apply_train_move(record["train_id"], record["edge_id"])
+
+
+def apply_train_move(train_id: int, edge_id: int):
+    """Ustawia krawędź pociągu w tym workerze i rozgłasza zmianę do subskrybentów (bez wpisu do dziennika)"""
+    train = trains.get(train_id)
+    if train is None:
+        return
+    train.current_edge = edge_id
+    edge = edges.get(train.current_edge)
+    if edge is None:
+        return
+    from_stop, to_stop = stops[edge.from_stop], stops[edge.to_stop]
+    get_live_hub().publish("train_moved", {
+        "id": train.id, "line": train.line_id, "edge": edge.id, "from": from_stop.id, "to": to_stop.id,
+        "lat": to_stop.lat, "lon": to_stop.lon,
+    }, (train.line_id,), [(from_stop.lat, from_stop.lon), (to_stop.lat, to_stop.lon)])
+
+
+# Stan użytkowników i powiadomień (w pamięci) synchronizowany między workerami przez dziennik
+journal = EventJournal(os.environ.get("EVENT_JOURNAL_PATH"), {
+    "user_level": _apply_user_level,
+    "assign_train": _apply_assign_train,
+    "move_train": _apply_move_train,
+    "user_state": _apply_user_state,
+}, {
+    # Punkt kontrolny: pełny stan użytkowników i pozycje pociągów
+    "user_state": _dump_users,
+    "move_train": _dump_trains,
+})
+
+
+def register_shared_state_op(op: str, applier, dump=None):
+    """Rejestruje dodatkowy rodzaj wpisu dziennika (np. powiadomienia).
+
+    dump zwraca wpisy tego rodzaju odtwarzające cały bieżący stan (do punktu kontrolnego dziennika).
+    """
+    journal.appliers[op] = applier
+    if dump is not None:
+        journal.dumpers[op] = dump
+
+
+def sync_shared_state():
+    """Dociąga zmiany użytkowników i powiadomień zapisane przez inne workery"""
+    journal.sync()
+
+
+def shared_state_writer():
+    """Blok zapisu zmian w dzienniku (jeden pisarz naraz)"""
+    return journal.writer()
@@ -0,0 +1,117 @@
+from repositiories.spatial_index import SpatialIndex, get_spatial_index
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import math
+import os
+
+# Najdłuższe dojście piesze między przystankami, jakie planer bierze pod uwagę (metry)
+FOOTPATH_RADIUS_M = int(os.environ.get("FOOTPATH_RADIUS_M", "400"))
+# Tempo pieszego dojścia między przystankami (ok. 4.5 km/h)
+WALK_SPEED_M_PER_S = 1.25
+
+
+def walk_seconds(distance_m: float) -> int:
+    """Czas dojścia pieszego w sekundach"""
+    return math.ceil(distance_m / WALK_SPEED_M_PER_S)
+
+
+class FootpathGraph:
+    """Dojścia piesze między pobliskimi przystankami w formacie CSR.
+
+    Dojścia przystanku o pozycji i (kolejność jak w StopCoordinates) zajmują
+    zakres offsets[i]:offsets[i + 1] w tablicach targets, distance_m i seconds,
+    posortowane po odległości. Graf liczony jest raz z indeksu przestrzennego,
+    więc planer przegląda tylko sąsiadów przystanku, bez geometrii w zapytaniu.
+    """
+
+    def __init__(self, index: SpatialIndex, radius_m: int = FOOTPATH_RADIUS_M):
+        coords = index.coords
+        self.radius_m = radius_m
+        self.position = coords.position
+        if radius_m > 0:
+            sources, neighbours, distance_km = index.stop_pairs_within_radius(radius_m / 1000)
+        else:
+            sources = neighbours = np.zeros(0, dtype=np.int64)
+            distance_km = np.zeros(0, dtype=np.float64)
+
+        # Dojścia grupowane po przystanku źródłowym, w grupie od najbliższego
+        order = np.lexsort((distance_km, sources))
+        offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(coords)), out=offsets[1:])
+        distances = np.rint(distance_km[order] * 1000).astype(np.int32)
+        self._set_arrays(offsets, coords.ids[neighbours[order]].astype(np.int64), distances,
+                         np.ceil(distances / WALK_SPEED_M_PER_S).astype(np.int32))
+
+    @classmethod
+    def from_arrays(cls, index: SpatialIndex, arrays: Dict[str, np.ndarray],
+                    radius_m: int = FOOTPATH_RADIUS_M) -> Optional["FootpathGraph"]:
+        """Odtwarza graf z tablic to_arrays (np. z migawki sieci); None, gdy policzono go dla innego promienia"""
+        if "footpath_radius_m" not in arrays or int(arrays["footpath_radius_m"][0]) != radius_m \
+                or len(arrays["footpath_offsets"]) != len(index.coords) + 1:
+            return None
+        graph = cls.__new__(cls)
+        graph.radius_m = radius_m
+        graph.position = index.coords.position
+        graph._set_arrays(arrays["footpath_offsets"], arrays["footpath_targets"],
+                          arrays["footpath_distance_m"], arrays["footpath_seconds"])
+        return graph
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Tablice CSR grafu do zapisania w migawce sieci"""
+        return {
+            "footpath_radius_m": np.array([self.radius_m], dtype=np.int64),
+            "footpath_offsets": self.offsets,
+            "footpath_targets": self.targets,
+            "footpath_distance_m": self.distance_m,
+            "footpath_seconds": self.seconds,
+        }
+
+    def _set_arrays(self, offsets: np.ndarray, targets: np.ndarray, distance_m: np.ndarray, seconds: np.ndarray):
+        self.offsets = offsets
+        self.targets = targets
+        self.distance_m = distance_m
+        self.seconds = seconds
+        # Kopie w listach Pythona dla pętli planera (pojedyncze indeksowanie numpy jest wolne)
+        self._offsets: List[int] = offsets.tolist()
+        self._targets: List[int] = targets.tolist()
+        self._distances: List[int] = distance_m.tolist()
+        self._seconds: List[int] = seconds.tolist()
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    def neighbours(self, stop_id: int) -> List[Tuple[int, int, int]]:
+        """Dojścia z przystanku: (przystanek, odległość w metrach, czas w sekundach)"""
+        position = self.position.get(stop_id)
+        if position is None:
+            return []
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return list(zip(self._targets[start:end], self._distances[start:end], self._seconds[start:end]))
+
+    def walks(self, stop_id: int) -> List[Tuple[int, int]]:
+        """Dojścia z przystanku dla CSA: (przystanek, czas w sekundach)"""
+        position = self.position.get(stop_id)
+        if position is None:
+            return []
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return list(zip(self._targets[start:end], self._seconds[start:end]))
+
+
+_graph: Optional[FootpathGraph] = None
+
+
+def get_footpath_graph() -> FootpathGraph:
+    """Zwraca graf dojść pieszych, budując go przy pierwszym użyciu"""
+    global _graph
+    if _graph is None:
+        _graph = FootpathGraph(get_spatial_index())
+    return _graph
+
+
+def rebuild_footpath_graph(arrays: Optional[Dict[str, np.ndarray]] = None) -> FootpathGraph:
+    """Buduje graf dojść od nowa (np. po zmianie przystanków); z tablic migawki sieci tylko go odtwarza"""
+    global _graph
+    _graph = FootpathGraph.from_arrays(get_spatial_index(), arrays) if arrays is not None else None
+    if _graph is None:
+        _graph = FootpathGraph(get_spatial_index())
+    return _graph
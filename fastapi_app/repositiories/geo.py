@@ -0,0 +1,78 @@
+from models.database_models import Stop
+from db.dicts import stops
+from typing import Dict, Optional
+import numpy as np
+import math
+
+# Promień Ziemi w kilometrach
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Odległość w kilometrach między dwoma punktami podanymi jako liczby (formuła Haversine)"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_to_many(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Odległości w km od jednego punktu do N punktów (jeden przebieg wektorowy)"""
+    lat_rad = math.radians(lat)
+    lats_rad = np.radians(lats)
+    delta_lat = lats_rad - lat_rad
+    delta_lon = np.radians(lons) - math.radians(lon)
+
+    a = np.sin(delta_lat / 2) ** 2 + math.cos(lat_rad) * np.cos(lats_rad) * np.sin(delta_lon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lats1: np.ndarray, lons1: np.ndarray, lats2: np.ndarray, lons2: np.ndarray) -> np.ndarray:
+    """Macierz odległości N×M w km między dwoma zbiorami punktów"""
+    lats1_rad = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lats2_rad = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    delta_lat = lats2_rad - lats1_rad
+    delta_lon = np.radians(np.asarray(lons2, dtype=np.float64))[None, :] - np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lats1_rad) * np.cos(lats2_rad) * np.sin(delta_lon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class StopCoordinates:
+    """Współrzędne przystanków w ciągłych tablicach float64 (kolejność jak w stops)"""
+
+    def __init__(self, stops_dict: Dict[int, Stop]):
+        self.ids = np.fromiter(stops_dict.keys(), dtype=np.int64, count=len(stops_dict))
+        self.lat = np.fromiter((stop.lat for stop in stops_dict.values()), dtype=np.float64, count=len(stops_dict))
+        self.lon = np.fromiter((stop.lon for stop in stops_dict.values()), dtype=np.float64, count=len(stops_dict))
+        self.position = {int(stop_id): i for i, stop_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def distances_from(self, lat: float, lon: float) -> np.ndarray:
+        """Odległości w km od punktu do wszystkich przystanków"""
+        return haversine_to_many(lat, lon, self.lat, self.lon)
+
+
+_stop_coordinates: Optional[StopCoordinates] = None
+
+
+def get_stop_coordinates() -> StopCoordinates:
+    """Zwraca tablice współrzędnych przystanków, budując je przy pierwszym użyciu"""
+    global _stop_coordinates
+    if _stop_coordinates is None:
+        _stop_coordinates = StopCoordinates(stops)
+    return _stop_coordinates
+
+
+def rebuild_stop_coordinates() -> StopCoordinates:
+    """Buduje tablice współrzędnych od nowa (np. po zmianie przystanków)"""
+    global _stop_coordinates
+    _stop_coordinates = StopCoordinates(stops)
+    return _stop_coordinates
@@ -0,0 +1,407 @@
+from repositiories.journey_planner import (INF, WALK, CompiledTimetable, JourneyLeg, Leg, add_walk_legs,
+                                          get_compiled_timetable, timetable_for_date)
+from repositiories.footpaths import FootpathGraph, get_footpath_graph
+from repositiories.geo import StopCoordinates, get_stop_coordinates, haversine_km, haversine_to_many
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from bisect import bisect_left
+from datetime import date
+from weakref import WeakKeyDictionary
+import heapq
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Dolne ograniczenia czasu dojazdu do celu, w kolejności rosnącej dokładności
+GOAL_HEURISTICS = ("none", "haversine", "landmarks", "bidirectional")
+# Liczba punktów orientacyjnych (ALT), dla których trzymane są tablice czasów
+ALT_LANDMARKS = int(os.environ.get("ALT_LANDMARKS", "8"))
+
+
+class SearchResult(NamedTuple):
+    """Wynik wyszukiwania ukierunkowanego z licznikami pracy"""
+    legs: Optional[List[Leg]]
+    arrival: Optional[int]
+    nodes_expanded: int  # rozwinięte przystanki wyszukiwania w przód
+    backward_settled: int = 0  # przystanki ustalone wstecz na grafie dolnych ograniczeń (bidirectional)
+
+
+class StopEdges:
+    """Połączenia rozkładu pogrupowane w krawędzie przystanek -> następny przystanek.
+
+    Połączenia krawędzi zajmują zakres lo:hi list posortowanych po odjeździe;
+    best_arrival[k] to najwcześniejszy przyjazd spośród połączeń k:hi (minimum
+    sufiksowe), a best_connection[k] jego połączenie. Najwcześniejszy przyjazd
+    krawędzią przy starcie o czasie t to jeden bisect po departure - także gdy
+    szybszy kurs wyprzedza wolniejszy.
+    """
+
+    def __init__(self, tt: CompiledTimetable):
+        self.out: Dict[int, List[Tuple[int, int, int]]] = {}  # przystanek -> [(następny przystanek, lo, hi)]
+        self.min_duration: Dict[Tuple[int, int], int] = {}  # (przystanek, następny) -> najkrótszy przejazd
+        self.departure: List[int] = []
+        self.best_arrival: List[int] = []
+        self.best_connection: List[int] = []
+        if not tt.columns or not len(tt.columns[0]):
+            return
+
+        dep, arr, from_stop, to_stop = (column.astype(np.int64) for column in tt.columns[:4])
+        order = np.lexsort((dep, to_stop, from_stop))
+        dep, arr, from_stop, to_stop = dep[order], arr[order], from_stop[order], to_stop[order]
+        is_start = np.r_[True, (from_stop[1:] != from_stop[:-1]) | (to_stop[1:] != to_stop[:-1])]
+        starts = np.flatnonzero(is_start)
+        group = np.cumsum(is_start) - 1
+
+        # Minimum sufiksowe w grupach: przesunięcie o grupę nie pozwala minimum przejść do wcześniejszej grupy
+        n = len(dep)
+        shift = (arr.max() + 1) * (len(starts) - group)
+        encoded = (arr - shift) * n + np.arange(n)
+        suffix = np.minimum.accumulate(encoded[::-1])[::-1]
+        best = suffix % n
+        self.departure = dep.tolist()
+        self.best_arrival = arr[best].tolist()
+        self.best_connection = order[best].tolist()
+
+        bounds = np.r_[starts, n].tolist()
+        durations = np.minimum.reduceat(arr - dep, starts).tolist()
+        for lo, hi, u, v, duration in zip(bounds, bounds[1:], from_stop[starts].tolist(), to_stop[starts].tolist(),
+                                          durations):
+            self.out.setdefault(u, []).append((v, lo, hi))
+            self.min_duration[(u, v)] = duration
+
+
+_stop_edges: "WeakKeyDictionary[CompiledTimetable, StopEdges]" = WeakKeyDictionary()
+
+
+def stop_edges(tt: CompiledTimetable) -> StopEdges:
+    """Krawędzie przystanków tablicy połączeń (liczone raz na tablicę, także na widok dnia)"""
+    edges = _stop_edges.get(tt)
+    if edges is None:
+        edges = _stop_edges[tt] = StopEdges(tt)
+    return edges
+
+
+def _dijkstra(adjacency: List[List[Tuple[int, int]]], source: int) -> np.ndarray:
+    """Najkrótsze czasy od source w grafie statycznym (inf - nieosiągalne)"""
+    distance = [INF] * len(adjacency)
+    distance[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > distance[u]:
+            continue
+        for v, w in adjacency[u]:
+            if d + w < distance[v]:
+                distance[v] = d + w
+                heapq.heappush(heap, (d + w, v))
+    return np.array(distance, dtype=np.float64)
+
+
+def _adjacency_to_arrays(adjacency: List[List[Tuple[int, int]]], prefix: str) -> Dict[str, np.ndarray]:
+    offsets = np.zeros(len(adjacency) + 1, dtype=np.int64)
+    np.cumsum([len(arcs) for arcs in adjacency], out=offsets[1:])
+    arcs = np.array([arc for arcs in adjacency for arc in arcs], dtype=np.int64).reshape(-1, 2)
+    return {f"{prefix}_offsets": offsets, f"{prefix}_arcs": arcs}
+
+
+def _adjacency_from_arrays(arrays: Dict[str, np.ndarray], prefix: str, n: int) -> List[List[Tuple[int, int]]]:
+    offsets = arrays[f"{prefix}_offsets"].tolist()
+    arcs = [tuple(arc) for arc in arrays[f"{prefix}_arcs"].tolist()]
+    return [arcs[offsets[i]:offsets[i + 1]] for i in range(n)]
+
+
+class LowerBounds:
+    """Dopuszczalne dolne ograniczenia czasu dojazdu do celu dla A*.
+
+    Graf dolnych ograniczeń ma krawędź dla każdej pary kolejnych przystanków
+    kursu (najkrótszy przejazd z całego rozkładu, bez czekania) i każdego
+    dojścia pieszego; żadna podróż nie jest od niego szybsza w dowolnym dniu.
+    haversine: odległość do celu / najwyższa prędkość w sieci. landmarks (ALT):
+    z nierówności trójkąta dla czasów do i od punktów orientacyjnych
+    wybieranych jako najdalsze od już wybranych. Przystanki indeksowane są
+    pozycją w StopCoordinates.
+    """
+
+    def __init__(self, tt: CompiledTimetable, footpaths: FootpathGraph, coords: StopCoordinates,
+                 n_landmarks: int = ALT_LANDMARKS):
+        self.coords = coords
+        self.position = coords.position
+        n = len(coords)
+        self.forward: List[List[Tuple[int, int]]] = [[] for _ in range(n)]
+        self.backward: List[List[Tuple[int, int]]] = [[] for _ in range(n)]
+
+        pairs = [(u, v, duration) for (u, v), duration in stop_edges(tt).min_duration.items()]
+        pairs += [(u, v, seconds) for u in self.position for v, seconds in footpaths.walks(u)]
+        lat, lon = coords.lat.tolist(), coords.lon.tolist()
+        speed = 0.0
+        for u, v, seconds in pairs:
+            pu, pv = self.position.get(u), self.position.get(v)
+            if pu is None or pv is None:
+                continue
+            self.forward[pu].append((pv, seconds))
+            self.backward[pv].append((pu, seconds))
+            distance_m = haversine_km(lat[pu], lon[pu], lat[pv], lon[pv]) * 1000
+            if distance_m > 0:
+                speed = max(speed, distance_m / seconds if seconds > 0 else INF)
+        # Przejazd w zerowym czasie (np. czasy z dokładnością do minuty) - odległość nic nie ogranicza
+        self.max_speed = speed
+        if speed == INF:
+            logger.info("Zero-duration connections between distinct stops, haversine bound disabled")
+
+        self.landmarks: List[int] = []
+        from_rows: List[np.ndarray] = []
+        to_rows: List[np.ndarray] = []
+        if n:
+            # Pierwszy punkt: najdalszy od przystanku z największą liczbą krawędzi; kolejne - najdalsze od wybranych
+            nearest = _dijkstra(self.forward, max(range(n), key=lambda p: len(self.forward[p])))
+            for _ in range(min(n_landmarks, n)):
+                finite = np.where(np.isfinite(nearest), nearest, -1.0)
+                if self.landmarks:
+                    finite[self.landmarks] = -1.0
+                landmark = int(np.argmax(finite))
+                if finite[landmark] < 0:
+                    break
+                self.landmarks.append(landmark)
+                from_rows.append(_dijkstra(self.forward, landmark))
+                to_rows.append(_dijkstra(self.backward, landmark))
+                nearest = from_rows[-1] if len(self.landmarks) == 1 else np.minimum(nearest, from_rows[-1])
+        self.from_landmark = np.array(from_rows).reshape(len(from_rows), n)
+        self.to_landmark = np.array(to_rows).reshape(len(to_rows), n)
+        self.footpath_radius_m = footpaths.radius_m
+
+    @classmethod
+    def from_arrays(cls, coords: StopCoordinates, footpaths: FootpathGraph, arrays: Dict[str, np.ndarray],
+                    n_landmarks: int = ALT_LANDMARKS) -> Optional["LowerBounds"]:
+        """Odtwarza ograniczenia z tablic to_arrays (np. z migawki sieci).
+
+        None, gdy policzono je dla innego promienia dojść lub liczby punktów orientacyjnych.
+        """
+        if "bounds_settings" not in arrays:
+            return None
+        n_stops, radius_m, stored_landmarks = arrays["bounds_settings"].tolist()
+        if n_stops != len(coords) or radius_m != footpaths.radius_m or stored_landmarks != n_landmarks:
+            return None
+        bounds = cls.__new__(cls)
+        bounds.coords = coords
+        bounds.position = coords.position
+        bounds.forward = _adjacency_from_arrays(arrays, "bounds_forward", n_stops)
+        bounds.backward = _adjacency_from_arrays(arrays, "bounds_backward", n_stops)
+        bounds.max_speed = float(arrays["bounds_max_speed"][0])
+        bounds.landmarks = arrays["bounds_landmarks"].tolist()
+        bounds.from_landmark = arrays["bounds_from_landmark"]
+        bounds.to_landmark = arrays["bounds_to_landmark"]
+        bounds.footpath_radius_m = radius_m
+        return bounds
+
+    def to_arrays(self, n_landmarks: int = ALT_LANDMARKS) -> Dict[str, np.ndarray]:
+        """Graf ograniczeń (CSR) i odległości punktów orientacyjnych do zapisania w migawce sieci"""
+        return {
+            "bounds_settings": np.array([len(self.coords), self.footpath_radius_m, n_landmarks], dtype=np.int64),
+            **_adjacency_to_arrays(self.forward, "bounds_forward"),
+            **_adjacency_to_arrays(self.backward, "bounds_backward"),
+            "bounds_max_speed": np.array([self.max_speed], dtype=np.float64),
+            "bounds_landmarks": np.array(self.landmarks, dtype=np.int64),
+            "bounds_from_landmark": self.from_landmark,
+            "bounds_to_landmark": self.to_landmark,
+        }
+
+    def haversine(self, target: int) -> np.ndarray:
+        """Odległość do celu przez najwyższą prędkość w sieci (sekundy)"""
+        if self.max_speed in (0.0, INF):
+            return np.zeros(len(self.coords))
+        distance_m = haversine_to_many(self.coords.lat[target], self.coords.lon[target],
+                                       self.coords.lat, self.coords.lon) * 1000
+        return distance_m / self.max_speed
+
+    def landmarks_bound(self, target: int) -> np.ndarray:
+        """Ograniczenie ALT: max po punktach L z d(L, cel) - d(L, v) i d(v, L) - d(cel, L)"""
+        bound = np.zeros(len(self.coords))
+        with np.errstate(invalid="ignore"):
+            for row in (self.from_landmark[:, target:target + 1] - self.from_landmark,
+                        self.to_landmark - self.to_landmark[:, target:target + 1]):
+                # Człony z nieosiągalnym punktem (inf - inf lub inf - x) nic nie mówią
+                row = np.where(np.isfinite(row), row, 0.0)
+                if len(row):
+                    bound = np.maximum(bound, row.max(axis=0))
+        return np.maximum(bound, self.haversine(target))
+
+
+class _BackwardSearch:
+    """Dijkstra wstecz od celu na grafie dolnych ograniczeń, przesuwana krokami.
+
+    Ustalony przystanek ma dokładne ograniczenie; pozostałe co najmniej
+    promień (najmniejszy klucz w kolejce). Pusta kolejka oznacza, że
+    nieustalone przystanki w ogóle nie docierają do celu.
+    """
+
+    def __init__(self, bounds: LowerBounds, target: int, static: List[float]):
+        self.backward = bounds.backward
+        self.static = static
+        self.settled: Dict[int, float] = {}
+        self.distance: Dict[int, float] = {target: 0}
+        self.heap: List[Tuple[float, int]] = [(0, target)]
+
+    def step(self):
+        while self.heap:
+            d, u = heapq.heappop(self.heap)
+            if u in self.settled or d > self.distance[u]:
+                continue
+            self.settled[u] = d
+            for v, w in self.backward[u]:
+                if d + w < self.distance.get(v, INF):
+                    self.distance[v] = d + w
+                    heapq.heappush(self.heap, (d + w, v))
+            return
+
+    def bound(self, position: int) -> float:
+        settled = self.settled.get(position)
+        if settled is not None:
+            return settled
+        if not self.heap:
+            return INF
+        return max(self.static[position], self.heap[0][0])
+
+
+def find_journey_goal_directed(start_id: int, end_id: int, start_seconds: int, heuristic: str = "landmarks",
+                               service_date: Optional[date] = None) -> SearchResult:
+    """Najwcześniejszy przyjazd wyszukiwaniem A* po przystankach (zależnym od czasu).
+
+    Przystanki rozwijane są w kolejności przyjazd + dolne ograniczenie czasu
+    do celu (GOAL_HEURISTICS; "none" to zwykła kolejność czasu), więc
+    wyszukiwanie nie rozlewa się w stronę przeciwną do celu. "bidirectional"
+    równolegle prowadzi Dijkstrę wstecz od celu na grafie dolnych ograniczeń
+    (wstecz nie da się szukać po rozkładzie - czas przyjazdu nie jest znany)
+    i zaostrza nią ograniczenia ALT. Przyjazdy są takie jak z find_journey
+    (dojścia piesze bez łączenia, ten sam dzień rozkładu), bez kar za utrudnienia.
+    """
+    if heuristic not in GOAL_HEURISTICS:
+        raise ValueError(f"heuristic must be one of {', '.join(GOAL_HEURISTICS)}")
+    if start_id == end_id:
+        return SearchResult([], start_seconds, 0)
+
+    tt = timetable_for_date(service_date)
+    edges = stop_edges(tt)
+    bounds = get_lower_bounds()
+    footpaths = get_footpath_graph()
+    position = bounds.position
+    target = position.get(end_id)
+
+    backward = None
+    static: Optional[List[float]] = None
+    if heuristic != "none" and target is not None:
+        static = (bounds.haversine(target) if heuristic == "haversine" else bounds.landmarks_bound(target)).tolist()
+        if heuristic == "bidirectional":
+            backward = _BackwardSearch(bounds, target, static)
+
+    def lower_bound(stop_id: int) -> float:
+        p = position.get(stop_id)
+        if p is None or static is None:
+            return 0
+        return backward.bound(p) if backward is not None else static[p]
+
+    # Stan: (przystanek, czy dotarliśmy pieszo) - po dojściu pieszym nie idzie się dalej pieszo
+    arrival: Dict[Tuple[int, bool], int] = {(start_id, False): start_seconds}
+    parent: Dict[Tuple[int, bool], Tuple[Tuple[int, bool], int]] = {}  # stan -> (poprzedni stan, połączenie lub WALK)
+    expanded: Dict[Tuple[int, bool], int] = {}
+    heap = [(start_seconds + lower_bound(start_id), start_seconds, start_id, False)]
+    nodes_expanded = 0
+    found: Optional[Tuple[int, bool]] = None
+
+    while heap:
+        key, t, stop_id, walked = heapq.heappop(heap)
+        state = (stop_id, walked)
+        if t > arrival[state] or expanded.get(state) == t:
+            continue
+        if backward is not None:
+            backward.step()
+            # Ograniczenia rosną w miarę przesuwania wyszukiwania wstecz - wpis z nieaktualnym kluczem wraca do kolejki
+            current = t + lower_bound(stop_id)
+            if current > key:
+                _push(heap, current, t, state)
+                continue
+        if stop_id == end_id:
+            found = state
+            break
+        expanded[state] = t
+        nodes_expanded += 1
+
+        for next_stop, lo, hi in edges.out.get(stop_id, ()):
+            k = bisect_left(edges.departure, t, lo, hi)
+            if k == hi:
+                continue
+            next_arrival = edges.best_arrival[k]
+            next_state = (next_stop, False)
+            if next_arrival < arrival.get(next_state, INF):
+                arrival[next_state] = next_arrival
+                parent[next_state] = (state, edges.best_connection[k])
+                _push(heap, next_arrival + lower_bound(next_stop), next_arrival, next_state)
+        if not walked:
+            for next_stop, seconds in footpaths.walks(stop_id):
+                next_arrival = t + seconds
+                next_state = (next_stop, True)
+                if next_arrival < min(arrival.get(next_state, INF), arrival.get((next_stop, False), INF)):
+                    arrival[next_state] = next_arrival
+                    parent[next_state] = (state, WALK)
+                    _push(heap, next_arrival + lower_bound(next_stop), next_arrival, next_state)
+
+    backward_settled = len(backward.settled) if backward is not None else 0
+    if found is None:
+        return SearchResult(None, None, nodes_expanded, backward_settled)
+    legs = add_walk_legs(start_id, end_id, _reconstruct_legs(tt, parent, found), footpaths)
+    return SearchResult(legs, arrival[found], nodes_expanded, backward_settled)
+
+
+def _push(heap: List[Tuple[float, int, int, bool]], key: float, arrival: int, state: Tuple[int, bool]):
+    """Dodaje stan do kolejki; stan, z którego cel jest nieosiągalny (klucz inf), pomija"""
+    if key < INF:
+        heapq.heappush(heap, (key, arrival, *state))
+
+
+def _reconstruct_legs(tt: CompiledTimetable, parent: Dict[Tuple[int, bool], Tuple[Tuple[int, bool], int]],
+                      state: Tuple[int, bool]) -> List[JourneyLeg]:
+    """Odtwarza odcinki podróży; kolejne połączenia tego samego kursu łączy w jeden odcinek"""
+    connections = []
+    while state in parent:
+        state, connection = parent[state]
+        if connection != WALK:
+            connections.append(connection)
+    connections.reverse()
+
+    legs = []
+    first = 0
+    for i, c in enumerate(connections):
+        following = connections[i + 1] if i + 1 < len(connections) else None
+        if following is not None and tt.trip[following] == tt.trip[c] and tt.seq[following] == tt.seq[c] + 1:
+            continue
+        board = connections[first]
+        line, schedule = tt.trips[tt.trip[board]]
+        stop_ids = tt.trip_stops[tt.trip[board]][tt.seq[board]:tt.seq[c] + 2]
+        legs.append(JourneyLeg(line=line, schedule=schedule, stop_ids=stop_ids,
+                               departure=tt.dep_time[board], arrival=tt.arr_time[c]))
+        first = i + 1
+    return legs
+
+
+_bounds: Optional[LowerBounds] = None
+
+
+def get_lower_bounds() -> LowerBounds:
+    """Zwraca dolne ograniczenia (ALT), budując je przy pierwszym użyciu"""
+    global _bounds
+    if _bounds is None:
+        _bounds = LowerBounds(get_compiled_timetable(), get_footpath_graph(), get_stop_coordinates())
+    return _bounds
+
+
+def rebuild_lower_bounds(arrays: Optional[Dict[str, np.ndarray]] = None) -> LowerBounds:
+    """Liczy dolne ograniczenia od nowa (np. po zmianie rozkładu lub przystanków).
+
+    Z tablicami migawki sieci (to_arrays) ograniczenia są tylko odtwarzane, bez przebiegów Dijkstry.
+    """
+    global _bounds
+    _bounds = (LowerBounds.from_arrays(get_stop_coordinates(), get_footpath_graph(), arrays)
+               if arrays is not None else None)
+    if _bounds is None:
+        _bounds = LowerBounds(get_compiled_timetable(), get_footpath_graph(), get_stop_coordinates())
+    return _bounds
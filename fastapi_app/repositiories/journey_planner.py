@@ -0,0 +1,857 @@
+from models.database_models import Line, Schedule
+from repositiories.timetable_store import TimetableStore, get_timetable_store
+from repositiories.footpaths import FootpathGraph, get_footpath_graph
+from repositiories.service_calendar import ServiceDays, get_service_days
+from typing import Iterable, List, Optional, Dict, Sequence, Tuple, NamedTuple, Union
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, timedelta
+from weakref import WeakKeyDictionary
+import numpy as np
+
+INF = float('inf')
+# Kara krawędzi oznaczająca, że nie da się nią przejechać (zob. edge_overlay)
+BLOCKED = -1
+# Znacznik dojścia pieszego w in_connection: (WALK, przystanek, z którego się przyszło)
+WALK = -1
+SECONDS_PER_DAY = 86400
+# Dla ilu dni trzymane są przefiltrowane tablice połączeń
+DAY_CACHE_SIZE = 4
+
+
+class JourneyLeg(NamedTuple):
+    """Odcinek podróży jednym kursem: linia, harmonogram i kolejne przystanki.
+
+    departure i arrival to planowe czasy z wiersza kursu w macierzy czasów
+    (sekundy od północy dnia podróży, po 24:00 rosną dalej), a nie z
+    stop_to_time, które zawija się o północy.
+    """
+    line: Line
+    schedule: Schedule
+    stop_ids: List[int]
+    departure: int
+    arrival: int
+
+
+class WalkLeg(NamedTuple):
+    """Dojście piesze między przystankami (z grafu pieszego)"""
+    from_stop: int
+    to_stop: int
+    distance_m: int
+    seconds: int
+
+
+Leg = Union[JourneyLeg, WalkLeg]
+
+
+class ProfileEntry(NamedTuple):
+    """Niezdominowana para (odjazd, przyjazd do celu) z połączeniami wejścia i wyjścia"""
+    departure: int
+    arrival: int
+    board: int
+    alight: int
+
+
+class CompiledTimetable:
+    """Tablica połączeń (Connection Scan Algorithm) posortowana po czasie odjazdu.
+
+    Każde połączenie to przejazd jednego kursu między dwoma kolejnymi przystankami,
+    przechowywany kolumnowo w równoległych listach; czasy w sekundach od północy.
+    """
+
+    def __init__(self):
+        self.dep_time: List[int] = []
+        self.arr_time: List[int] = []
+        self.dep_stop: List[int] = []
+        self.arr_stop: List[int] = []
+        self.trip: List[int] = []
+        self.seq: List[int] = []  # pozycja przystanku odjazdu w kursie
+        self.edge: List[int] = []  # slot krawędzi połączenia w nakładce kar (0 - brak krawędzi)
+        self.trips: List[Tuple[Line, Schedule]] = []
+        self.trip_stops: List[List[int]] = []
+        self.patterns: List[Tuple[int, int, List[int]]] = []  # wariant: (pierwszy kurs, liczba kursów, sloty krawędzi)
+        self.edge_slots: Dict[int, int] = {}  # ID krawędzi -> slot (od 1)
+        self.trip_service = np.zeros(0, dtype=np.int32)  # kurs -> indeks kalendarza (ServiceDays)
+        self.columns: Tuple[np.ndarray, ...] = ()  # te same kolumny w numpy, do filtrowania po dniu
+
+    def __len__(self) -> int:
+        return len(self.dep_time)
+
+
+def compile_timetable(store: TimetableStore) -> CompiledTimetable:
+    """Kompiluje kolumnowy rozkład jazdy do posortowanej tablicy połączeń"""
+    timetable = CompiledTimetable()
+    columns = []
+
+    for pattern in store.patterns:
+        n_trips, n_stops = pattern.times.shape
+        if n_stops < 2:
+            continue
+        first_trip = len(timetable.trips)
+        stop_ids = pattern.stops.tolist()
+        # Kurs może jechać krawędzią w dowolnym kierunku
+        line_edges = {}
+        for edge in pattern.line.edges or []:
+            line_edges[(edge.from_stop, edge.to_stop)] = line_edges[(edge.to_stop, edge.from_stop)] = edge.id
+        trip_edges = [
+            _edge_slot(timetable, line_edges.get((from_stop, to_stop)))
+            for from_stop, to_stop in zip(stop_ids, stop_ids[1:])
+        ]
+        edge_slots = np.array(trip_edges, dtype=np.int32)
+        for schedule in pattern.schedules:
+            timetable.trips.append((pattern.line, schedule))
+            timetable.trip_stops.append(stop_ids)
+        timetable.patterns.append((first_trip, n_trips, trip_edges))
+
+        seq = np.broadcast_to(np.arange(n_stops - 1, dtype=np.int32), (n_trips, n_stops - 1))
+        trip = np.broadcast_to(np.arange(first_trip, first_trip + n_trips, dtype=np.int32)[:, None], (n_trips, n_stops - 1))
+        columns.append((
+            pattern.times[:, :-1].ravel(),
+            pattern.times[:, 1:].ravel(),
+            np.broadcast_to(pattern.stops[:-1], (n_trips, n_stops - 1)).ravel(),
+            np.broadcast_to(pattern.stops[1:], (n_trips, n_stops - 1)).ravel(),
+            trip.ravel(),
+            seq.ravel(),
+            np.broadcast_to(edge_slots, (n_trips, n_stops - 1)).ravel(),
+        ))
+
+    timetable.trip_service = get_service_days().service_indexes(schedule.service_id for _, schedule in timetable.trips)
+    if not columns:
+        return timetable
+
+    _set_columns(timetable, [np.concatenate(column) for column in zip(*columns)], sort=True)
+    return timetable
+
+
+def _set_columns(timetable: CompiledTimetable, columns: Sequence[np.ndarray], sort: bool):
+    """Ustawia kolumny połączeń (dep, arr, from, to, trip, seq, edge), sortując je po odjeździe"""
+    if sort:
+        dep, arr, _, _, trip, seq, _ = columns
+        order = np.lexsort((seq, trip, arr, dep))
+        columns = [column[order] for column in columns]
+    timetable.columns = tuple(columns)
+    (timetable.dep_time, timetable.arr_time, timetable.dep_stop, timetable.arr_stop,
+     timetable.trip, timetable.seq, timetable.edge) = (column.tolist() for column in columns)
+
+
+def _day_view(tt: CompiledTimetable, service_days: ServiceDays, day: date) -> CompiledTimetable:
+    """Tablica połączeń kursów jadących w danym dniu.
+
+    Kursy filtrowane są jedną maską wektorową z map dni kursowania. Dochodzą
+    nocne połączenia kursów z dnia poprzedniego (czasy po 24:00) przesunięte
+    o dobę; dostają osobne numery kursów (kurs + liczba kursów), by nie
+    zlały się z tym samym kursem jadącym w bieżącym dniu.
+    """
+    view = CompiledTimetable()
+    view.trips, view.trip_stops, view.edge_slots = tt.trips, tt.trip_stops, tt.edge_slots
+    view.patterns = tt.patterns
+    view.trip_service = tt.trip_service
+    if not tt.columns:
+        return view
+
+    dep, arr, from_stop, to_stop, trip, seq, edge = tt.columns
+    today = service_days.trip_mask(tt.trip_service, day)[trip]
+    overnight = service_days.trip_mask(tt.trip_service, day - timedelta(days=1))[trip] & (dep >= SECONDS_PER_DAY)
+    if not overnight.any():
+        _set_columns(view, [column[today] for column in tt.columns], sort=False)
+        return view
+
+    view.trips, view.trip_stops = tt.trips + tt.trips, tt.trip_stops + tt.trip_stops
+    view.patterns = tt.patterns + [(first + len(tt.trips), n, slots) for first, n, slots in tt.patterns]
+    view.trip_service = np.concatenate((tt.trip_service, tt.trip_service))
+    shift = (SECONDS_PER_DAY, SECONDS_PER_DAY, 0, 0, -len(tt.trips), 0, 0)
+    _set_columns(view, [np.concatenate((column[today], column[overnight] - offset))
+                        for column, offset in zip(tt.columns, shift)], sort=True)
+    return view
+
+
+def _edge_slot(timetable: CompiledTimetable, edge_id: Optional[int]) -> int:
+    if edge_id is None:
+        return 0
+    return timetable.edge_slots.setdefault(edge_id, len(timetable.edge_slots) + 1)
+
+
+_compiled: Optional[CompiledTimetable] = None
+_day_views: "OrderedDict[date, CompiledTimetable]" = OrderedDict()
+
+
+def get_compiled_timetable() -> CompiledTimetable:
+    """Zwraca skompilowaną tablicę połączeń, kompilując ją przy pierwszym użyciu"""
+    global _compiled
+    if _compiled is None:
+        _compiled = compile_timetable(get_timetable_store())
+        _day_views.clear()
+    return _compiled
+
+
+def rebuild_compiled_timetable() -> CompiledTimetable:
+    """Kompiluje tablicę połączeń od nowa (np. po zmianie linii)"""
+    global _compiled
+    _compiled = compile_timetable(get_timetable_store())
+    _day_views.clear()
+    return _compiled
+
+
+def timetable_for_date(service_date: Optional[date]) -> CompiledTimetable:
+    """Tablica połączeń kursów jadących w danym dniu; None (lub brak kalendarzy) - wszystkie kursy"""
+    tt = get_compiled_timetable()
+    service_days = get_service_days()
+    if service_date is None or not len(service_days):
+        return tt
+    view = _day_views.get(service_date)
+    if view is None:
+        view = _day_views[service_date] = _day_view(tt, service_days, service_date)
+        while len(_day_views) > DAY_CACHE_SIZE:
+            _day_views.popitem(last=False)
+    else:
+        _day_views.move_to_end(service_date)
+    return view
+
+
+def find_journey(start_id: int, end_id: int, start_seconds: int, penalty: Optional[Sequence[int]] = None,
+                 service_date: Optional[date] = None) -> Optional[List[Leg]]:
+    """Znajduje najwcześniejszy przyjazd algorytmem CSA i zwraca odcinki podróży.
+
+    penalty to kary krawędzi indeksowane slotem (EdgeOverlay.penalty): sekundy
+    opóźnienia kursu od tej krawędzi (także dla wsiadających dalej) albo
+    BLOCKED. Przesiadać się można też na pobliskie przystanki dojściami
+    z grafu pieszego (footpaths), zwracanymi jako odcinki WalkLeg.
+    service_date ogranicza rozkład do kursów jadących w tym dniu.
+    """
+    if start_id == end_id:
+        return []
+
+    tt = timetable_for_date(service_date)
+    footpaths = _footpaths()
+    rides: Dict[int, Tuple[int, int]] = {}
+    if penalty is not None:
+        in_connection = _scan_with_penalty(tt, start_id, end_id, start_seconds, penalty, footpaths, rides=rides)
+    else:
+        in_connection = _scan(tt, start_id, end_id, start_seconds, footpaths, rides=rides)
+
+    if end_id not in in_connection:
+        return None
+
+    return add_walk_legs(start_id, end_id, _reconstruct_legs(tt, start_id, end_id, in_connection, rides), footpaths)
+
+
+def find_journeys(start_id: int, end_ids: Iterable[int], start_seconds: int,
+                  service_date: Optional[date] = None) -> Dict[int, Optional[List[Leg]]]:
+    """Jeden przebieg CSA z jednego startu do wielu celów; cel -> odcinki podróży albo None"""
+    targets = set(end_ids)
+    tt = timetable_for_date(service_date)
+    footpaths = _footpaths()
+    rides: Dict[int, Tuple[int, int]] = {}
+    in_connection = _scan_to_all(tt, start_id, targets - {start_id}, start_seconds, footpaths, rides=rides)
+    return {
+        end_id: [] if end_id == start_id else
+        add_walk_legs(start_id, end_id, _reconstruct_legs(tt, start_id, end_id, in_connection, rides), footpaths)
+        if end_id in in_connection else None
+        for end_id in targets
+    }
+
+
+def find_journeys_range(start_id: int, end_ids: Iterable[int], start_times: Iterable[int],
+                        service_date: Optional[date] = None) -> Dict[int, Dict[int, Optional[List[Leg]]]]:
+    """Wyszukiwanie zakresowe z jednego startu do wielu celów: czas startu -> cel -> odcinki albo None.
+
+    Przebiegi CSA idą od najpóźniejszego startu (jak rRAPTOR) i dziedziczą
+    przyjazdy poprzedniego przebiegu: wcześniejszy start może je tylko
+    poprawić, więc przebieg (_rescan_to_all) wsiada jedynie tam, gdzie coś
+    poprawił, i kończy się, gdy poprawa nie może już sięgnąć dalej - zamiast
+    przeglądać resztę dnia dla celów nieosiągalnych.
+    """
+    targets = set(end_ids)
+    tt = timetable_for_date(service_date)
+    footpaths = _footpaths()
+    earliest: Dict[int, int] = {}
+    ridden: Dict[int, int] = {}  # przystanek -> najwcześniejszy przyjazd kursem (zob. _walk_from)
+    in_connection: Dict[int, Tuple[int, int]] = {}
+    rides: Dict[int, Tuple[int, int]] = {}
+    results: Dict[int, Dict[int, Optional[List[Leg]]]] = {}
+    for start_seconds in sorted(set(start_times), reverse=True):
+        if earliest:
+            _rescan_to_all(tt, start_id, targets - {start_id}, start_seconds, footpaths, earliest, ridden,
+                           in_connection, rides)
+        else:
+            in_connection = _scan_to_all(tt, start_id, targets - {start_id}, start_seconds, footpaths, earliest,
+                                         ridden, rides)
+        results[start_seconds] = {
+            end_id: [] if end_id == start_id else
+            add_walk_legs(start_id, end_id, _reconstruct_legs(tt, start_id, end_id, in_connection, rides), footpaths)
+            if end_id in in_connection else None
+            for end_id in targets
+        }
+    return results
+
+
+def add_walk_legs(start_id: int, end_id: int, legs: List[JourneyLeg],
+                  footpaths: Optional[FootpathGraph] = None) -> List[Leg]:
+    """Wstawia dojścia piesze tam, gdzie kolejny odcinek nie zaczyna się w miejscu poprzedniego.
+
+    Dotyczy też dojścia ze startu do pierwszego kursu i z ostatniego kursu do
+    celu, więc podróż tylko pieszo to jeden WalkLeg, a nie pusta lista.
+    """
+    footpaths = footpaths or get_footpath_graph()
+    result: List[Leg] = []
+    at = start_id
+    for leg in legs:
+        if leg.stop_ids[0] != at:
+            result.append(_walk_leg(footpaths, at, leg.stop_ids[0]))
+        result.append(leg)
+        at = leg.stop_ids[-1]
+    if at != end_id:
+        result.append(_walk_leg(footpaths, at, end_id))
+    return result
+
+
+def _walk_leg(footpaths: FootpathGraph, from_stop: int, to_stop: int) -> WalkLeg:
+    for neighbour, distance_m, seconds in footpaths.neighbours(from_stop):
+        if neighbour == to_stop:
+            return WalkLeg(from_stop, to_stop, distance_m, seconds)
+    raise ValueError(f"No footpath from stop {from_stop} to stop {to_stop}")
+
+
+def leg_times(legs: List[Leg], start_seconds: int) -> List[Tuple[int, int]]:
+    """(odjazd, przyjazd) każdego odcinka w sekundach od północy.
+
+    Dojście przed pierwszym kursem zaczyna się najpóźniej, jak się da (tuż
+    na odjazd kursu), inne dojścia - zaraz po przyjeździe poprzedniego odcinka,
+    a podróż tylko pieszo - o start_seconds.
+    """
+    times: List[Optional[Tuple[int, int]]] = [
+        (leg.departure, leg.arrival) if isinstance(leg, JourneyLeg) else None for leg in legs
+    ]
+    for i, leg in enumerate(legs):
+        if times[i] is not None:
+            continue
+        if i > 0:
+            departure = times[i - 1][1]
+        elif i + 1 < len(legs):
+            departure = times[i + 1][0] - leg.seconds
+        else:
+            departure = start_seconds
+        times[i] = (departure, departure + leg.seconds)
+    return times
+
+
+def _scan_to_all(tt: CompiledTimetable, start_id: int, targets: set, start_seconds: int,
+                 footpaths: Optional[FootpathGraph] = None, earliest: Optional[Dict[int, int]] = None,
+                 ridden: Optional[Dict[int, int]] = None, rides: Optional[Dict[int, Tuple[int, int]]] = None
+                 ) -> Dict[int, Tuple[int, int]]:
+    """Przebieg CSA jak _scan, kończony dopiero, gdy żaden cel nie może już przyjechać wcześniej"""
+    earliest = earliest if earliest is not None else {}
+    ridden = ridden if ridden is not None else {}
+    rides = rides if rides is not None else {}
+    earliest[start_id] = start_seconds
+    boarded: Dict[int, int] = {}
+    in_connection: Dict[int, Tuple[int, int]] = {}
+    remaining = set(targets)
+    bound = INF  # najpóźniejszy przyjazd do celów, gdy wszystkie już osiągnięto
+    if footpaths is not None:
+        remaining.difference_update(_walk_from(footpaths, start_id, start_seconds, earliest, in_connection))
+
+    for c in range(bisect_left(tt.dep_time, start_seconds), len(tt)):
+        if tt.dep_time[c] >= bound:
+            break
+
+        trip = tt.trip[c]
+        if trip not in boarded:
+            if earliest.get(tt.dep_stop[c], INF) > tt.dep_time[c]:
+                continue
+            boarded[trip] = c
+
+        arr_stop = tt.arr_stop[c]
+        if tt.arr_time[c] < ridden.get(arr_stop, INF):
+            ridden[arr_stop] = tt.arr_time[c]
+            if tt.arr_time[c] < earliest.get(arr_stop, INF):
+                earliest[arr_stop] = tt.arr_time[c]
+                in_connection[arr_stop] = (boarded[trip], c)
+            if remaining:
+                remaining.discard(arr_stop)
+                if footpaths is not None:
+                    rides[arr_stop] = (boarded[trip], c)
+                    remaining.difference_update(_walk_from(footpaths, arr_stop, tt.arr_time[c], earliest, in_connection))
+                if not remaining and targets:
+                    bound = max(earliest[target] for target in targets)
+            elif footpaths is not None:
+                rides[arr_stop] = (boarded[trip], c)
+                _walk_from(footpaths, arr_stop, tt.arr_time[c], earliest, in_connection)
+
+    return in_connection
+
+
+def _rescan_to_all(tt: CompiledTimetable, start_id: int, targets: set, start_seconds: int,
+                   footpaths: Optional[FootpathGraph], earliest: Dict[int, int], ridden: Dict[int, int],
+                   in_connection: Dict[int, Tuple[int, int]], rides: Dict[int, Tuple[int, int]]):
+    """Przebieg _scan_to_all dla wcześniejszego startu, poprawiający wynik przebiegu z późniejszego.
+
+    earliest, ridden, in_connection i rides zostały po późniejszym starcie; te przyjazdy są
+    osiągalne także teraz, więc przebieg tylko je poprawia. Do kursu wsiada się
+    wyłącznie na przystanku poprawionym w tym przebiegu i przed jego dawnym
+    przyjazdem - później ten sam kurs przejrzał już przebieg późniejszy. Gdy
+    odjazdy miną dawne przyjazdy poprawionych przystanków i ostatnie odjazdy
+    kursów, do których wsiedliśmy, nic się już nie zmieni i przebieg się kończy.
+    """
+    last_departure = _trip_last_departures(tt)
+    old = {start_id: earliest.get(start_id, INF)}  # przystanek poprawiony w tym przebiegu -> dawny przyjazd
+    horizon = old[start_id]  # po tym odjeździe przebieg niczego już nie poprawi
+    earliest[start_id] = start_seconds
+    boarded: Dict[int, int] = {}
+    remaining = {target for target in targets if target not in earliest}
+    bound = max((earliest[target] for target in targets), default=INF) if not remaining else INF
+
+    def walk_on(stop_id: int, arrival: int):
+        """Dojścia z przystanku; przystanki poprawione przez nie zapamiętują dawny przyjazd"""
+        nonlocal horizon
+        before = {neighbour: earliest.get(neighbour, INF) for neighbour, _ in footpaths.walks(stop_id)}
+        for improved_id in _walk_from(footpaths, stop_id, arrival, earliest, in_connection):
+            if improved_id not in old:
+                old[improved_id] = before[improved_id]
+                horizon = max(horizon, old[improved_id])
+            remaining.discard(improved_id)
+
+    remaining.discard(start_id)
+    if footpaths is not None:
+        walk_on(start_id, start_seconds)
+    for c in range(bisect_left(tt.dep_time, start_seconds), len(tt)):
+        dep = tt.dep_time[c]
+        if dep >= bound or dep > horizon:
+            break
+
+        trip = tt.trip[c]
+        if trip not in boarded:
+            dep_stop = tt.dep_stop[c]
+            if earliest.get(dep_stop, INF) > dep or old.get(dep_stop, -1) <= dep:
+                continue
+            boarded[trip] = c
+            horizon = max(horizon, last_departure[trip])
+
+        arr_stop = tt.arr_stop[c]
+        if tt.arr_time[c] < ridden.get(arr_stop, INF):
+            ridden[arr_stop] = tt.arr_time[c]
+            had_remaining = bool(remaining)
+            previous = earliest.get(arr_stop, INF)
+            if tt.arr_time[c] < previous:
+                earliest[arr_stop] = tt.arr_time[c]
+                in_connection[arr_stop] = (boarded[trip], c)
+                old.setdefault(arr_stop, previous)
+                horizon = max(horizon, old[arr_stop])
+                remaining.discard(arr_stop)
+            if footpaths is not None:
+                rides[arr_stop] = (boarded[trip], c)
+                walk_on(arr_stop, tt.arr_time[c])
+            if had_remaining and not remaining and targets:
+                bound = max(earliest[target] for target in targets)
+
+
+_last_departures: "WeakKeyDictionary[CompiledTimetable, List[int]]" = WeakKeyDictionary()
+
+
+def _trip_last_departures(tt: CompiledTimetable) -> List[int]:
+    """Kurs -> odjazd jego ostatniego połączenia (liczone raz na tablicę połączeń)"""
+    last = _last_departures.get(tt)
+    if last is None:
+        values = np.full(len(tt.trips), -1, dtype=np.int64)
+        if tt.columns:
+            np.maximum.at(values, tt.columns[4], tt.columns[0])
+        last = _last_departures[tt] = values.tolist()
+    return last
+
+
+def earliest_arrivals(sources: Dict[int, int], until_seconds: int,
+                      service_date: Optional[date] = None) -> Dict[int, int]:
+    """CSA jeden-do-wszystkich: najwcześniejszy przyjazd na każdy osiągalny przystanek.
+
+    sources to przystanki startowe z czasem, od którego można z nich odjechać
+    (np. po dojściu pieszym). Przebieg kończy się na połączeniach odjeżdżających
+    po until_seconds; zwraca przystanek -> sekundy przyjazdu (razem ze startowymi).
+    """
+    earliest = dict(sources)
+    if not sources:
+        return earliest
+
+    tt = timetable_for_date(service_date)
+    footpaths = _footpaths()
+    if footpaths is not None:
+        for stop_id, ready in sources.items():
+            _walk_from(footpaths, stop_id, ready, earliest)
+    dep_time, arr_time, dep_stop, arr_stop, trip_of = tt.dep_time, tt.arr_time, tt.dep_stop, tt.arr_stop, tt.trip
+    boarded = set()
+    ridden: Dict[int, int] = {}
+    for c in range(bisect_left(dep_time, min(sources.values())), bisect_right(dep_time, until_seconds)):
+        if trip_of[c] not in boarded:
+            if earliest.get(dep_stop[c], INF) > dep_time[c]:
+                continue
+            boarded.add(trip_of[c])
+        if arr_time[c] < ridden.get(arr_stop[c], INF):
+            ridden[arr_stop[c]] = arr_time[c]
+            if arr_time[c] < earliest.get(arr_stop[c], INF):
+                earliest[arr_stop[c]] = arr_time[c]
+            if footpaths is not None:
+                _walk_from(footpaths, arr_stop[c], arr_time[c], earliest)
+    return earliest
+
+
+def _footpaths() -> Optional[FootpathGraph]:
+    """Graf dojść pieszych albo None, gdy nie ma żadnych (pętle pomijają wtedy dojścia)"""
+    footpaths = get_footpath_graph()
+    return footpaths if len(footpaths) else None
+
+
+def _walk_from(footpaths: FootpathGraph, stop_id: int, arrival: int, earliest: Dict[int, int],
+               in_connection: Optional[Dict[int, Tuple[int, int]]] = None) -> List[int]:
+    """Dojścia piesze z przystanku, do którego poprawił się przyjazd kursem (dojść się nie łączy).
+
+    Przyjazdy kursem (ridden) liczy się osobno od earliest: późniejszy przejazd
+    na przystanek, na który wcześniej da się dojść, nadal może dać dojście
+    dalej. Zwraca przystanki, do których dojście poprawiło przyjazd.
+    """
+    improved = []
+    for neighbour, seconds in footpaths.walks(stop_id):
+        if arrival + seconds < earliest.get(neighbour, INF):
+            earliest[neighbour] = arrival + seconds
+            if in_connection is not None:
+                in_connection[neighbour] = (WALK, stop_id)
+            improved.append(neighbour)
+    return improved
+
+
+def _scan(tt: CompiledTimetable, start_id: int, end_id: int, start_seconds: int,
+          footpaths: Optional[FootpathGraph] = None, earliest: Optional[Dict[int, int]] = None,
+          rides: Optional[Dict[int, Tuple[int, int]]] = None) -> Dict[int, Tuple[int, int]]:
+    """Przebieg CSA po rozkładzie; zwraca przystanek -> (połączenie wejścia, połączenie wyjścia).
+
+    W earliest (jeśli podany) zostają najwcześniejsze przyjazdy na przystanki,
+    a w rides (przy dojściach) przejazdy z najwcześniejszym przyjazdem kursem.
+    """
+    earliest = earliest if earliest is not None else {}
+    rides = rides if rides is not None else {}
+    earliest[start_id] = start_seconds
+    ridden: Dict[int, int] = {}  # przystanek -> najwcześniejszy przyjazd kursem (nie pieszo)
+    boarded: Dict[int, int] = {}  # kurs -> indeks połączenia, w którym wsiadamy
+    in_connection: Dict[int, Tuple[int, int]] = {}  # przystanek -> (wejście, wyjście) albo (WALK, skąd)
+    if footpaths is not None:
+        _walk_from(footpaths, start_id, start_seconds, earliest, in_connection)
+
+    for c in range(bisect_left(tt.dep_time, start_seconds), len(tt)):
+        dep = tt.dep_time[c]
+        if dep >= earliest.get(end_id, INF):
+            break
+
+        trip = tt.trip[c]
+        if trip not in boarded:
+            if earliest.get(tt.dep_stop[c], INF) > dep:
+                continue
+            boarded[trip] = c
+
+        arr_stop = tt.arr_stop[c]
+        if tt.arr_time[c] < ridden.get(arr_stop, INF):
+            ridden[arr_stop] = tt.arr_time[c]
+            if tt.arr_time[c] < earliest.get(arr_stop, INF):
+                earliest[arr_stop] = tt.arr_time[c]
+                in_connection[arr_stop] = (boarded[trip], c)
+            if footpaths is not None:
+                rides[arr_stop] = (boarded[trip], c)
+                _walk_from(footpaths, arr_stop, tt.arr_time[c], earliest, in_connection)
+
+    return in_connection
+
+
+def _scan_with_penalty(tt: CompiledTimetable, start_id: int, end_id: int, start_seconds: int,
+                       penalty: Sequence[int], footpaths: Optional[FootpathGraph] = None,
+                       earliest: Optional[Dict[int, int]] = None,
+                       rides: Optional[Dict[int, Tuple[int, int]]] = None) -> Dict[int, Tuple[int, int]]:
+    """Przebieg CSA z karami krawędzi.
+
+    Kara krawędzi to opóźnienie kursu: od połączenia z karą kurs odjeżdża
+    i przyjeżdża później na wszystkich dalszych przystankach, także gdy kara
+    przypada przed wejściem pasażera albo przed start_seconds (opóźnienie
+    liczone jest z krawędzi kursu, nie z przejechanych połączeń). Połączeniem
+    po zablokowanej krawędzi nie da się jechać, więc trzeba wysiąść przed nią;
+    za nią kurs jedzie planowo i można do niego wsiąść ponownie.
+    Przebieg zaczyna się o sumę kar wcześniej, by złapać opóźnione kursy
+    z planowym odjazdem przed startem. Połączenia przeglądane są w kolejności
+    planowych odjazdów, więc przesiadka na opóźniony kurs z przyjazdem po
+    jego planowym odjeździe jest pomijana (wynik jest osiągalny, najwyżej
+    nieco późniejszy). Kary tylko opóźniają przyjazdy, więc kończenie
+    przebiegu po planowym odjeździe późniejszym niż przyjazd do celu pozostaje poprawne.
+    earliest i rides jak w _scan.
+    """
+    earliest = earliest if earliest is not None else {}
+    rides = rides if rides is not None else {}
+    earliest[start_id] = start_seconds
+    ridden: Dict[int, int] = {}
+    boarded: Dict[int, int] = {}
+    in_connection: Dict[int, Tuple[int, int]] = {}
+    if footpaths is not None:
+        _walk_from(footpaths, start_id, start_seconds, earliest, in_connection)
+
+    delays = _trip_delays(tt, penalty)  # kurs -> opóźnienie przed każdym połączeniem (tylko kursy z karami)
+    lookback = max((max(delay) for delay in delays.values()), default=0)
+    for c in range(bisect_left(tt.dep_time, start_seconds - lookback), len(tt)):
+        dep = tt.dep_time[c]
+        if dep >= earliest.get(end_id, INF):
+            break
+
+        trip = tt.trip[c]
+        cost = penalty[tt.edge[c]]
+        if cost == BLOCKED:
+            boarded.pop(trip, None)
+            continue
+
+        late = 0
+        if delays:
+            delay = delays.get(trip)
+            if delay is not None:
+                late = delay[tt.seq[c]]
+        if trip not in boarded:
+            if earliest.get(tt.dep_stop[c], INF) > dep + late:
+                continue
+            boarded[trip] = c
+
+        arrival = tt.arr_time[c] + late + cost
+        arr_stop = tt.arr_stop[c]
+        if arrival < ridden.get(arr_stop, INF):
+            ridden[arr_stop] = arrival
+            if arrival < earliest.get(arr_stop, INF):
+                earliest[arr_stop] = arrival
+                in_connection[arr_stop] = (boarded[trip], c)
+            if footpaths is not None:
+                rides[arr_stop] = (boarded[trip], c)
+                _walk_from(footpaths, arr_stop, arrival, earliest, in_connection)
+
+    return in_connection
+
+
+def _trip_delays(tt: CompiledTimetable, penalty: Sequence[int]) -> Dict[int, List[int]]:
+    """Opóźnienia kursów wariantów z karami: suma kar wcześniejszych krawędzi od ostatniej zablokowanej"""
+    delays: Dict[int, List[int]] = {}
+    for first_trip, n_trips, slots in tt.patterns:
+        if not any(penalty[slot] for slot in slots):
+            continue
+        delay = []
+        late = 0
+        for slot in slots:
+            delay.append(late)
+            cost = penalty[slot]
+            late = 0 if cost == BLOCKED else late + cost
+        if any(delay):
+            for trip in range(first_trip, first_trip + n_trips):
+                delays[trip] = delay
+    return delays
+
+
+def find_profile(start_id: int, end_id: int, from_seconds: int, to_seconds: int, limit: Optional[int] = None,
+                 service_date: Optional[date] = None, penalty: Optional[Sequence[int]] = None
+                 ) -> List[Tuple[ProfileEntry, List[Leg]]]:
+    """Profil CSA: wszystkie niezdominowane pary (odjazd, przyjazd) z odjazdem w oknie.
+
+    Jeden przebieg po połączeniach od najpóźniejszego buduje dla każdego
+    przystanku listę par (odjazd, najwcześniejszy przyjazd do celu) - później
+    odjeżdżająca para z nie późniejszym przyjazdem dominuje wcześniejsze. Dla
+    każdego kursu trzymany jest najlepszy przyjazd, gdy się w nim siedzi.
+    Przebieg zaczyna się od połączeń przed najwcześniejszym przyjazdem przy
+    starcie na końcu okna, bo żadna podróż z okna nie przyjedzie później.
+    Pary startu porównywane są tylko z odjazdami z okna, a połączenia, do
+    których nie da się dotrzeć ze startu w oknie (przebieg w przód), są pomijane.
+    Jak find_journey: przesiadki, dojście ze startu i do celu mogą iść grafem
+    pieszym (footpaths), a penalty to kary krawędzi jako opóźnienia kursów
+    (połączenia przeglądane są wtedy po odjazdach z opóźnieniem).
+    Zwraca pary rosnąco po odjeździe, z odcinkami podróży.
+    """
+    if start_id == end_id:
+        return []
+
+    tt = timetable_for_date(service_date)
+    footpaths = _footpaths()
+    delays = _trip_delays(tt, penalty) if penalty is not None else {}
+    lookback = max((max(delay) for delay in delays.values()), default=0)
+    latest: Dict[int, int] = {}
+    if penalty is not None:
+        _scan_with_penalty(tt, start_id, end_id, to_seconds, penalty, footpaths, latest)
+    else:
+        _scan(tt, start_id, end_id, to_seconds, footpaths, latest)
+    scan_end = bisect_right(tt.dep_time, latest[end_id]) if end_id in latest else len(tt)
+    first = bisect_left(tt.dep_time, from_seconds - lookback)
+    connections, dep_time, arr_time, trip_of = _profile_connections(tt, first, scan_end, penalty, delays)
+    dep_stop, arr_stop = tt.dep_stop, tt.arr_stop
+
+    # Dojścia piesze ze startu i do celu: przystanek -> czas (graf dojść jest symetryczny)
+    access = dict(footpaths.walks(start_id)) if footpaths is not None else {}
+    egress = dict(footpaths.walks(end_id)) if footpaths is not None else {}
+
+    profiles: Dict[int, Tuple[List[int], List[ProfileEntry]]] = {}  # przystanek -> (ujemne odjazdy, pary)
+    seated: Dict[int, Tuple[int, int]] = {}  # kurs -> (przyjazd do celu, połączenie wyjścia)
+    via: Dict[int, Optional[Tuple[int, int]]] = {}  # połączenie wyjścia -> (przystanek, czas) dalszej jazdy
+    window: List[ProfileEntry] = []  # pary startu z odjazdem w oknie
+
+    # Przebieg w przód: najwcześniejsze dotarcie do przystanków przy starcie na początku okna
+    reached = {start_id: from_seconds}
+    if footpaths is not None:
+        _walk_from(footpaths, start_id, from_seconds, reached)
+    boarded = set()
+    ridden: Dict[int, int] = {}
+    for i, c in enumerate(connections):
+        if trip_of[i] not in boarded:
+            if reached.get(dep_stop[c], INF) > dep_time[i]:
+                continue
+            boarded.add(trip_of[i])
+        if arr_time[i] < ridden.get(arr_stop[c], INF):
+            ridden[arr_stop[c]] = arr_time[i]
+            if arr_time[i] < reached.get(arr_stop[c], INF):
+                reached[arr_stop[c]] = arr_time[i]
+            if footpaths is not None:
+                _walk_from(footpaths, arr_stop[c], arr_time[i], reached)
+
+    for i in range(len(connections) - 1, -1, -1):
+        c = connections[i]
+        departure = dep_time[i]
+        if reached.get(dep_stop[c], INF) > departure:
+            continue  # połączenie nieosiągalne z okna
+        arrival = arr_time[i]
+        stop_id = arr_stop[c]
+
+        # Wyjście tutaj: cel (wprost albo pieszo) lub najlepsza para z przystanku albo z dojścia pieszego
+        best, then = INF, None
+        if stop_id == end_id:
+            best = arrival
+        elif stop_id in egress:
+            best = arrival + egress[stop_id]
+        transfers = [(stop_id, arrival)]
+        if footpaths is not None and stop_id != end_id:
+            transfers.extend((neighbour, arrival + seconds) for neighbour, seconds in footpaths.walks(stop_id))
+        for transfer_stop, ready in transfers:
+            profile = profiles.get(transfer_stop)
+            if profile is not None:
+                j = bisect_right(profile[0], -ready) - 1
+                if j >= 0 and profile[1][j].arrival < best:
+                    best, then = profile[1][j].arrival, (transfer_stop, ready)
+        if best < INF:
+            via[c] = then
+        alight = c
+
+        stay = seated.get(trip_of[i])
+        if stay is not None and stay[0] <= best:
+            best, alight = stay  # przy remisie zostaje się w kursie zamiast przesiadać do niego samego
+        if best == INF:
+            continue
+
+        if stay is None or best < stay[0]:
+            seated[trip_of[i]] = (best, alight)
+        entry = ProfileEntry(departure, best, c, alight)
+        _add_profile_entry(profiles.setdefault(dep_stop[c], ([], [])), entry)
+        # Na starcie liczą się tylko odjazdy z okna - późniejsze nie dominują
+        if dep_stop[c] == start_id and from_seconds <= departure <= to_seconds:
+            window.append(entry)
+        elif dep_stop[c] in access and from_seconds <= departure - access[dep_stop[c]] <= to_seconds:
+            window.append(entry._replace(departure=departure - access[dep_stop[c]]))
+
+    # Dojścia ze startu zmieniają kolejność odjazdów, więc pary okna filtruje się na końcu
+    start_profile: Tuple[List[int], List[ProfileEntry]] = ([], [])
+    for entry in sorted(window, key=lambda entry: (-entry.departure, entry.arrival)):
+        _add_profile_entry(start_profile, entry)
+    entries = start_profile[1][::-1][:limit]
+    return [(entry, add_walk_legs(start_id, end_id, _reconstruct_profile_legs(tt, entry, profiles, via), footpaths))
+            for entry in entries]
+
+
+def _profile_connections(tt: CompiledTimetable, first: int, end: int, penalty: Optional[Sequence[int]],
+                         delays: Dict[int, List[int]]) -> Tuple[List[int], List[int], List[int], List[int]]:
+    """Połączenia first:end profilu: (indeksy, odjazdy, przyjazdy, kursy) w kolejności odjazdów.
+
+    Z karami czasy zawierają opóźnienia kursów, połączenia po zablokowanych
+    krawędziach odpadają, a część kursu za blokadą liczy się jak osobny kurs
+    (nie da się w nim przesiedzieć blokady). Kolejność to wtedy odjazdy
+    z opóźnieniem, więc przebiegi profilu pozostają poprawne.
+    """
+    if penalty is None:
+        return list(range(first, end)), tt.dep_time[first:end], tt.arr_time[first:end], tt.trip[first:end]
+
+    runs = _trip_runs(tt, penalty)
+    n_trips = len(tt.trips)
+    rows = []
+    for c in range(first, end):
+        cost = penalty[tt.edge[c]]
+        if cost == BLOCKED:
+            continue
+        trip, seq = tt.trip[c], tt.seq[c]
+        late = delays[trip][seq] if trip in delays else 0
+        run = trip + n_trips * runs[trip][seq] if trip in runs else trip
+        rows.append((tt.dep_time[c] + late, tt.arr_time[c] + late + cost, run, seq, c))
+    rows.sort()
+    return [row[4] for row in rows], [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+
+def _trip_runs(tt: CompiledTimetable, penalty: Sequence[int]) -> Dict[int, List[int]]:
+    """Kursy z zablokowanymi krawędziami: liczba blokad przed każdym połączeniem"""
+    runs: Dict[int, List[int]] = {}
+    for first_trip, n_trips, slots in tt.patterns:
+        if BLOCKED not in (penalty[slot] for slot in slots):
+            continue
+        blocks = []
+        count = 0
+        for slot in slots:
+            blocks.append(count)
+            count += penalty[slot] == BLOCKED
+        for trip in range(first_trip, first_trip + n_trips):
+            runs[trip] = blocks
+    return runs
+
+
+def _add_profile_entry(profile: Tuple[List[int], List[ProfileEntry]], entry: ProfileEntry):
+    """Dopisuje parę do profilu (odjazdy malejąco), jeśli późniejsza para jej nie dominuje"""
+    departures, entries = profile
+    if entries and entries[-1].arrival <= entry.arrival:
+        return
+    if entries and entries[-1].departure == entry.departure:
+        entries[-1] = entry
+    else:
+        departures.append(-entry.departure)
+        entries.append(entry)
+
+
+def _reconstruct_profile_legs(tt: CompiledTimetable, entry: ProfileEntry,
+                              profiles: Dict[int, Tuple[List[int], List[ProfileEntry]]],
+                              via: Dict[int, Optional[Tuple[int, int]]]) -> List[JourneyLeg]:
+    """Odtwarza odcinki podróży pary profilu, idąc po przesiadkach zapisanych przy połączeniach wyjścia"""
+    legs = []
+    while True:
+        trip = tt.trip[entry.board]
+        line, schedule = tt.trips[trip]
+        legs.append(JourneyLeg(line=line, schedule=schedule,
+                               stop_ids=tt.trip_stops[trip][tt.seq[entry.board]:tt.seq[entry.alight] + 2],
+                               departure=tt.dep_time[entry.board], arrival=tt.arr_time[entry.alight]))
+        then = via[entry.alight]
+        if then is None:
+            return legs
+        stop_id, ready = then
+        departures, entries = profiles[stop_id]
+        entry = entries[bisect_right(departures, -ready) - 1]
+
+
+def _reconstruct_legs(tt: CompiledTimetable, start_id: int, end_id: int,
+                      in_connection: Dict[int, Tuple[int, int]],
+                      rides: Optional[Dict[int, Tuple[int, int]]] = None) -> List[JourneyLeg]:
+    """Odtwarza odcinki podróży od celu do startu.
+
+    Z rides po dojściu pieszym bierze się przejazd na przystanek, z którego
+    się szło (in_connection może tam wskazywać wcześniejsze dojście).
+    """
+    legs = []
+    stop_id = end_id
+    walked = False
+    while stop_id != start_id:
+        board, alight = rides[stop_id] if walked and rides is not None else in_connection[stop_id]
+        walked = board == WALK
+        if walked:
+            stop_id = alight
+            continue
+        trip = tt.trip[board]
+        line, schedule = tt.trips[trip]
+        stop_ids = tt.trip_stops[trip][tt.seq[board]:tt.seq[alight] + 2]
+        legs.append(JourneyLeg(line=line, schedule=schedule, stop_ids=stop_ids,
+                               departure=tt.dep_time[board], arrival=tt.arr_time[alight]))
+        stop_id = tt.dep_stop[board]
+    legs.reverse()
+    return legs
@@ -0,0 +1,80 @@
+from typing import Dict, FrozenSet, Iterable, Optional, Sequence, Set, Tuple
+import asyncio
+import json
+
+# Ile ramek może czekać na wolnego klienta, zanim zostanie rozłączony
+SUBSCRIBER_QUEUE_SIZE = 256
+
+BoundingBox = Tuple[float, float, float, float]  # min_lat, min_lon, max_lat, max_lon
+
+
+class Subscription:
+    """Subskrypcja strumienia zmian, opcjonalnie zawężona do linii i/lub prostokąta"""
+
+    def __init__(self, line_ids: Optional[FrozenSet[int]] = None, bbox: Optional[BoundingBox] = None,
+                 queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.line_ids = line_ids
+        self.bbox = bbox
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagging = False
+
+    def matches(self, line_ids: FrozenSet[int], points: Sequence[Tuple[float, float]]) -> bool:
+        if self.line_ids is not None and not (self.line_ids & line_ids):
+            return False
+        if self.bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            if not any(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in points):
+                return False
+        return True
+
+
+class LiveHub:
+    """Rozgłasza zmiany (zdarzenia, pozycje pociągów) do subskrybentów strumienia.
+
+    Każda zmiana serializowana jest raz do gotowej ramki SSE, a potem tylko
+    wrzucana do kolejek pasujących subskrybentów. Klient, który nie nadąża
+    (pełna kolejka), jest oznaczany jako lagging i rozłączany - po ponownym
+    połączeniu pobiera aktualny stan zwykłymi endpointami.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscription] = set()
+        self.published = 0
+
+    def subscribe(self, line_ids: Optional[Iterable[int]] = None, bbox: Optional[BoundingBox] = None) -> Subscription:
+        subscription = Subscription(frozenset(line_ids) if line_ids is not None else None, bbox)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, kind: str, data: Dict[str, object], line_ids: Iterable[int] = (),
+                points: Sequence[Tuple[float, float]] = ()):
+        """Wysyła zmianę do subskrybentów, których filtry ją obejmują"""
+        if not self.subscribers:
+            return
+        frame = format_frame(kind, data)
+        line_ids = frozenset(line_ids)
+        self.published += 1
+        for subscription in list(self.subscribers):
+            if subscription.lagging or not subscription.matches(line_ids, points):
+                continue
+            try:
+                subscription.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                subscription.lagging = True
+
+
+def format_frame(kind: str, data: Dict[str, object]) -> bytes:
+    """Ramka Server-Sent Events z kompaktowym JSON-em"""
+    payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+    return f"event: {kind}\ndata: {payload}\n\n".encode("utf-8")
+
+
+_hub = LiveHub()
+
+
+def get_live_hub() -> LiveHub:
+    """Zwraca hub strumienia zmian bieżącego procesu"""
+    return _hub
@@ -0,0 +1,49 @@
+from repositiories.timetable_store import TimetableStore, rebuild_timetable_store
+from typing import Dict, Optional
+from repositiories.journey_planner import rebuild_compiled_timetable
+from repositiories.service_calendar import rebuild_service_days
+from repositiories.adjacency_index import adjacency_to_arrays, get_adjacency_index, rebuild_adjacency_index
+from repositiories.geo import rebuild_stop_coordinates
+from repositiories.spatial_index import get_spatial_index, rebuild_spatial_index
+from repositiories.footpaths import get_footpath_graph, rebuild_footpath_graph
+from repositiories.rider_index import rebuild_rider_index
+from repositiories.edge_overlay import rebuild_edge_overlay
+from repositiories.response_cache import rebuild_response_cache
+from repositiories.route_cache import rebuild_route_cache
+from repositiories.trip_transfers import rebuild_trip_transfers
+from repositiories.goal_directed import get_lower_bounds, rebuild_lower_bounds
+from repositiories.vehicle_simulation import rebuild_vehicle_simulation
+import numpy as np
+
+
+def rebuild_network_indexes(timetable_store: Optional[TimetableStore] = None,
+                            index_arrays: Optional[Dict[str, np.ndarray]] = None):
+    """Przebudowuje wszystkie indeksy sieci po wczytaniu lub zmianie linii.
+
+    Gotowy rozkład kolumnowy (np. z migawki) można przekazać zamiast budować go od nowa,
+    a tablice indeksów z migawki (network_index_arrays) - by je tylko odtworzyć.
+    """
+    rebuild_timetable_store(timetable_store)
+    rebuild_service_days()
+    rebuild_compiled_timetable()
+    rebuild_edge_overlay()
+    rebuild_adjacency_index(index_arrays)
+    rebuild_stop_coordinates()
+    rebuild_spatial_index(index_arrays)
+    rebuild_footpath_graph(index_arrays)
+    rebuild_lower_bounds(index_arrays)
+    rebuild_trip_transfers()
+    rebuild_rider_index()
+    rebuild_response_cache()
+    rebuild_route_cache()
+    rebuild_vehicle_simulation()
+
+
+def network_index_arrays() -> Dict[str, np.ndarray]:
+    """Tablice kosztownych indeksów bieżącej sieci (siatka, dojścia, sąsiedztwo, ALT) do migawki"""
+    return {
+        **adjacency_to_arrays(get_adjacency_index()),
+        **get_spatial_index().to_arrays(),
+        **get_footpath_graph().to_arrays(),
+        **get_lower_bounds().to_arrays(),
+    }
@@ -0,0 +1,264 @@
+from models.database_models import IncidentType, Notification
+from db.dicts import device_tokens, lines, notification_inboxes
+from repositiories.event_repository import register_shared_state_op, shared_state_writer
+from repositiories.rider_index import get_rider_index
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Ile ostatnich powiadomień trzyma skrzynka użytkownika
+INBOX_SIZE = int(os.environ.get("NOTIFICATION_INBOX_SIZE", "100"))
+# Kolejne alerty o tej samej krawędzi i typie zdarzenia w tym oknie są pomijane
+COALESCE_WINDOW = timedelta(seconds=int(os.environ.get("NOTIFICATION_COALESCE_SECONDS", "600")))
+QUEUE_SIZE = 10_000
+
+FCM_ENDPOINT = "https://fcm.googleapis.com/fcm/send"
+
+# (user_id, krawędź, typ) -> czas ostatniego alertu; wpisy starsze niż COALESCE_WINDOW są usuwane
+_last_alert: Dict[Tuple[int, int, str], datetime] = {}
+_pruned_at: Optional[datetime] = None
+
+
+class FanOut(NamedTuple):
+    """Zlecenie rozesłania alertu o zdarzeniu do pasażerów linii przez krawędź"""
+    edge_id: int
+    incident_type: IncidentType
+    title: str
+    exclude: FrozenSet[int]  # np. zgłaszający
+
+
+class NotificationBackend(ABC):
+    """Kanał dostarczania powiadomień poza skrzynkę w aplikacji"""
+
+    @abstractmethod
+    async def deliver(self, notifications: List[Notification]):
+        """Dostarcza partię powiadomień"""
+
+    async def close(self):
+        pass
+
+
+class LogBackend(NotificationBackend):
+    """Domyślny kanał: tylko zapis do logu"""
+
+    async def deliver(self, notifications: List[Notification]):
+        for notification in notifications:
+            logger.info("Notification for user %s: %s", notification.user_id, notification.message)
+
+
+class FcmBackend(NotificationBackend):
+    """Push przez FCM (legacy HTTP API - to samo wywołanie co pyfcm notify_single_device).
+
+    Adres można podmienić (FCM_ENDPOINT) na lokalną zaślepkę, np. fcm_stub.py.
+    """
+
+    def __init__(self, server_key: str, endpoint: str = FCM_ENDPOINT,
+                 token_of: Callable[[int], Optional[str]] = device_tokens.get, title: str = "Journey Radar"):
+        self.server_key = server_key
+        self.endpoint = endpoint
+        self.token_of = token_of
+        self.title = title
+        self._client = httpx.AsyncClient(timeout=5.0)
+
+    async def deliver(self, notifications: List[Notification]):
+        sends = [self._send(token, notification) for notification in notifications
+                 if (token := self.token_of(notification.user_id))]
+        await asyncio.gather(*sends)
+
+    async def _send(self, token: str, notification: Notification):
+        try:
+            response = await self._client.post(
+                self.endpoint,
+                headers={"Authorization": f"key={self.server_key}"},
+                json={"to": token, "notification": {"title": self.title, "body": notification.message}},
+            )
+            if response.status_code >= 400:
+                logger.warning("FCM rejected notification for user %s: %s %s",
+                               notification.user_id, response.status_code, response.text)
+        except httpx.HTTPError as e:
+            logger.warning("FCM delivery for user %s failed: %s", notification.user_id, e)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def _fcm_backend() -> NotificationBackend:
+    return FcmBackend(os.environ.get("FCM_SERVER_KEY", ""), os.environ.get("FCM_ENDPOINT", FCM_ENDPOINT))
+
+
+# Kanały wybierane przez NOTIFICATION_BACKEND; nowe można dopisać tutaj
+BACKENDS: Dict[str, Callable[[], NotificationBackend]] = {
+    "log": LogBackend,
+    "fcm": _fcm_backend,
+}
+
+
+def _apply_notify(record: dict):
+    notification = Notification.model_validate(record["notification"])
+    inbox = notification_inboxes.get(notification.user_id)
+    if inbox is None:
+        inbox = notification_inboxes[notification.user_id] = deque(maxlen=INBOX_SIZE)
+    inbox.append(notification)
+    if record.get("edge_id") is not None:
+        _last_alert[(notification.user_id, record["edge_id"], record["incident_type"])] = notification.timestamp
+
+
+def _apply_register_device(record: dict):
+    device_tokens[record["user_id"]] = record["token"]
+
+
+def _apply_last_alert(record: dict):
+    _last_alert[(record["user_id"], record["edge_id"], record["incident_type"])] = \
+        datetime.fromisoformat(record["timestamp"])
+
+
+def _dump_inboxes():
+    for inbox in notification_inboxes.values():
+        for notification in inbox:
+            yield {"notification": notification}
+
+
+def _dump_devices():
+    for user_id, token in device_tokens.items():
+        yield {"user_id": user_id, "token": token}
+
+
+def _dump_last_alerts():
+    for (user_id, edge_id, incident_type), timestamp in list(_last_alert.items()):
+        yield {"user_id": user_id, "edge_id": edge_id, "incident_type": incident_type,
+               "timestamp": timestamp.isoformat()}
+
+
+register_shared_state_op("notify", _apply_notify, _dump_inboxes)
+register_shared_state_op("register_device", _apply_register_device, _dump_devices)
+# Tylko w punkcie kontrolnym: okno łączenia alertów (wpisy notify niosą je same)
+register_shared_state_op("last_alert", _apply_last_alert, _dump_last_alerts)
+
+
+def _prune_last_alerts(now: datetime):
+    """Usuwa alerty spoza okna łączenia (najwyżej raz na okno, wywoływane pod blokadą dziennika)"""
+    global _pruned_at
+    if _pruned_at is not None and now - _pruned_at < COALESCE_WINDOW:
+        return
+    for key in [key for key, last in _last_alert.items() if now - last >= COALESCE_WINDOW]:
+        del _last_alert[key]
+    _pruned_at = now
+
+
+def get_inbox(user_id: int) -> List[Notification]:
+    """Powiadomienia użytkownika od najstarszego"""
+    return list(notification_inboxes.get(user_id, ()))
+
+
+def register_device(user_id: int, token: str):
+    """Zapisuje token urządzenia do powiadomień push"""
+    with shared_state_writer() as write:
+        write("register_device", user_id=user_id, token=token)
+
+
+class NotificationDispatcher:
+    """Rozsyła alerty w tle: żądanie tylko wrzuca zlecenie do kolejki.
+
+    Zadanie w tle wyznacza pasażerów z indeksu krawędź -> linie -> pasażerowie,
+    pomija alerty zduplikowane w oknie COALESCE_WINDOW, zapisuje powiadomienia
+    do skrzynek (przez dziennik, widoczny dla wszystkich workerów) i przekazuje
+    je do kanału dostarczania. Wyznaczanie i zapis (blokujący flock dziennika)
+    idą w wątku, by nie wstrzymywać pętli zdarzeń.
+    """
+
+    def __init__(self, backend: NotificationBackend):
+        self.backend = backend
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Kończy zlecenia z kolejki i zamyka kanał dostarczania"""
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            self._task = None
+        await self.backend.close()
+
+    def submit(self, job: FanOut) -> bool:
+        """Dodaje zlecenie bez czekania; False, gdy kolejka jest pełna"""
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Notification queue full, dropping alert for edge %s", job.edge_id)
+            return False
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                notifications = await asyncio.to_thread(self.fan_out, job)
+                if notifications:
+                    await self.backend.deliver(notifications)
+            except Exception:
+                logger.exception("Notification fan-out for edge %s failed", job.edge_id)
+            finally:
+                self._queue.task_done()
+
+    def fan_out(self, job: FanOut, now: Optional[datetime] = None) -> List[Notification]:
+        """Zapisuje powiadomienia dla pasażerów linii przez krawędź; zwraca nowe powiadomienia"""
+        now = now or datetime.now()
+        incident_type = job.incident_type.value
+        sent = []
+        with shared_state_writer() as write:
+            _prune_last_alerts(now)
+            for user_id, line_id in get_rider_index().riders_on_edge(job.edge_id):
+                if user_id in job.exclude:
+                    continue
+                last = _last_alert.get((user_id, job.edge_id, incident_type))
+                if last is not None and now - last < COALESCE_WINDOW:
+                    continue  # ten sam alert już dotarł niedawno
+                notification = Notification(
+                    user_id=user_id,
+                    message=f"New event reported on your route {lines[line_id].name}: {job.title}",
+                    timestamp=now,
+                )
+                write("notify", notification=notification, edge_id=job.edge_id, incident_type=incident_type)
+                sent.append(notification)
+        return sent
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def start_notifications(backend_name: Optional[str] = None) -> NotificationDispatcher:
+    """Uruchamia rozsyłanie powiadomień (kanał z NOTIFICATION_BACKEND, domyślnie log)"""
+    global _dispatcher
+    if _dispatcher is None:
+        backend_name = backend_name or os.environ.get("NOTIFICATION_BACKEND", "log")
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown notification backend {backend_name!r}, expected one of {', '.join(BACKENDS)}")
+        _dispatcher = NotificationDispatcher(BACKENDS[backend_name]())
+        _dispatcher.start()
+    return _dispatcher
+
+
+async def stop_notifications():
+    """Zatrzymuje rozsyłanie powiadomień po dokończeniu kolejki"""
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Zwraca uruchomiony dyspozytor powiadomień"""
+    if _dispatcher is None:
+        raise RuntimeError("Notifications are not started - call start_notifications() on startup")
+    return _dispatcher
@@ -0,0 +1,181 @@
+from models.database_models import Line, Schedule
+from repositiories.timetable_store import TimetableStore, get_timetable_store
+from repositiories.footpaths import FootpathGraph, get_footpath_graph
+from repositiories.journey_planner import WalkLeg
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from datetime import date
+import math
+import numpy as np
+
+# Maksymalna liczba przesiadek i długość dojść pieszych, o które można zapytać
+MAX_TRANSFERS = 6
+MAX_WALK_M = 2000
+# Ile etykiet (wariantów dotarcia) trzyma jeden przystanek
+MAX_BAG_SIZE = 8
+
+
+class RideLeg(NamedTuple):
+    """Odcinek jednym kursem"""
+    line: Line
+    schedule: Schedule
+    stop_ids: List[int]
+
+
+class ParetoJourney(NamedTuple):
+    """Podróż z zestawu Pareto: żadna inna nie jest lepsza we wszystkich kryteriach"""
+    arrival: int  # sekundy od północy
+    transfers: int
+    walk_m: int
+    legs: List[Union[RideLeg, WalkLeg]]
+
+
+class _Label(NamedTuple):
+    arrival: int
+    walk_m: int
+    transfers: int
+    parent: Optional["_Label"]
+    leg: Union[None, Tuple[int, int, int, int], WalkLeg]  # przejazd: (wariant, kurs, pozycja wejścia, pozycja wyjścia)
+
+
+def _dominates(a: _Label, b: _Label) -> bool:
+    return a.arrival <= b.arrival and a.transfers <= b.transfers and a.walk_m <= b.walk_m
+
+
+def _merge(bag: List[_Label], label: _Label) -> bool:
+    """Dodaje etykietę do worka, jeśli nic jej nie dominuje; usuwa zdominowane przez nią"""
+    for other in bag:
+        if _dominates(other, label):
+            return False
+    bag[:] = [other for other in bag if not _dominates(label, other)]
+    bag.append(label)
+    if len(bag) > MAX_BAG_SIZE:
+        # Ograniczony worek: odpada wariant z najpóźniejszym przyjazdem
+        worst = max(bag, key=lambda other: (other.arrival, other.walk_m))
+        bag.remove(worst)
+        return worst is not label
+    return True
+
+
+def find_pareto_journeys(start_id: int, end_id: int, start_seconds: int, max_transfers: int = 3,
+                         max_walk_m: int = 0, store: Optional[TimetableStore] = None,
+                         service_date: Optional[date] = None) -> List[ParetoJourney]:
+    """Wyszukiwanie wielokryterialne (McRAPTOR) po wariantach tras.
+
+    Runda k to przejazdy k kursami, więc liczba przesiadek wynika z rundy.
+    Przystanki trzymają ograniczone worki etykiet (przyjazd, przesiadki,
+    dojście piesze) z odcinaniem zdominowanych, także przez etykiety celu.
+    max_walk_m > 0 dopuszcza dojścia piesze z grafu dojść (footpaths) do
+    pobliskich przystanków (po przejeździe lub na starcie), łącznie do
+    max_walk_m, i dodaje ich długość jako trzecie kryterium. service_date
+    ogranicza wyszukiwanie do kursów jadących w tym dniu (z nocnymi kursami
+    dnia poprzedniego, jak TimetableStore.day_trips).
+    Zwraca zestaw Pareto posortowany po czasie przyjazdu.
+    """
+    if start_id == end_id:
+        return []
+    store = store or get_timetable_store()
+    root = _Label(start_seconds, 0, 0, None, None)
+    best: Dict[int, List[_Label]] = {start_id: [root]}  # przystanek -> etykiety ze wszystkich rund
+    marked: Dict[int, List[_Label]] = {start_id: [root]}  # etykiety nowe w poprzedniej rundzie
+    footpaths = get_footpath_graph()
+    day_trips: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}  # wariant -> (wiersze, czasy) kursów dnia
+
+    if max_walk_m > 0:
+        marked = _relax_footpaths(marked, best, footpaths, max_walk_m)
+
+    for transfers in range(max_transfers + 1):
+        scan_from: Dict[int, int] = {}  # wariant -> najwcześniejsza pozycja oznaczonego przystanku
+        for stop_id in marked:
+            for pattern_id, position in store.stop_patterns.get(stop_id, ()):
+                if position < scan_from.get(pattern_id, math.inf):
+                    scan_from[pattern_id] = position
+
+        improved: Dict[int, List[_Label]] = {}
+        target = best.setdefault(end_id, [])
+        for pattern_id, first_position in scan_from.items():
+            pattern = store.patterns[pattern_id]
+            stop_ids = pattern.stops.tolist()
+            if pattern_id not in day_trips:
+                day_trips[pattern_id] = store.day_trips(pattern, service_date)
+            rows, times = day_trips[pattern_id]
+            route_bag: List[Tuple[int, int, _Label]] = []  # (kurs dnia, pozycja wejścia, etykieta)
+
+            for position in range(first_position, len(stop_ids)):
+                stop_id = stop_ids[position]
+                for row, board_position, label in route_bag:
+                    candidate = _Label(int(times[row, position]), label.walk_m, transfers, label,
+                                       (pattern_id, int(rows[row]), board_position, position))
+                    if any(_dominates(other, candidate) for other in target):
+                        continue
+                    if _merge(best.setdefault(stop_id, []), candidate):
+                        improved.setdefault(stop_id, []).append(candidate)
+
+                if position == len(stop_ids) - 1:
+                    break
+                for label in marked.get(stop_id, ()):
+                    row = int(np.searchsorted(times[:, position], label.arrival, side="left"))
+                    if row == len(rows):
+                        continue
+                    # W obrębie kursów wariantu wcześniejszy kurs przyjeżdża wcześniej wszędzie
+                    if any(other_row <= row and other.walk_m <= label.walk_m for other_row, _, other in route_bag):
+                        continue
+                    route_bag = [(other_row, other_position, other) for other_row, other_position, other in route_bag
+                                 if not (row <= other_row and label.walk_m <= other.walk_m)]
+                    route_bag.append((row, position, label))
+
+        marked = _still_best(improved, best)
+        if max_walk_m > 0:
+            marked = _relax_footpaths(marked, best, footpaths, max_walk_m)
+        if not marked:
+            break
+
+    labels = sorted(best.get(end_id, []), key=lambda label: (label.arrival, label.transfers, label.walk_m))
+    return [ParetoJourney(label.arrival, label.transfers, label.walk_m, _legs(store, label)) for label in labels]
+
+
+def _still_best(labels: Dict[int, List[_Label]], best: Dict[int, List[_Label]]) -> Dict[int, List[_Label]]:
+    """Pomija etykiety usunięte z worka w tej samej rundzie"""
+    result = {}
+    for stop_id, stop_labels in labels.items():
+        bag = best.get(stop_id, [])
+        kept = [label for label in stop_labels if any(label is other for other in bag)]
+        if kept:
+            result[stop_id] = kept
+    return result
+
+
+def _relax_footpaths(marked: Dict[int, List[_Label]], best: Dict[int, List[_Label]],
+                     footpaths: FootpathGraph, max_walk_m: int) -> Dict[int, List[_Label]]:
+    """Dodaje dojścia piesze z nowych etykiet do pobliskich przystanków (bez łączenia dojść)"""
+    walked: Dict[int, List[_Label]] = {}
+    for stop_id, labels in marked.items():
+        for label in labels:
+            if isinstance(label.leg, WalkLeg):
+                continue
+            for neighbour, distance_m, seconds in footpaths.neighbours(stop_id):
+                walk_m = label.walk_m + distance_m
+                if walk_m > max_walk_m:
+                    break  # dojścia posortowane po odległości
+                candidate = _Label(label.arrival + seconds, walk_m,
+                                   label.transfers, label, WalkLeg(stop_id, neighbour, distance_m, seconds))
+                if _merge(best.setdefault(neighbour, []), candidate):
+                    walked.setdefault(neighbour, []).append(candidate)
+    for stop_id, labels in walked.items():
+        marked.setdefault(stop_id, []).extend(labels)
+    return _still_best(marked, best)
+
+
+def _legs(store: TimetableStore, label: _Label) -> List[Union[RideLeg, WalkLeg]]:
+    """Odtwarza odcinki podróży od etykiety celu wstecz"""
+    legs = []
+    while label.parent is not None:
+        if isinstance(label.leg, WalkLeg):
+            legs.append(label.leg)
+        else:
+            pattern_id, row, board_position, alight_position = label.leg
+            pattern = store.patterns[pattern_id]
+            legs.append(RideLeg(pattern.line, pattern.schedules[row],
+                                pattern.stops[board_position:alight_position + 1].tolist()))
+        label = label.parent
+    legs.reverse()
+    return legs
@@ -0,0 +1,89 @@
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+import gzip
+import hashlib
+
+# Krótszych odpowiedzi nie opłaca się kompresować
+GZIP_MIN_SIZE = 1024
+# Klient może trzymać odpowiedź, ale przed użyciem pyta serwer (If-None-Match -> 304)
+CACHE_CONTROL = "no-cache"
+
+
+class CachedBody(NamedTuple):
+    """Gotowa odpowiedź: JSON, jego wersja gzip (lub None) i ETag"""
+    body: bytes
+    gzipped: Optional[bytes]
+    etag: str
+
+
+class ResponseCache:
+    """Odpowiedzi endpointów zależnych tylko od sieci (linie, przystanki), zserializowane raz.
+
+    Cache należy do jednej wersji sieci - przebudowa sieci tworzy nowy, pusty cache.
+    ETag to skrót treści, więc jest taki sam na każdym workerze.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.entries: Dict[Hashable, CachedBody] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any], response_type: Any = Any) -> CachedBody:
+        """Zwraca zapisaną odpowiedź dla klucza, a przy pierwszym użyciu ją buduje"""
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        body = TypeAdapter(response_type).dump_json(build())
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+        cached = self.entries[key] = CachedBody(body, gzipped, f'W/"{hashlib.sha1(body).hexdigest()[:20]}"')
+        return cached
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Porównanie słabe: W/"x" i "x" to ten sam zasób
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def cached_json_response(request: Request, key: Hashable, build: Callable[[], Any],
+                         response_type: Any = Any) -> Response:
+    """Odpowiedź JSON z cache sieci: 304 dla aktualnego ETag-u, gzip gdy klient go przyjmuje"""
+    cached = get_response_cache().get_or_build(key, build, response_type)
+    headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    if cached.gzipped is not None and _accepts_gzip(request.headers.get("accept-encoding")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(cached.gzipped, media_type="application/json", headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
+_cache = ResponseCache(version=1)
+
+
+def get_response_cache() -> ResponseCache:
+    """Zwraca cache odpowiedzi dla bieżącej wersji sieci"""
+    return _cache
+
+
+def rebuild_response_cache() -> ResponseCache:
+    """Zaczyna nową wersję sieci z pustym cache (np. po wczytaniu lub zmianie linii)"""
+    global _cache
+    _cache = ResponseCache(version=_cache.version + 1)
+    return _cache
@@ -0,0 +1,60 @@
+from models.database_models import Line, Train, User
+from db.dicts import lines, trains, users
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class RiderIndex:
+    """Indeks krawędź -> linie -> pasażerowie jadący tymi liniami.
+
+    Pozwala ustalić, kogo powiadomić o zdarzeniu na krawędzi, bez przeglądania
+    wszystkich użytkowników i pełnych list krawędzi ich linii.
+    """
+
+    def __init__(self, lines_dict: Dict[int, Line], trains_dict: Dict[int, Train], users_dict: Dict[int, User]):
+        self.trains = trains_dict
+        self.users = users_dict
+        self.edge_lines: Dict[int, Set[int]] = {}
+        self.line_riders: Dict[int, Set[int]] = {}
+        self.user_line: Dict[int, int] = {}
+
+        for line in lines_dict.values():
+            for edge in line.edges or []:
+                self.edge_lines.setdefault(edge.id, set()).add(line.id)
+        for user in users_dict.values():
+            self.update_rider(user.id)
+
+    def update_rider(self, user_id: int):
+        """Przepina użytkownika do linii jego bieżącego pociągu (np. po zmianie pociągu)"""
+        old_line = self.user_line.pop(user_id, None)
+        if old_line is not None:
+            self.line_riders[old_line].discard(user_id)
+
+        user = self.users.get(user_id)
+        train = self.trains.get(user.current_train_id) if user and user.current_train_id is not None else None
+        if train is not None:
+            self.user_line[user_id] = train.line_id
+            self.line_riders.setdefault(train.line_id, set()).add(user_id)
+
+    def riders_on_edge(self, edge_id: int) -> List[Tuple[int, int]]:
+        """Pasażerowie linii przejeżdżających krawędzią jako (user_id, line_id), rosnąco po user_id"""
+        return sorted((user_id, line_id)
+                      for line_id in self.edge_lines.get(edge_id, ())
+                      for user_id in self.line_riders.get(line_id, ()))
+
+
+_index: Optional[RiderIndex] = None
+
+
+def get_rider_index() -> RiderIndex:
+    """Zwraca indeks pasażerów, budując go przy pierwszym użyciu"""
+    global _index
+    if _index is None:
+        _index = RiderIndex(lines, trains, users)
+    return _index
+
+
+def rebuild_rider_index() -> RiderIndex:
+    """Buduje indeks pasażerów od nowa (np. po zmianie linii lub pociągów)"""
+    global _index
+    _index = RiderIndex(lines, trains, users)
+    return _index
@@ -0,0 +1,156 @@
+from models.database_models import Edge, Line
+from db.dicts import edges
+from repositiories.timetable_store import time_to_seconds
+from repositiories.journey_planner import WALK
+from typing import Dict, Hashable, List, NamedTuple, Optional, Set, Tuple
+from collections import OrderedDict
+import math
+import os
+import time as clock
+
+# Ile tras trzyma cache i jak długo (sekundy)
+ROUTE_CACHE_SIZE = int(os.environ.get("ROUTE_CACHE_SIZE", "1024"))
+ROUTE_CACHE_TTL = float(os.environ.get("ROUTE_CACHE_TTL_SECONDS", "300"))
+# Szerokość przedziału czasu odjazdu w kluczu (sekundy)
+DEPARTURE_BUCKET = 300
+
+Route = Optional[Dict[int, Line]]
+
+
+class CachedRoute(NamedTuple):
+    """Trasa z cache i zakres godzin startu, dla których pozostaje najlepsza"""
+    route: Route
+    valid_from: int   # czas zapytania, dla którego ją wyznaczono
+    valid_until: float  # odjazd trasy (pierwszego kursu albo dojścia do niego) - później się jej nie złapie
+    penalized: bool  # wyznaczona z karami krawędzi (zależy od nakładki zdarzeń)
+    expires: float
+
+
+def route_departure(route: Route) -> Optional[int]:
+    """Odjazd trasy w sekundach od północy.
+
+    Gdy trasa zaczyna się dojściem pieszym, jest to najpóźniejsze wyjście,
+    z którym zdąży się na pierwszy kurs (odjazd kursu minus czas dojścia).
+    """
+    if not route:
+        return None
+    first = route[min(route)]
+    if not first.stops or not first.time_table:
+        return None
+    departure = first.time_table[0].stop_to_time.get(first.stops[0].id)
+    return time_to_seconds(departure) if departure is not None else None
+
+
+class RouteCache:
+    """Cache LRU/TTL wyników wyszukiwania tras dla jednej wersji sieci.
+
+    Klucz to (start, cel, przedział czasu odjazdu, algorytm). Zapisana trasa
+    wyznaczona od czasu t0 jest nadal najlepsza dla każdego startu między t0
+    a odjazdem jej pierwszego kursu (później dostępnych połączeń może tylko
+    ubywać), więc tylko takie zapytania z przedziału dostają trafienie.
+    Kara krawędzi opóźnia kurs od tej krawędzi dalej, więc zmienia najlepszą
+    trasę także pasażerom, którzy tą krawędzią nie jadą. Dlatego zmiana
+    nakładki kar usuwa wszystkie trasy wyznaczone z karami (penalized),
+    a trasy według samego rozkładu zostają.
+    """
+
+    def __init__(self, version: int, edges_dict: Dict[int, Edge], size: int = ROUTE_CACHE_SIZE,
+                 ttl: float = ROUTE_CACHE_TTL):
+        self.version = version
+        self.size = size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, CachedRoute]" = OrderedDict()
+        self.penalized: Set[Hashable] = set()
+        self.edge_between: Dict[Tuple[int, int], List[int]] = {}
+        for edge in edges_dict.values():
+            self.edge_between.setdefault((edge.from_stop, edge.to_stop), []).append(edge.id)
+            self.edge_between.setdefault((edge.to_stop, edge.from_stop), []).append(edge.id)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(start_id: int, end_id: int, start_seconds: int, algorithm: str) -> Hashable:
+        return start_id, end_id, start_seconds // DEPARTURE_BUCKET, algorithm
+
+    def get(self, start_id: int, end_id: int, start_seconds: int, algorithm: str) -> Optional[CachedRoute]:
+        """Zapisana trasa ważna dla tego czasu startu albo None (chybienie)"""
+        key = self.key(start_id, end_id, start_seconds, algorithm)
+        cached = self.entries.get(key)
+        if cached is not None and cached.expires <= clock.monotonic():
+            self._remove(key)
+            cached = None
+        if cached is None or not cached.valid_from <= start_seconds <= cached.valid_until:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return cached
+
+    def put(self, start_id: int, end_id: int, start_seconds: int, algorithm: str, route: Route,
+            penalized: bool = False):
+        key = self.key(start_id, end_id, start_seconds, algorithm)
+        self._remove(key)
+        departure = route_departure(route)
+        # Brak połączenia od t0 oznacza brak także przy późniejszym starcie
+        valid_until = departure if departure is not None else math.inf
+        self.entries[key] = CachedRoute(route, start_seconds, valid_until, penalized, clock.monotonic() + self.ttl)
+        if penalized:
+            self.penalized.add(key)
+        while len(self.entries) > self.size:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate_penalized(self) -> int:
+        """Usuwa trasy wyznaczone z karami krawędzi (po zmianie nakładki); zwraca liczbę usuniętych"""
+        keys = list(self.penalized)
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "network_version": self.version,
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def route_edges(self, route: Route) -> Tuple[int, ...]:
+        """Krawędzie, którymi przejeżdża trasa"""
+        edge_ids = set()
+        for segment in (route or {}).values():
+            if segment.id == WALK:
+                continue
+            segment_stops = segment.stops or []
+            for a, b in zip(segment_stops, segment_stops[1:]):
+                edge_ids.update(self.edge_between.get((a.id, b.id), ()))
+        return tuple(sorted(edge_ids))
+
+    def _remove(self, key: Hashable):
+        if self.entries.pop(key, None) is not None:
+            self.penalized.discard(key)
+
+
+_cache: Optional[RouteCache] = None
+
+
+def get_route_cache() -> RouteCache:
+    """Zwraca cache tras bieżącej wersji sieci, budując go przy pierwszym użyciu"""
+    global _cache
+    if _cache is None:
+        _cache = RouteCache(1, edges)
+    return _cache
+
+
+def rebuild_route_cache() -> RouteCache:
+    """Zaczyna nową wersję sieci z pustym cache tras (np. po wczytaniu lub zmianie linii)"""
+    global _cache
+    _cache = RouteCache(_cache.version + 1 if _cache is not None else 1, edges)
+    return _cache
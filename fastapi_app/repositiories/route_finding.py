@@ -1,108 +1,300 @@
 from models.database_models import LatLng, Stop, Line, Schedule
 from repositiories.user_repository import get_stop_by_id
+from repositiories.journey_planner import WALK, JourneyLeg, WalkLeg, earliest_arrivals, find_journey, find_profile, leg_times
+from repositiories.pareto_planner import RideLeg, find_pareto_journeys
+from repositiories.trip_transfers import find_trip_based_journey
+from repositiories.goal_directed import GOAL_HEURISTICS, find_journey_goal_directed
+from repositiories.footpaths import walk_seconds
+from repositiories.timetable_store import get_timetable_store, time_to_seconds, seconds_to_time
+from repositiories.adjacency_index import get_lines_at_stop, get_line_neighbours, line_serves_stop
+from repositiories.spatial_index import get_spatial_index
+from repositiories.route_cache import get_route_cache
+from repositiories.edge_overlay import BLOCKED, get_edge_overlay
+from repositiories.geo import haversine_km
 from db.dicts import lines, stops
-from typing import List, Optional, Dict
-from datetime import time, datetime
+from typing import List, Optional, Dict, Sequence
+from datetime import date, time, datetime
 from queue import PriorityQueue
-import math
+import os
+import time as clock
+
+# Zgłoszenie dalej od każdej krawędzi nie dotyczy żadnej trasy (km)
+EVENT_EDGE_RADIUS_KM = float(os.environ.get("EVENT_EDGE_RADIUS_KM", "1.0"))
 
 def calculate_distance(point1: LatLng, point2: LatLng) -> float:
     """
     Oblicza odległość między dwoma punktami geograficznymi używając formuły Haversine.
     Zwraca odległość w kilometrach.
     """
-    # Konwersja stopni na radiany
-    lat1_rad = math.radians(point1.lat)
-    lat2_rad = math.radians(point2.lat)
-    delta_lat = math.radians(point2.lat - point1.lat)
-    delta_lon = math.radians(point2.lng - point1.lng)
-    
-    # Format Haversine
-    a = (math.sin(delta_lat / 2) ** 2 + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * 
-         math.sin(delta_lon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    # Promień Ziemi w kilometrach
-    earth_radius = 6371
-    
-    return earth_radius * c
+    return haversine_km(point1.lat, point1.lng, point2.lat, point2.lng)
+
+def find_nearest_edge(location: LatLng, max_distance_km: Optional[float] = None) -> Optional[int]:
+    """Znajduje najbliższą krawędź (odległość punktu od odcinka) do danego punktu.
+
+    None, gdy sieć nie ma krawędzi albo najbliższa jest dalej niż max_distance_km.
+    """
+    nearest = get_spatial_index().nearest_edge(location.lat, location.lng)
+    if nearest is None or (max_distance_km is not None and nearest[1] > max_distance_km):
+        return None
+    return nearest[0]
 
-def find_nearest_edge(location: LatLng) -> int:
+def find_nearest_stop(location: LatLng) -> Optional[int]:
     """Znajduje najbliższy przystanek do danego punktu"""
-    nearest_stop = 1  # Domyślny przystanek
-    nearest_distance = float('inf')
-    
-    for stop in stops.values():
-        stop_location = LatLng(lat=stop.lat, lng=stop.lon)
-        distance = calculate_distance(location, stop_location)
-        if distance < nearest_distance:
-            nearest_distance = distance
-            nearest_stop = stop.id
-    
-    return nearest_stop
+    nearest = get_spatial_index().nearest_stops(location.lat, location.lng, k=1)
+    return nearest[0][0] if nearest else None
 
 
 def get_next_prev_stop(line: Line, stop: Stop):
     """Znajduje sąsiednie przystanki dla danego przystanku w linii"""
-    res = []
-    if line and line.edges:
-        for edge in line.edges:
-            if edge.from_stop == stop.id:
-                res.append(edge.to_stop)
-            elif edge.to_stop == stop.id:
-                res.append(edge.from_stop)
-    return res
-
-def get_possible_connect(current_stop: Stop, current_time: time):
-    """Znajduje możliwe połączenia z danego przystanku"""
+    if not line:
+        return []
+    return list(get_line_neighbours(line.id, stop.id))
+
+def get_possible_connect(current_stop: Stop, current_time: int):
+    """Znajduje możliwe połączenia z danego przystanku (czasy w sekundach od północy)"""
     possible_arriving = []
     current_stop_id = current_stop.id
+    store = get_timetable_store()
+
+    for entry in get_lines_at_stop(current_stop_id):
+        line = lines[entry.line_id]
+        neighbours = entry.neighbours
 
-    for line in lines.values():
-        # Sprawdź czy przystanek jest w tej linii
-        neighbours = get_next_prev_stop(line, current_stop)
-        if not neighbours:
-            continue
-            
         if line.time_table:
             for schedule in line.time_table:
-                stop_to_time = schedule.stop_to_time
-                
+                ref = store.trip_index.get(schedule.id)
+                if ref is None:
+                    continue
+                pattern = store.patterns[ref.pattern]
+
                 # Sprawdź czy przystanek jest w harmonogramie
-                if current_stop.id not in stop_to_time:
+                position = pattern.position.get(current_stop_id)
+                if position is None or position + 1 >= len(pattern.stops):
                     continue
-                    
-                current_stop_time = stop_to_time[current_stop.id]
-                
-                # Znajdź następny przystanek w harmonogramie
-                for next_stop_id in neighbours:
-                    if next_stop_id not in stop_to_time:
-                        continue
-                        
-                    next_stop_time = stop_to_time[next_stop_id]
-                    
-                    # Sprawdź czy to jest następny przystanek w harmonogramie
-                    if next_stop_time > current_stop_time:
-                        # Sprawdź czy możemy złapać ten pociąg
-                        if current_stop_time >= current_time:
-                            # Oblicz czas oczekiwania i podróży
-                            waiting_time = (current_stop_time.hour * 60 + current_stop_time.minute) - (current_time.hour * 60 + current_time.minute)
-                            travel_time = (next_stop_time.hour * 60 + next_stop_time.minute) - (current_stop_time.hour * 60 + current_stop_time.minute)
-                            total_time = waiting_time + travel_time
-                            
-                            possible_arriving.append((total_time, schedule, next_stop_time, next_stop_id, line))
-    
+
+                # Następny przystanek kursu musi być sąsiadem na linii
+                next_stop_id = int(pattern.stops[position + 1])
+                if next_stop_id not in neighbours:
+                    continue
+
+                current_stop_time = int(pattern.times[ref.row, position])
+                # Sprawdź czy możemy złapać ten pociąg
+                if current_stop_time >= current_time:
+                    next_stop_time = int(pattern.times[ref.row, position + 1])
+                    # Czas oczekiwania i podróży
+                    total_time = next_stop_time - current_time
+                    possible_arriving.append((total_time, schedule, next_stop_time, next_stop_id, line))
+
     return possible_arriving
 
-def get_best_route(start: Stop, end: Stop, start_time: time = time(6, 0)) -> Optional[Dict[int, Line]]:
+# Wyszukiwanie ukierunkowane na cel (repositiories.goal_directed): algorytm -> dolne ograniczenie
+GOAL_DIRECTED_ALGORITHMS = {"astar": "haversine", "alt": "landmarks", "alt_bidirectional": "bidirectional"}
+ROUTING_ALGORITHMS = ("csa", "dijkstra", "trip_based", *GOAL_DIRECTED_ALGORITHMS)
+
+def get_best_route(start: Stop, end: Stop, start_time: time = time(6, 0), algorithm: str = "csa",
+                   avoid_incidents: bool = True, service_date: Optional[date] = None) -> Optional[Dict[int, Line]]:
+    """Znajduje najlepszą trasę między dwoma przystankami.
+
+    Domyślnie używa skompilowanej tablicy połączeń (CSA) z karami krawędzi
+    z nierozwiązanych zdarzeń (edge_overlay); avoid_incidents=False planuje
+    według samego rozkładu. algorithm="dijkstra" uruchamia poprzednią
+    implementację (bez kar), np. do porównania wyników, a "trip_based"
+    odpowiada z przesiadek policzonych offline (repositiories.trip_transfers,
+    bez kar), a GOAL_DIRECTED_ALGORITHMS szukają A* w stronę celu (bez kar).
+    service_date ogranicza wyszukiwanie do kursów jadących w tym
+    dniu (None - wszystkie kursy). Dojścia piesze są osobnymi segmentami
+    z id linii WALK (przystanek startu i końca dojścia oraz ich czasy).
+    Wyniki trafiają do cache tras (repositiories.route_cache).
+    """
+    variant = algorithm if avoid_incidents else f"{algorithm}:scheduled"
+    if service_date is not None:
+        variant = f"{variant}@{service_date.isoformat()}"
+    start_seconds = time_to_seconds(start_time)
+    cache = get_route_cache()
+    cached = cache.get(start.id, end.id, start_seconds, variant)
+    if cached is not None:
+        return cached.route
+
+    route = _find_route(start, end, start_time, algorithm, avoid_incidents, service_date)
+    cache.put(start.id, end.id, start_seconds, variant, route, penalized=_uses_penalties(algorithm, avoid_incidents))
+    return route
+
+def _uses_penalties(algorithm: str, avoid_incidents: bool) -> bool:
+    """Czy _find_route bierze pod uwagę kary krawędzi (wynik zależy od nakładki zdarzeń)"""
+    return avoid_incidents and algorithm not in ("dijkstra", "trip_based", *GOAL_DIRECTED_ALGORITHMS)
+
+def get_route_alternatives(start: Stop, end: Stop, start_time: time = time(6, 0),
+                           service_date: Optional[date] = None) -> Dict[str, object]:
+    """Trasa omijająca utrudnienia obok trasy wg rozkładu i utrudnień na tej drugiej"""
+    route = get_best_route(start, end, start_time, service_date=service_date)
+    scheduled_route = get_best_route(start, end, start_time, avoid_incidents=False, service_date=service_date)
+    overlay = get_edge_overlay()
+    disruptions = []
+    for edge_id in get_route_cache().route_edges(scheduled_route):
+        penalty = overlay.get(edge_id)
+        if penalty:
+            disruptions.append({
+                "edge_id": edge_id,
+                "blocked": penalty == BLOCKED,
+                "delay_minutes": round(penalty / 60, 1) if penalty != BLOCKED else None,
+            })
+    return {"route": route, "scheduled_route": scheduled_route, "scheduled_route_disruptions": disruptions}
+
+def get_pareto_routes(start: Stop, end: Stop, start_time: time = time(6, 0), max_transfers: int = 3,
+                      max_walk_m: int = 0, service_date: Optional[date] = None) -> List[Dict[str, object]]:
+    """Trasy z zestawu Pareto (przyjazd, przesiadki, dojścia piesze), od najwcześniejszego przyjazdu.
+
+    Każda trasa ma segmenty linii jak get_best_route; dojścia piesze podane są
+    osobno, z numerem segmentu, przed którym (lub 0 - po ostatnim) wypadają.
+    """
+    options = []
+    for journey in find_pareto_journeys(start.id, end.id, time_to_seconds(start_time), max_transfers, max_walk_m,
+                                        service_date=service_date):
+        route: Dict[int, Line] = {}
+        walks = []
+        for leg in journey.legs:
+            if isinstance(leg, RideLeg):
+                route[len(route) + 1] = _create_line_segment(
+                    leg.line, [get_stop_by_id(stop_id) for stop_id in leg.stop_ids], leg.schedule)
+            else:
+                walks.append({"from_stop": leg.from_stop, "to_stop": leg.to_stop, "distance_m": leg.distance_m,
+                              "before_segment": len(route) + 1})
+        for walk in walks:
+            if walk["before_segment"] > len(route):
+                walk["before_segment"] = 0
+        options.append({
+            "arrival": seconds_to_time(journey.arrival),
+            "transfers": journey.transfers,
+            "walking_m": journey.walk_m,
+            "route": route,
+            "walks": walks,
+        })
+    return options
+
+def get_route_profile(start: Stop, end: Stop, from_time: time, to_time: time, limit: Optional[int] = None,
+                      service_date: Optional[date] = None, avoid_incidents: bool = True) -> List[Dict[str, object]]:
+    """Kolejne odjazdy w oknie czasu: niezdominowane pary (odjazd, przyjazd) z jednego przebiegu profilu CSA.
+
+    Odjazd nie wchodzi na listę, jeśli późniejszy odjazd z okna przyjeżdża
+    nie później. Jak get_best_route profil uwzględnia dojścia piesze i kary
+    za utrudnienia (avoid_incidents=False - sam rozkład).
+    """
+    overlay = get_edge_overlay()
+    penalty = overlay.penalty if avoid_incidents and overlay.active else None
+    options = []
+    for entry, legs in find_profile(start.id, end.id, time_to_seconds(from_time), time_to_seconds(to_time), limit,
+                                    service_date, penalty):
+        options.append({
+            "departure": seconds_to_time(entry.departure),
+            "arrival": seconds_to_time(entry.arrival),
+            "duration_minutes": round((entry.arrival - entry.departure) / 60, 1),
+            "transfers": max(sum(isinstance(leg, JourneyLeg) for leg in legs) - 1, 0),
+            "route": {
+                i: _create_line_segment(leg.line, [get_stop_by_id(stop_id) for stop_id in leg.stop_ids], leg.schedule)
+                if isinstance(leg, JourneyLeg) else _create_walk_segment(leg, departure, arrival)
+                for i, (leg, (departure, arrival)) in enumerate(zip(legs, leg_times(legs, entry.departure)), start=1)
+            },
+        })
+    return options
+
+def get_route_search_stats(start: Stop, end: Stop, start_time: time = time(6, 0),
+                           service_date: Optional[date] = None) -> List[Dict[str, object]]:
+    """Praca wyszukiwania z każdym dolnym ograniczeniem (GOAL_HEURISTICS) dla tego samego zapytania.
+
+    nodes_expanded to liczba rozwiniętych przystanków - "none" rozwija je
+    w kolejności czasu, pozostałe pokazują zysk z ukierunkowania na cel.
+    Wyniki nie trafiają do cache tras.
+    """
+    stats = []
+    for heuristic in GOAL_HEURISTICS:
+        started = clock.perf_counter()
+        result = find_journey_goal_directed(start.id, end.id, time_to_seconds(start_time), heuristic, service_date)
+        stats.append({
+            "heuristic": heuristic,
+            "found": result.legs is not None,
+            "arrival": seconds_to_time(result.arrival) if result.arrival is not None else None,
+            "nodes_expanded": result.nodes_expanded,
+            "backward_settled": result.backward_settled,
+            "elapsed_ms": round((clock.perf_counter() - started) * 1000, 2),
+        })
+    return stats
+
+# Pasma dostępności izochrony (minuty od wyjazdu) i zasięg dojścia do przystanków z punktu
+ISOCHRONE_BANDS = (15, 30, 60)
+ISOCHRONE_ACCESS_M = 500
+
+def get_isochrone(start_time: time, stop_id: Optional[int] = None, location: Optional[LatLng] = None,
+                  bands: Sequence[int] = ISOCHRONE_BANDS, service_date: Optional[date] = None) -> Dict[str, object]:
+    """Przystanki osiągalne w kolejnych pasmach czasu - jeden przebieg CSA do wszystkich przystanków.
+
+    Start to przystanek albo punkt; z punktu dochodzi się pieszo do przystanków
+    w promieniu ISOCHRONE_ACCESS_M (lub do najbliższego). Przystanek trafia do
+    pierwszego pasma, w którym się mieści; dalsze nie są zwracane.
+    """
+    start_seconds = time_to_seconds(start_time)
+    bands = sorted(set(bands))
+    sources = {stop_id: start_seconds} if stop_id is not None else _access_stops(location, start_seconds)
+    arrivals = earliest_arrivals(sources, start_seconds + bands[-1] * 60, service_date)
+
+    reached = []
+    counts = dict.fromkeys(bands, 0)
+    for reached_id, arrival in arrivals.items():
+        minutes = (arrival - start_seconds) / 60
+        band = next((band for band in bands if minutes <= band), None)
+        if band is None or reached_id not in stops:
+            continue
+        counts[band] += 1
+        stop = stops[reached_id]
+        reached.append({"stop_id": reached_id, "lat": stop.lat, "lon": stop.lon,
+                        "arrival": seconds_to_time(arrival), "minutes": round(minutes, 1), "band": band})
+    reached.sort(key=lambda item: item["minutes"])
+
+    return {
+        "start_time": start_time,
+        "origin_stops": sorted(sources),
+        "bands": [{"minutes": band, "stops": counts[band]} for band in bands],
+        "stops": reached,
+    }
+
+def _access_stops(location: LatLng, start_seconds: int) -> Dict[int, int]:
+    """Przystanki w zasięgu dojścia z punktu z czasem dotarcia pieszo"""
+    index = get_spatial_index()
+    nearby = index.stops_within_radius(location.lat, location.lng, ISOCHRONE_ACCESS_M / 1000)
+    if not nearby:
+        nearby = index.nearest_stops(location.lat, location.lng, k=1)
+    return {stop_id: start_seconds + walk_seconds(distance_km * 1000) for stop_id, distance_km in nearby}
+
+def _find_route(start: Stop, end: Stop, start_time: time, algorithm: str,
+                avoid_incidents: bool = True, service_date: Optional[date] = None) -> Optional[Dict[int, Line]]:
+    if algorithm == "dijkstra":
+        return get_best_route_dijkstra(start, end, start_time)
+
+    if algorithm == "trip_based":
+        legs = find_trip_based_journey(start.id, end.id, time_to_seconds(start_time), service_date)
+    elif algorithm in GOAL_DIRECTED_ALGORITHMS:
+        legs = find_journey_goal_directed(start.id, end.id, time_to_seconds(start_time),
+                                          GOAL_DIRECTED_ALGORITHMS[algorithm], service_date).legs
+    else:
+        overlay = get_edge_overlay()
+        penalty = overlay.penalty if avoid_incidents and overlay.active else None
+        legs = find_journey(start.id, end.id, time_to_seconds(start_time), penalty, service_date)
+    if legs is None:
+        return None
+
+    return {
+        i: _create_line_segment(leg.line, [get_stop_by_id(stop_id) for stop_id in leg.stop_ids], leg.schedule)
+        if isinstance(leg, JourneyLeg) else _create_walk_segment(leg, departure, arrival)
+        for i, (leg, (departure, arrival)) in enumerate(zip(legs, leg_times(legs, time_to_seconds(start_time))), start=1)
+    }
+
+def get_best_route_dijkstra(start: Stop, end: Stop, start_time: time = time(6, 0)) -> Optional[Dict[int, Line]]:
     """Znajduje najlepszą trasę między dwoma przystankami używając algorytmu Dijkstry"""
     visited = set()
     prev = {}  # poprzednik: stop_id -> poprzedni stop_id
     line_info = {}  # stop_id -> (line, schedule) używane do dotarcia
-    times = {start.id: 0}  # najlepszy znany czas dojścia w minutach
+    times = {start.id: 0}  # najlepszy znany czas dojścia w sekundach
     q = PriorityQueue()
-    q.put((0, start.id, start_time))
+    q.put((0, start.id, time_to_seconds(start_time)))
 
     while not q.empty():
         total_time, current_stop_id, current_time = q.get()
@@ -157,11 +349,10 @@ def _reconstruct_route_segments(start: Stop, end: Stop, prev: Dict[int, int], li
                 current_line, current_schedule = line_info[stop.id]
             else:
                 # Znajdź linię zawierającą ten przystanek
-                for line in lines.values():
-                    if line and line.edges and any(edge.from_stop == stop.id or edge.to_stop == stop.id for edge in line.edges):
-                        current_line = line
-                        current_schedule = line.time_table[0] if line.time_table else None
-                        break
+                serving = get_lines_at_stop(stop.id)
+                if serving:
+                    current_line = lines[serving[0].line_id]
+                    current_schedule = current_line.time_table[0] if current_line.time_table else None
             segment_stops.append(stop)
         else:
             # Sprawdź czy przystanek jest w tej samej linii
@@ -184,22 +375,22 @@ def _reconstruct_route_segments(start: Stop, end: Stop, prev: Dict[int, int], li
                     segment_stops.append(stop)
             else:
                 # Sprawdź czy przystanek jest w obecnej linii
-                if current_line and current_line.edges and any(edge.from_stop == stop.id or edge.to_stop == stop.id for edge in current_line.edges):
+                if current_line and line_serves_stop(current_line.id, stop.id):
                     segment_stops.append(stop)
                 else:
                     # Znajdź nową linię
-                    for line in lines.values():
-                        if line and line.edges and any(edge.from_stop == stop.id or edge.to_stop == stop.id for edge in line.edges):
-                            if current_line and segment_stops and current_schedule:
-                                # Dodaj przystanek przesiadkowy na koniec poprzedniego segmentu
-                                segment_stops.append(stop)
-                                segments[current_segment] = _create_line_segment(current_line, segment_stops, current_schedule)
-                                current_segment += 1
-                            # Rozpocznij nowy segment od przystanku przesiadkowego
-                            segment_stops = [stop]
-                            current_line = line
-                            current_schedule = line.time_table[0] if line.time_table else None
-                            break
+                    serving = get_lines_at_stop(stop.id)
+                    if serving:
+                        line = lines[serving[0].line_id]
+                        if current_line and segment_stops and current_schedule:
+                            # Dodaj przystanek przesiadkowy na koniec poprzedniego segmentu
+                            segment_stops.append(stop)
+                            segments[current_segment] = _create_line_segment(current_line, segment_stops, current_schedule)
+                            current_segment += 1
+                        # Rozpocznij nowy segment od przystanku przesiadkowego
+                        segment_stops = [stop]
+                        current_line = line
+                        current_schedule = line.time_table[0] if line.time_table else None
     
     # Dodaj ostatni segment
     if current_line and segment_stops and current_schedule:
@@ -207,6 +398,17 @@ def _reconstruct_route_segments(start: Stop, end: Stop, prev: Dict[int, int], li
     
     return segments
 
+def _create_walk_segment(walk: WalkLeg, departure: int, arrival: int) -> Line:
+    """Segment dojścia pieszego w formacie segmentu linii (id linii i harmonogramu WALK)"""
+    return Line(
+        id=WALK,
+        name=f"Walk {walk.distance_m} m",
+        edges=None,
+        time_table=[Schedule(id=WALK, stop_to_time={walk.from_stop: seconds_to_time(departure),
+                                                    walk.to_stop: seconds_to_time(arrival)})],
+        stops=[get_stop_by_id(walk.from_stop), get_stop_by_id(walk.to_stop)]
+    )
+
 def _create_line_segment(original_line: Line, stops: List[Stop], schedule: Schedule) -> Line:
     """Tworzy segment linii z podanymi przystankami i harmonogramem"""
     # Filtrowanie harmonogramu tylko dla przystanków w segmencie
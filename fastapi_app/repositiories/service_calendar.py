@@ -0,0 +1,80 @@
+from models.database_models import ServiceCalendar
+from db.dicts import calendars
+from db.gtfs_import import WEEKDAYS
+from typing import Dict, Iterable, Optional
+from datetime import date
+import numpy as np
+
+# Indeks kalendarza kursu, który kursuje codziennie (brak service_id lub kalendarza)
+EVERY_DAY = -1
+
+
+class ServiceDays:
+    """Dni kursowania wszystkich kalendarzy jako mapy bitowe po indeksie dnia.
+
+    bitmap[s] to spakowane (np.packbits) bity dni od first_day: bit d oznacza,
+    że kalendarz s kursuje w dniu first_day + d. Rok zajmuje 46 bajtów na
+    kalendarz, a aktywne kalendarze danego dnia to jedna kolumna bitów.
+    """
+
+    def __init__(self, calendars_dict: Dict[str, ServiceCalendar]):
+        self.service_ids = list(calendars_dict)
+        self.index: Dict[str, int] = {service_id: i for i, service_id in enumerate(self.service_ids)}
+        days = [day for calendar in calendars_dict.values()
+                for day in (calendar.start_date, calendar.end_date, *calendar.added_dates)]
+        self.first_day: Optional[date] = min(days) if days else None
+        self.n_days = (max(days) - self.first_day).days + 1 if days else 0
+
+        active = np.zeros((len(self.service_ids), self.n_days), dtype=bool)
+        if self.n_days:
+            offsets = np.arange(self.n_days)
+            weekday = (self.first_day.weekday() + offsets) % 7
+            for s, calendar in enumerate(calendars_dict.values()):
+                runs_on = np.array([getattr(calendar, day) for day in WEEKDAYS], dtype=bool)
+                start, end = self.day_index(calendar.start_date), self.day_index(calendar.end_date)
+                active[s] = runs_on[weekday] & (offsets >= start) & (offsets <= end)
+                active[s, [self.day_index(day) for day in calendar.added_dates]] = True
+                active[s, [self.day_index(day) for day in calendar.removed_dates
+                           if 0 <= self.day_index(day) < self.n_days]] = False
+        self.bitmap = np.packbits(active, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.service_ids)
+
+    def day_index(self, day: date) -> int:
+        return (day - self.first_day).days
+
+    def active_services(self, day: date) -> np.ndarray:
+        """Maska kalendarzy kursujących w danym dniu (bool, po indeksie kalendarza)"""
+        d = self.day_index(day) if self.first_day is not None else -1
+        if not 0 <= d < self.n_days:
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return (self.bitmap[:, d >> 3] >> (7 - (d & 7))) & 1 == 1
+
+    def trip_mask(self, trip_services: np.ndarray, day: date) -> np.ndarray:
+        """Maska kursów kursujących w danym dniu - jeden krok wektorowy po indeksach kalendarzy"""
+        active = np.append(self.active_services(day), True)  # EVERY_DAY (-1) wskazuje ostatni element
+        return active[trip_services]
+
+    def service_indexes(self, service_ids: Iterable[Optional[str]]) -> np.ndarray:
+        """Indeksy kalendarzy kursów (EVERY_DAY dla kursów bez kalendarza)"""
+        return np.array([self.index.get(service_id, EVERY_DAY) if service_id else EVERY_DAY
+                         for service_id in service_ids], dtype=np.int32)
+
+
+_service_days: Optional[ServiceDays] = None
+
+
+def get_service_days() -> ServiceDays:
+    """Zwraca mapy dni kursowania, budując je przy pierwszym użyciu"""
+    global _service_days
+    if _service_days is None:
+        _service_days = ServiceDays(calendars)
+    return _service_days
+
+
+def rebuild_service_days() -> ServiceDays:
+    """Buduje mapy dni kursowania od nowa (np. po wczytaniu feedu)"""
+    global _service_days
+    _service_days = ServiceDays(calendars)
+    return _service_days
@@ -0,0 +1,305 @@
+from models.database_models import Edge
+from db.dicts import edges
+from repositiories.geo import EARTH_RADIUS_KM, StopCoordinates, get_stop_coordinates, haversine_matrix, haversine_to_many
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import math
+
+# Rozmiar komórki siatki w kilometrach
+DEFAULT_CELL_KM = 1.0
+
+
+class SpatialIndex:
+    """Siatka (grid) nad przystankami i odcinkami krawędzi.
+
+    Współrzędne rzutowane są lokalnie (equirectangular) na płaszczyznę w km,
+    a zapytania przeszukują pierścienie komórek wokół punktu, aż wynik
+    nie może się już poprawić. Odległości kandydatów liczone są wektorowo.
+    """
+
+    def __init__(self, coords: StopCoordinates, edges_dict: Dict[int, Edge], cell_km: float = DEFAULT_CELL_KM):
+        self._set_coords(coords, cell_km)
+        self.stop_cells = _group_by_cell(
+            (self._cell(x, y), idx) for idx, (x, y) in enumerate(zip(self.stop_x.tolist(), self.stop_y.tolist()))
+        )
+
+        edge_ids: List[int] = []
+        endpoints: List[Tuple[int, int]] = []
+        for edge in edges_dict.values():
+            if edge.from_stop in coords.position and edge.to_stop in coords.position:
+                edge_ids.append(edge.id)
+                endpoints.append((coords.position[edge.from_stop], coords.position[edge.to_stop]))
+
+        self.edge_ids = np.array(edge_ids, dtype=np.int64)
+        ends = np.array(endpoints, dtype=np.int64).reshape(-1, 2)
+        # Odcinki jako tablica (M, 4): ax, ay, bx, by
+        self.edge_segments = np.column_stack((self.stop_x[ends[:, 0]], self.stop_y[ends[:, 0]],
+                                              self.stop_x[ends[:, 1]], self.stop_y[ends[:, 1]]))
+
+        # Odcinek trafia do każdej komórki, przez którą przechodzi
+        self.edge_cells = _group_by_cell(
+            (cell, idx)
+            for idx, segment in enumerate(self.edge_segments.tolist())
+            for cell in self._segment_cells(*segment)
+        )
+
+        self._set_bounds()
+
+    @classmethod
+    def from_arrays(cls, coords: StopCoordinates, arrays: Dict[str, np.ndarray],
+                    cell_km: float = DEFAULT_CELL_KM) -> Optional["SpatialIndex"]:
+        """Odtwarza indeks z tablic to_arrays (np. z migawki sieci); None, gdy pasują do innej siatki"""
+        if "spatial_cell_km" not in arrays or float(arrays["spatial_cell_km"][0]) != cell_km \
+                or int(arrays["spatial_stop_count"][0]) != len(coords):
+            return None
+        index = cls.__new__(cls)
+        index._set_coords(coords, cell_km)
+        index.stop_cells = _cells_from_arrays(arrays, "spatial_stop")
+        index.edge_ids = arrays["spatial_edge_ids"]
+        index.edge_segments = arrays["spatial_edge_segments"]
+        index.edge_cells = _cells_from_arrays(arrays, "spatial_edge")
+        index._set_bounds()
+        return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Siatka jako płaskie tablice (komórki w formacie CSR) do zapisania w migawce sieci"""
+        return {
+            "spatial_cell_km": np.array([self.cell_km], dtype=np.float64),
+            "spatial_stop_count": np.array([len(self.coords)], dtype=np.int64),
+            "spatial_edge_ids": self.edge_ids,
+            "spatial_edge_segments": self.edge_segments.reshape(-1, 4),
+            **_cells_to_arrays(self.stop_cells, "spatial_stop"),
+            **_cells_to_arrays(self.edge_cells, "spatial_edge"),
+        }
+
+    def _set_coords(self, coords: StopCoordinates, cell_km: float):
+        self.cell_km = cell_km
+        self.coords = coords
+        self.ref_lat = float(coords.lat.mean()) if len(coords) else 0.0
+        self._cos_ref = math.cos(math.radians(self.ref_lat))
+        self.stop_x, self.stop_y = self._project_many(coords.lat, coords.lon)
+
+    def _set_bounds(self):
+        cells = list(self.stop_cells) + list(self.edge_cells)
+        self._bounds = (min(c[0] for c in cells), min(c[1] for c in cells),
+                        max(c[0] for c in cells), max(c[1] for c in cells)) if cells else None
+
+    def project(self, lat: float, lon: float) -> Tuple[float, float]:
+        """Rzutuje (lat, lon) na lokalną płaszczyznę w kilometrach"""
+        return (EARTH_RADIUS_KM * math.radians(lon) * self._cos_ref,
+                EARTH_RADIUS_KM * math.radians(lat))
+
+    def _project_many(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (EARTH_RADIUS_KM * np.radians(lons) * self._cos_ref,
+                EARTH_RADIUS_KM * np.radians(lats))
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_km), math.floor(y / self.cell_km))
+
+    def _segment_cells(self, ax: float, ay: float, bx: float, by: float):
+        """Komórki przecinane przez odcinek (przejście po siatce, Amanatides-Woo)"""
+        cx, cy = self._cell(ax, ay)
+        end = self._cell(bx, by)
+        yield (cx, cy)
+        dx, dy = bx - ax, by - ay
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # Parametr t (0..1) do najbliższej granicy komórki i przyrost t na komórkę
+        t_max_x = ((cx + (step_x > 0)) * self.cell_km - ax) / dx if dx else math.inf
+        t_max_y = ((cy + (step_y > 0)) * self.cell_km - ay) / dy if dy else math.inf
+        t_delta_x = self.cell_km / abs(dx) if dx else math.inf
+        t_delta_y = self.cell_km / abs(dy) if dy else math.inf
+
+        while (cx, cy) != end and min(t_max_x, t_max_y) <= 1.0:
+            if t_max_x < t_max_y:
+                cx += step_x
+                t_max_x += t_delta_x
+            else:
+                cy += step_y
+                t_max_y += t_delta_y
+            yield (cx, cy)
+
+    def _max_ring(self, center: Tuple[int, int]) -> int:
+        """Liczba pierścieni potrzebna, by z danej komórki objąć całą siatkę"""
+        if self._bounds is None:
+            return 0
+        min_cx, min_cy, max_cx, max_cy = self._bounds
+        cx, cy = center
+        return max(abs(cx - min_cx), abs(cx - max_cx), abs(cy - min_cy), abs(cy - max_cy))
+
+    def _ring(self, center: Tuple[int, int], r: int):
+        cx, cy = center
+        if r == 0:
+            yield center
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _ring_distance_bound(self, r: int, x: float, y: float) -> float:
+        """Minimalna odległość punktu spoza pierścieni 0..r od zapytania"""
+        cx, cy = self._cell(x, y)
+        return min(x - cx * self.cell_km, (cx + 1) * self.cell_km - x,
+                   y - cy * self.cell_km, (cy + 1) * self.cell_km - y) + r * self.cell_km
+
+    def nearest_stops(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, float]]:
+        """Zwraca k najbliższych przystanków jako listę (stop_id, odległość w km)"""
+        if k <= 0 or not len(self.coords):
+            return []
+        x, y = self.project(lat, lon)
+        center = self._cell(x, y)
+        chunks: List[np.ndarray] = []
+        count = 0
+
+        for r in range(self._max_ring(center) + 1):
+            for cell in self._ring(center, r):
+                members = self.stop_cells.get(cell)
+                if members is not None:
+                    chunks.append(members)
+                    count += len(members)
+            if count >= k:
+                candidates = np.concatenate(chunks)
+                planar = np.hypot(self.stop_x[candidates] - x, self.stop_y[candidates] - y)
+                if np.partition(planar, k - 1)[k - 1] <= self._ring_distance_bound(r, x, y):
+                    break
+
+        candidates = np.concatenate(chunks)
+        distances = haversine_to_many(lat, lon, self.coords.lat[candidates], self.coords.lon[candidates])
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(self.coords.ids[candidates[i]]), float(distances[i])) for i in order]
+
+    def stops_within_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """Zwraca przystanki w promieniu radius_km, posortowane po odległości"""
+        x, y = self.project(lat, lon)
+        cx0, cy0 = self._cell(x - radius_km, y - radius_km)
+        cx1, cy1 = self._cell(x + radius_km, y + radius_km)
+        # Margines jednej komórki kompensuje zniekształcenie rzutu z dala od ref_lat
+        chunks = [self.stop_cells[(cx, cy)]
+                  for cx in range(cx0 - 1, cx1 + 2)
+                  for cy in range(cy0 - 1, cy1 + 2)
+                  if (cx, cy) in self.stop_cells]
+        if not chunks:
+            return []
+
+        candidates = np.concatenate(chunks)
+        distances = haversine_to_many(lat, lon, self.coords.lat[candidates], self.coords.lon[candidates])
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return [(int(self.coords.ids[candidates[i]]), float(distances[i])) for i in order]
+
+    def stop_pairs_within_radius(self, radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Wszystkie pary różnych przystanków w promieniu radius_km.
+
+        Zwraca (pozycja przystanku, pozycja sąsiada, odległość w km) - pozycje jak
+        w StopCoordinates. Liczone blokami: przystanki jednej komórki naraz z
+        kandydatami z komórek wokół (macierz haversine_matrix), a nie osobnym
+        zapytaniem dla każdego przystanku.
+        """
+        lat, lon = self.coords.lat, self.coords.lon
+        if not len(lat):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        # Rzut skraca lub wydłuża odległości wschód-zachód o cos(ref_lat) / cos(lat);
+        # zasięg w komórkach liczony jest dla najgorszego przystanku (z 1% zapasu)
+        stretch = self._cos_ref / float(np.cos(np.radians(np.abs(lat).max())))
+        reach = math.ceil(radius_km * max(stretch, 1.0) * 1.01 / self.cell_km)
+        sources: List[np.ndarray] = []
+        targets: List[np.ndarray] = []
+        distances: List[np.ndarray] = []
+        for (cx, cy), members in self.stop_cells.items():
+            candidates = np.concatenate([self.stop_cells[(x, y)]
+                                         for x in range(cx - reach, cx + reach + 1)
+                                         for y in range(cy - reach, cy + reach + 1)
+                                         if (x, y) in self.stop_cells])
+            matrix = haversine_matrix(lat[members], lon[members], lat[candidates], lon[candidates])
+            rows, cols = np.nonzero((matrix <= radius_km) & (members[:, None] != candidates[None, :]))
+            sources.append(members[rows])
+            targets.append(candidates[cols])
+            distances.append(matrix[rows, cols])
+        return np.concatenate(sources), np.concatenate(targets), np.concatenate(distances)
+
+    def nearest_edge(self, lat: float, lon: float) -> Optional[Tuple[int, float]]:
+        """Zwraca najbliższą krawędź (edge_id, odległość w km) wg odległości punktu od odcinka"""
+        if not len(self.edge_ids):
+            return None
+        x, y = self.project(lat, lon)
+        center = self._cell(x, y)
+        seen = np.zeros(len(self.edge_ids), dtype=bool)
+        best: Optional[Tuple[float, int]] = None
+
+        for r in range(self._max_ring(center) + 1):
+            chunks = [self.edge_cells[cell] for cell in self._ring(center, r) if cell in self.edge_cells]
+            if chunks:
+                candidates = np.unique(np.concatenate(chunks))
+                candidates = candidates[~seen[candidates]]
+                seen[candidates] = True
+                if len(candidates):
+                    distances = _point_segment_distances(x, y, self.edge_segments[candidates])
+                    i = int(np.argmin(distances))
+                    candidate = (float(distances[i]), int(self.edge_ids[candidates[i]]))
+                    if best is None or candidate < best:
+                        best = candidate
+            if best is not None and best[0] <= self._ring_distance_bound(r, x, y):
+                break
+
+        return (best[1], best[0]) if best else None
+
+
+def _group_by_cell(pairs: Iterable[Tuple[Tuple[int, int], int]]) -> Dict[Tuple[int, int], np.ndarray]:
+    grouped: Dict[Tuple[int, int], List[int]] = {}
+    for cell, idx in pairs:
+        grouped.setdefault(cell, []).append(idx)
+    return {cell: np.array(members, dtype=np.int64) for cell, members in grouped.items()}
+
+
+def _cells_to_arrays(cells: Dict[Tuple[int, int], np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    keys = list(cells)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(cells[key]) for key in keys], out=offsets[1:])
+    members = np.concatenate([cells[key] for key in keys]) if keys else np.zeros(0, dtype=np.int64)
+    return {f"{prefix}_cells": np.array(keys, dtype=np.int64).reshape(-1, 2),
+            f"{prefix}_cell_members": members, f"{prefix}_cell_offsets": offsets}
+
+
+def _cells_from_arrays(arrays: Dict[str, np.ndarray], prefix: str) -> Dict[Tuple[int, int], np.ndarray]:
+    """Komórki z tablic CSR; członkowie komórek są widokami na tablice (bez kopiowania)"""
+    members, offsets = arrays[f"{prefix}_cell_members"], arrays[f"{prefix}_cell_offsets"].tolist()
+    return {(cx, cy): members[offsets[i]:offsets[i + 1]]
+            for i, (cx, cy) in enumerate(arrays[f"{prefix}_cells"].tolist())}
+
+
+def _point_segment_distances(px: float, py: float, segments: np.ndarray) -> np.ndarray:
+    """Odległości punktu od odcinków (tablica (M, 4)) na płaszczyźnie"""
+    ax, ay, bx, by = segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3]
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    degenerate = length_sq == 0
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(degenerate, 1.0, length_sq), 0.0, 1.0)
+    t[degenerate] = 0.0
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+_index: Optional[SpatialIndex] = None
+
+
+def get_spatial_index() -> SpatialIndex:
+    """Zwraca indeks przestrzenny, budując go przy pierwszym użyciu"""
+    global _index
+    if _index is None:
+        _index = SpatialIndex(get_stop_coordinates(), edges)
+    return _index
+
+
+def rebuild_spatial_index(arrays: Optional[Dict[str, np.ndarray]] = None) -> SpatialIndex:
+    """Buduje indeks przestrzenny od nowa (np. po zmianie przystanków).
+
+    Z tablicami migawki sieci (to_arrays) indeks jest tylko odtwarzany, o ile pasuje do siatki.
+    """
+    global _index
+    _index = SpatialIndex.from_arrays(get_stop_coordinates(), arrays) if arrays is not None else None
+    if _index is None:
+        _index = SpatialIndex(get_stop_coordinates(), edges)
+    return _index
@@ -0,0 +1,201 @@
+from models.database_models import Line, Schedule
+from db.dicts import lines
+from repositiories.service_calendar import get_service_days
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from datetime import date, time, timedelta
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+
+def time_to_seconds(t: time) -> int:
+    """Zamienia datetime.time na sekundy od północy"""
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def seconds_to_time(seconds: int) -> time:
+    """Zamienia sekundy od północy na datetime.time (kursy po północy zawijają się)"""
+    seconds = int(seconds) % 86400
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def _rolling_seconds(times, day_offset: int = 0) -> List[int]:
+    """Sekundy od północy dnia kursowania; kurs po północy liczy się dalej (> 24h).
+
+    day_offset to doby od dnia kursowania do pierwszego odjazdu (Schedule.day_offset),
+    więc kurs z GTFS odjeżdżający o 24:30 ma czasy od 88200, a nie od 1800.
+    """
+    result = []
+    offset = day_offset * 86400
+    for t in times:
+        seconds = time_to_seconds(t) + offset
+        if result and seconds < result[-1]:
+            offset += 86400
+            seconds += 86400
+        result.append(seconds)
+    return result
+
+
+class TripPattern:
+    """Wariant trasy: wspólna sekwencja przystanków i macierz czasów kursów.
+
+    times[i, j] to czas (sekundy od północy, int32) kursu i na przystanku stops[j];
+    kursy posortowane są po czasie odjazdu z pierwszego przystanku.
+    """
+
+    def __init__(self, pattern_id: int, line: Line, stop_ids: Tuple[int, ...], trips: List[Tuple[Schedule, List[int]]]):
+        trips = sorted(trips, key=lambda trip: trip[1])
+        self.id = pattern_id
+        self.line = line
+        self.stops = np.array(stop_ids, dtype=np.int32)
+        self.times = np.array([times for _, times in trips], dtype=np.int32).reshape(len(trips), len(stop_ids))
+        self.trip_ids = np.array([schedule.id for schedule, _ in trips], dtype=np.int32)
+        self.schedules: List[Schedule] = [schedule for schedule, _ in trips]
+        self.position: Dict[int, int] = {stop_id: j for j, stop_id in enumerate(stop_ids)}
+
+    @classmethod
+    def from_arrays(cls, pattern_id: int, line: Line, stops: np.ndarray, times: np.ndarray,
+                    trip_ids: np.ndarray, schedules: List[Schedule]) -> "TripPattern":
+        """Tworzy wariant z gotowych tablic (np. z migawki sieci) bez kopiowania"""
+        pattern = cls.__new__(cls)
+        pattern.id = pattern_id
+        pattern.line = line
+        pattern.stops = stops
+        pattern.times = times
+        pattern.trip_ids = trip_ids
+        pattern.schedules = schedules
+        pattern.position = {stop_id: j for j, stop_id in enumerate(stops.tolist())}
+        return pattern
+
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def first_trip_after(self, position: int, seconds: int) -> Optional[int]:
+        """Indeks pierwszego kursu odjeżdżającego z pozycji nie wcześniej niż seconds"""
+        row = int(np.searchsorted(self.times[:, position], seconds, side="left"))
+        return row if row < len(self.trip_ids) else None
+
+
+class TripRef(NamedTuple):
+    pattern: int
+    row: int
+
+
+class Departure(NamedTuple):
+    line_id: int
+    trip_id: int
+    departure: int
+    next_stop_id: Optional[int]
+
+
+class TimetableStore:
+    """Kolumnowy rozkład jazdy pogrupowany w warianty tras (patterns)"""
+
+    def __init__(self, lines_dict: Optional[Dict[int, Line]] = None):
+        self.patterns: List[TripPattern] = []
+        self.trip_index: Dict[int, TripRef] = {}
+        self.stop_patterns: Dict[int, List[Tuple[int, int]]] = {}  # stop_id -> [(pattern, pozycja)]
+        self._service_days = None  # ServiceDays, dla których policzono _services
+        self._services: Dict[int, np.ndarray] = {}  # wariant -> indeksy kalendarzy kursów
+
+        for line in (lines_dict or {}).values():
+            if not line.time_table:
+                continue
+            grouped: Dict[Tuple[int, ...], List[Tuple[Schedule, List[int]]]] = {}
+            for schedule in line.time_table:
+                if not schedule.stop_to_time:
+                    continue
+                # stop_to_time zachowuje kolejność przejazdu
+                stop_ids = tuple(schedule.stop_to_time)
+                grouped.setdefault(stop_ids, []).append((schedule, _rolling_seconds(schedule.stop_to_time.values(), schedule.day_offset)))
+
+            for stop_ids, trips in grouped.items():
+                self.add_pattern(TripPattern(len(self.patterns), line, stop_ids, trips))
+
+    def add_pattern(self, pattern: TripPattern):
+        """Dodaje wariant do rozkładu i aktualizuje indeksy kursów i przystanków"""
+        self.patterns.append(pattern)
+        for row, trip_id in enumerate(pattern.trip_ids.tolist()):
+            self.trip_index[trip_id] = TripRef(pattern.id, row)
+        for position, stop_id in enumerate(pattern.stops.tolist()):
+            self.stop_patterns.setdefault(stop_id, []).append((pattern.id, position))
+
+    def trip_times(self, trip_id: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Zwraca (przystanki, czasy w sekundach) danego kursu"""
+        ref = self.trip_index.get(trip_id)
+        if ref is None:
+            return None
+        pattern = self.patterns[ref.pattern]
+        return pattern.stops, pattern.times[ref.row]
+
+    def stop_time(self, trip_id: int, stop_id: int) -> Optional[int]:
+        """Zwraca czas kursu na przystanku w sekundach"""
+        ref = self.trip_index.get(trip_id)
+        if ref is None:
+            return None
+        pattern = self.patterns[ref.pattern]
+        position = pattern.position.get(stop_id)
+        return None if position is None else int(pattern.times[ref.row, position])
+
+    def day_trips(self, pattern: TripPattern, service_date: Optional[date]) -> Tuple[np.ndarray, np.ndarray]:
+        """(wiersze, czasy) kursów wariantu jadących w dniu service_date, posortowane po odjeździe.
+
+        Jak w widoku dnia planera dochodzą kursy dnia poprzedniego kończące się
+        po 24:00, z czasami przesuniętymi o -86400. Bez daty - wszystkie kursy.
+        """
+        if service_date is None:
+            return np.arange(len(pattern)), pattern.times
+        service_days = get_service_days()
+        if service_days is not self._service_days:
+            self._service_days, self._services = service_days, {}
+        services = self._services.get(pattern.id)
+        if services is None:
+            services = self._services[pattern.id] = service_days.service_indexes(
+                schedule.service_id for schedule in pattern.schedules)
+        today = np.flatnonzero(service_days.trip_mask(services, service_date))
+        overnight = np.flatnonzero(service_days.trip_mask(services, service_date - timedelta(days=1))
+                                   & (pattern.times[:, -1] >= SECONDS_PER_DAY))
+        if not len(overnight):
+            return today, pattern.times[today]
+        rows = np.concatenate((today, overnight))
+        times = np.concatenate((pattern.times[today], pattern.times[overnight] - SECONDS_PER_DAY))
+        order = np.argsort(times[:, 0], kind="stable")
+        return rows[order], times[order]
+
+    def departures(self, stop_id: int, after: int, limit: int = 10,
+                   service_date: Optional[date] = None) -> List[Departure]:
+        """Zwraca najbliższe odjazdy z przystanku nie wcześniej niż after (sekundy).
+
+        service_date ogranicza odjazdy do kursów jadących w tym dniu (razem
+        z nocnymi kursami dnia poprzedniego); None - wszystkie kursy.
+        """
+        result = []
+        for pattern_id, position in self.stop_patterns.get(stop_id, ()):
+            pattern = self.patterns[pattern_id]
+            if position == len(pattern.stops) - 1:
+                continue  # ostatni przystanek wariantu - brak odjazdu
+            rows, times = self.day_trips(pattern, service_date)
+            column = times[:, position]
+            next_stop_id = int(pattern.stops[position + 1])
+            result.extend(Departure(pattern.line.id, int(pattern.trip_ids[rows[i]]), int(column[i]), next_stop_id)
+                          for i in np.flatnonzero(column >= after).tolist())
+        result.sort(key=lambda departure: departure.departure)
+        return result[:limit]
+
+
+_store: Optional[TimetableStore] = None
+
+
+def get_timetable_store() -> TimetableStore:
+    """Zwraca kolumnowy rozkład jazdy, budując go przy pierwszym użyciu"""
+    global _store
+    if _store is None:
+        _store = TimetableStore(lines)
+    return _store
+
+
+def rebuild_timetable_store(store: Optional[TimetableStore] = None) -> TimetableStore:
+    """Buduje kolumnowy rozkład jazdy od nowa (np. po zmianie linii) lub instaluje gotowy"""
+    global _store
+    _store = store if store is not None else TimetableStore(lines)
+    return _store
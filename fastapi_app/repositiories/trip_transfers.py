@@ -0,0 +1,381 @@
+from repositiories.timetable_store import TimetableStore, get_timetable_store
+from repositiories.footpaths import FootpathGraph, get_footpath_graph
+from repositiories.service_calendar import ServiceDays, get_service_days
+from repositiories.journey_planner import INF, JourneyLeg, Leg, add_walk_legs
+from db.array_file import write_array_file, map_array_file
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left
+from datetime import date
+import hashlib
+import logging
+import multiprocessing
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRANSFERS_MAGIC = b"JRTRIPTR"
+# Zmiana formatu pliku lub reguł wyznaczania przesiadek wymaga podbicia wersji
+TRANSFERS_VERSION = 1
+# Plik z przesiadkami ładowany razem z siecią (bez niego tryb trip_based jest niedostępny)
+TRIP_TRANSFERS_PATH = os.environ.get("TRIP_TRANSFERS_PATH")
+# Ile kursów liczy jedno zadanie puli procesów
+BUILD_CHUNK_SIZE = 256
+# Zapytanie kończy się po tylu przesiadkach
+MAX_ROUNDS = 16
+# Pozycja wejścia kursu, do którego jeszcze nie wsiedliśmy
+NOT_REACHED = 1 << 30
+
+
+class _Trips:
+    """Numeracja kursów wszystkich wariantów i ich czasy w listach Pythona.
+
+    Kurs t to wiersz row[t] wariantu pattern[t]; kursy wariantu mają kolejne
+    numery od first[p]. Pozycja i kursu t ma płaski indeks stop_first[t] + i,
+    którym indeksowane są przesiadki.
+    """
+
+    def __init__(self, store: TimetableStore):
+        self.store = store
+        self.first: List[int] = []
+        self.pattern: List[int] = []
+        self.row: List[int] = []
+        self.stop_first: List[int] = []
+        self.stops: List[List[int]] = []
+        self.rows: List[List[List[int]]] = []  # wariant -> kurs -> czasy
+        self.columns: List[List[List[int]]] = []  # wariant -> pozycja -> czasy kursów (do bisect)
+        flat = 0
+        for pattern in store.patterns:
+            self.first.append(len(self.pattern))
+            n_stops = len(pattern.stops)
+            for row in range(len(pattern)):
+                self.pattern.append(pattern.id)
+                self.row.append(row)
+                self.stop_first.append(flat)
+                flat += n_stops
+            self.stops.append(pattern.stops.tolist())
+            self.rows.append(pattern.times.tolist())
+            self.columns.append(pattern.times.T.tolist())
+        self.first.append(len(self.pattern))
+        self.stop_first.append(flat)
+
+    def __len__(self) -> int:
+        return len(self.pattern)
+
+
+def network_digest(store: TimetableStore, footpaths: FootpathGraph) -> str:
+    """Skrót rozkładu, kalendarzy kursów i grafu dojść - plik przesiadek pasuje tylko do takiej sieci"""
+    digest = hashlib.sha256(f"v{TRANSFERS_VERSION}".encode())
+    for pattern in store.patterns:
+        digest.update(np.ascontiguousarray(pattern.stops).tobytes())
+        digest.update(np.ascontiguousarray(pattern.times).tobytes())
+        digest.update("|".join(schedule.service_id or "" for schedule in pattern.schedules).encode())
+    for array in (footpaths.offsets, footpaths.targets, footpaths.seconds):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _trip_services(store: TimetableStore, service_days: ServiceDays) -> np.ndarray:
+    return service_days.service_indexes(schedule.service_id for pattern in store.patterns
+                                        for schedule in pattern.schedules)
+
+
+# Stan budowy dziedziczony przez procesy puli (fork), ustawiany przed jej startem
+_build_state: Optional[Tuple[_Trips, Dict[int, List[Tuple[int, int]]], bool]] = None
+
+
+def _transfers_of_trips(first_trip: int, last_trip: int) -> Tuple[List[int], List[int], List[int]]:
+    """Przesiadki z kursów [first_trip, last_trip): (liczba na pozycję, kurs docelowy, pozycja wejścia).
+
+    Kandydaci to pierwsze kursy każdego wariantu, które da się złapać na tym
+    samym lub pobliskim przystanku po wysiadce na pozycji i. Zostają tylko
+    przesiadki, które poprawiają przyjazd na jakiś przystanek względem jazdy
+    dalej tym samym kursem (i, przy shared, względem przesiadek z późniejszych
+    pozycji tego kursu) - pozostałe nie mogą być częścią najszybszej podróży.
+    """
+    trips, walks, shared = _build_state
+    stop_patterns = trips.store.stop_patterns
+    counts: List[int] = []
+    targets: List[int] = []
+    positions: List[int] = []
+
+    for t in range(first_trip, last_trip):
+        p, r = trips.pattern[t], trips.row[t]
+        stops, times = trips.stops[p], trips.rows[p][r]
+        tau: Dict[int, int] = {}  # przystanek -> najwcześniejszy przyjazd bez tej przesiadki
+        found: List[List[Tuple[int, int]]] = [[] for _ in stops]
+        for i in range(len(stops) - 1, 0, -1):
+            arrival = times[i]
+            _improve(tau, walks, stops[i], arrival)
+            for stop_id, walk in [(stops[i], 0), *walks.get(stops[i], ())]:
+                ready = arrival + walk
+                for p2, j in stop_patterns.get(stop_id, ()):
+                    stops2 = trips.stops[p2]
+                    if j == len(stops2) - 1:
+                        continue
+                    row2 = bisect_left(trips.columns[p2][j], ready)
+                    if row2 == len(trips.rows[p2]) or (p2 == p and row2 >= r and j >= i):
+                        continue  # brak kursu albo późniejszy kurs tego samego wariantu
+                    times2 = trips.rows[p2][row2]
+                    keep = False
+                    for k in range(j + 1, len(stops2)):
+                        if _improve(tau, walks, stops2[k], times2[k], update=shared):
+                            keep = True
+                            if not shared:
+                                break
+                    if keep:
+                        found[i].append((trips.first[p2] + row2, j))
+        for transfers in found:
+            counts.append(len(transfers))
+            for target, position in transfers:
+                targets.append(target)
+                positions.append(position)
+    return counts, targets, positions
+
+
+def _improve(tau: Dict[int, int], walks: Dict[int, List[Tuple[int, int]]], stop_id: int, arrival: int,
+             update: bool = True) -> bool:
+    """Czy przyjazd (lub dojście z niego) poprawia tau; update=True zapisuje poprawę"""
+    improved = False
+    for target, seconds in [(stop_id, 0), *walks.get(stop_id, ())]:
+        if arrival + seconds < tau.get(target, INF):
+            improved = True
+            if not update:
+                return True
+            tau[target] = arrival + seconds
+    return improved
+
+
+class TripTransfers:
+    """Przesiadki między kursami (trip-based routing) w formacie CSR.
+
+    Przesiadki z pozycji i kursu t zajmują zakres offsets[f]:offsets[f + 1]
+    tablic target (kurs) i position (pozycja wejścia), gdzie f to płaski
+    indeks pozycji (_Trips.stop_first[t] + i). Tablice mogą być widokami na
+    zmapowany plik.
+    """
+
+    def __init__(self, trips: _Trips, digest: str, offsets: np.ndarray, target: np.ndarray, position: np.ndarray,
+                 trip_service: np.ndarray):
+        self.trips = trips
+        self.digest = digest
+        self.offsets = offsets
+        self.target = target
+        self.position = position
+        self.trip_service = trip_service
+
+    def __len__(self) -> int:
+        return len(self.target)
+
+    def save(self, path: str):
+        write_array_file(path, TRANSFERS_MAGIC, {"version": TRANSFERS_VERSION, "network_hash": self.digest},
+                         {"offsets": self.offsets, "target": self.target, "position": self.position})
+
+    def active_trips(self, service_date: Optional[date]) -> Optional[List[bool]]:
+        """Maska kursów jadących w danym dniu (None - wszystkie kursy)"""
+        if service_date is None:
+            return None
+        return get_service_days().trip_mask(self.trip_service, service_date).tolist()
+
+
+def build_trip_transfers(store: Optional[TimetableStore] = None, footpaths: Optional[FootpathGraph] = None,
+                         workers: Optional[int] = None) -> TripTransfers:
+    """Wyznacza przesiadki dla wszystkich kursów, dzieląc kursy między procesy puli.
+
+    Gdy wszystkie kursy jeżdżą w te same dni, przesiadkę porównuje się także
+    z przesiadkami z późniejszych pozycji kursu (pełna redukcja). Przy różnych
+    kalendarzach inny kurs może danego dnia nie jechać, więc przesiadka
+    odpada tylko, gdy nie poprawia niczego względem jazdy dalej tym samym kursem.
+    """
+    global _build_state
+    store = store or get_timetable_store()
+    footpaths = footpaths or get_footpath_graph()
+    trips = _Trips(store)
+    trip_service = _trip_services(store, get_service_days())
+    walks = {stop_id: footpaths.walks(stop_id) for stop_id in store.stop_patterns}
+    walks = {stop_id: stop_walks for stop_id, stop_walks in walks.items() if stop_walks}
+    _build_state = (trips, walks, len(np.unique(trip_service)) <= 1)
+
+    chunks = [(first, min(first + BUILD_CHUNK_SIZE, len(trips))) for first in range(0, len(trips), BUILD_CHUNK_SIZE)]
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    try:
+        if workers <= 1 or len(chunks) <= 1:
+            results = [_transfers_of_trips(*chunk) for chunk in chunks]
+        else:
+            # Procesy powstają przez fork i dziedziczą rozkład z _build_state bez serializacji
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(pool.map(_transfers_of_trips, *zip(*chunks)))
+    finally:
+        _build_state = None
+
+    counts = [count for chunk_counts, _, _ in results for count in chunk_counts]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    target = np.fromiter((t for _, chunk_targets, _ in results for t in chunk_targets), dtype=np.int32,
+                         count=int(offsets[-1]))
+    position = np.fromiter((j for _, _, chunk_positions in results for j in chunk_positions), dtype=np.int32,
+                           count=int(offsets[-1]))
+    return TripTransfers(trips, network_digest(store, footpaths), offsets, target, position, trip_service)
+
+
+def load_trip_transfers(path: str, store: Optional[TimetableStore] = None,
+                        footpaths: Optional[FootpathGraph] = None) -> Optional[TripTransfers]:
+    """Mapuje plik przesiadek; None, gdy go nie ma, ma inną wersję albo pasuje do innej sieci"""
+    opened = map_array_file(path, TRANSFERS_MAGIC)
+    if opened is None:
+        return None
+    header, arrays = opened
+    store = store or get_timetable_store()
+    footpaths = footpaths or get_footpath_graph()
+    digest = network_digest(store, footpaths)
+    if header.get("version") != TRANSFERS_VERSION or header.get("network_hash") != digest:
+        return None
+    return TripTransfers(_Trips(store), digest, arrays["offsets"], arrays["target"], arrays["position"],
+                         _trip_services(store, get_service_days()))
+
+
+def find_trip_based_journey(start_id: int, end_id: int, start_seconds: int, service_date: Optional[date] = None,
+                            transfers: Optional[TripTransfers] = None) -> Optional[List[Leg]]:
+    """Najwcześniejszy przyjazd z przesiadek policzonych offline (trip-based routing).
+
+    Runda n przegląda odcinki kursów osiągnięte po n przesiadkach; kurs
+    pamięta najwcześniejszą pozycję, na której do niego wsiedliśmy, więc każdy
+    odcinek przeglądany jest najwyżej raz. Jak find_journey: dojścia piesze
+    na starcie, między kursami i do celu, bez kar za utrudnienia. Przy
+    service_date jadą tylko kursy danego dnia (bez nocnych kursów dnia
+    poprzedniego). Wymaga załadowanych przesiadek.
+    """
+    if start_id == end_id:
+        return []
+    transfers = transfers or get_trip_transfers()
+    if transfers is None:
+        raise RuntimeError("Trip transfers are not loaded")
+    trips = transfers.trips
+    store = trips.store
+    footpaths = get_footpath_graph()
+    active = transfers.active_trips(service_date)
+
+    # Wariant -> [(pozycja, dojście do celu)]
+    to_target: Dict[int, List[Tuple[int, int]]] = {}
+    for stop_id, walk in [(end_id, 0), *footpaths.walks(end_id)]:
+        for p, position in store.stop_patterns.get(stop_id, ()):
+            to_target.setdefault(p, []).append((position, walk))
+
+    best, best_segment, best_alight = INF, -1, -1
+    reached = [NOT_REACHED] * len(trips)  # kurs -> najwcześniejsza pozycja wejścia
+    # Odcinki: (kurs, pozycja wejścia, koniec odcinka, odcinek poprzedni, pozycja wysiadki z niego)
+    segments: List[Tuple[int, int, int, int, int]] = []
+
+    def enqueue(trip: int, position: int, parent: int, alight: int, queue: List[int]):
+        end = trips.first[trips.pattern[trip] + 1]
+        if active is not None:
+            while trip < end and not active[trip]:
+                trip += 1
+            if trip == end or position >= reached[trip]:
+                return
+        p = trips.pattern[trip]
+        if trips.rows[p][trips.row[trip]][position] >= best:
+            return  # wsiadamy później niż najlepszy przyjazd do celu
+        segments.append((trip, position, min(reached[trip], len(trips.stops[p])), parent, alight))
+        queue.append(len(segments) - 1)
+        # Późniejsze kursy wariantu przyjeżdżają później - od tej pozycji nie trzeba ich przeglądać
+        for later in range(trip, end):
+            if reached[later] <= position:
+                break
+            reached[later] = position
+
+    for stop_id, walk in footpaths.walks(start_id):
+        if stop_id == end_id:
+            best = start_seconds + walk
+
+    queue: List[int] = []
+    for stop_id, walk in [(start_id, 0), *footpaths.walks(start_id)]:
+        for p, position in store.stop_patterns.get(stop_id, ()):
+            if position == len(trips.stops[p]) - 1:
+                continue
+            row = bisect_left(trips.columns[p][position], start_seconds + walk)
+            if row < len(trips.rows[p]) and position < reached[trips.first[p] + row]:
+                enqueue(trips.first[p] + row, position, -1, -1, queue)
+
+    for _ in range(MAX_ROUNDS + 1):
+        next_queue: List[int] = []
+        for s in queue:
+            trip, board, end, _, _ = segments[s]
+            p = trips.pattern[trip]
+            times = trips.rows[p][trips.row[trip]]
+            for position, walk in to_target.get(p, ()):
+                if board < position < end and times[position] + walk < best:
+                    best, best_segment, best_alight = times[position] + walk, s, position
+            if board + 1 == end or times[board + 1] >= best:
+                continue
+            # Przesiadki z całego odcinka jednym wycinkiem tablic CSR
+            f = trips.stop_first[trip] + board + 1
+            bounds = transfers.offsets[f:f + end - board].tolist()
+            targets = transfers.target[bounds[0]:bounds[-1]].tolist()
+            target_positions = transfers.position[bounds[0]:bounds[-1]].tolist()
+            for k, position in enumerate(range(board + 1, end)):
+                if times[position] >= best:
+                    break
+                for x in range(bounds[k] - bounds[0], bounds[k + 1] - bounds[0]):
+                    # Kurs, do którego wsiedliśmy już na tej lub wcześniejszej pozycji, nic nie wnosi
+                    if target_positions[x] < reached[targets[x]]:
+                        enqueue(targets[x], target_positions[x], s, position, next_queue)
+        if not next_queue:
+            break
+        queue = next_queue
+
+    if best == INF:
+        return None
+    legs = []
+    s, alight = best_segment, best_alight
+    while s != -1:
+        trip, board, _, parent, parent_alight = segments[s]
+        pattern = store.patterns[trips.pattern[trip]]
+        times = trips.rows[pattern.id][trips.row[trip]]
+        legs.append(JourneyLeg(line=pattern.line, schedule=pattern.schedules[trips.row[trip]],
+                               stop_ids=trips.stops[pattern.id][board:alight + 1],
+                               departure=times[board], arrival=times[alight]))
+        s, alight = parent, parent_alight
+    legs.reverse()
+    return add_walk_legs(start_id, end_id, legs, footpaths)
+
+
+_transfers: Optional[TripTransfers] = None
+
+
+def get_trip_transfers() -> Optional[TripTransfers]:
+    """Zwraca przesiadki załadowane z TRIP_TRANSFERS_PATH (None, gdy ich nie ma)"""
+    return _transfers
+
+
+def rebuild_trip_transfers() -> Optional[TripTransfers]:
+    """Ładuje przesiadki dla bieżącej sieci; plik zbudowany dla innej sieci jest pomijany"""
+    global _transfers
+    _transfers = None
+    if TRIP_TRANSFERS_PATH:
+        _transfers = load_trip_transfers(TRIP_TRANSFERS_PATH)
+        if _transfers is None:
+            logger.warning("Trip transfers %s missing or built for another network", TRIP_TRANSFERS_PATH)
+    return _transfers
+
+
+if __name__ == "__main__":
+    import argparse
+    from db.network_snapshot import load_network
+    from repositiories.network import rebuild_network_indexes
+
+    parser = argparse.ArgumentParser(description="Precompute trip-to-trip transfers for trip_based routing")
+    parser.add_argument("output", help="transfers file to write (load it with TRIP_TRANSFERS_PATH)")
+    parser.add_argument("--feed", help="GTFS feed directory (default: the built-in demo network)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.feed:
+        load_network(args.feed)
+    else:
+        rebuild_network_indexes()
+    result = build_trip_transfers(workers=args.workers)
+    result.save(args.output)
+    logger.info("Wrote %d transfers for %d trips to %s", len(result), len(result.trips), args.output)
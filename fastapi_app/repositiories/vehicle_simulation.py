@@ -0,0 +1,325 @@
+from models.database_models import Line, Train
+from db.dicts import edges, lines, trains, stops
+from repositiories.timetable_store import TimetableStore, TripPattern, get_timetable_store
+from repositiories.service_calendar import get_service_days
+from repositiories.adjacency_index import edge_position
+from repositiories.journey_planner import BLOCKED
+from repositiories.edge_overlay import get_edge_overlay
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import os
+import numpy as np
+
+# Co ile sekund pętla w tle przesuwa pojazdy (0 - tylko na żądanie, przy odczycie pozycji)
+SIMULATION_TICK_SECONDS = float(os.environ.get("SIMULATION_TICK_SECONDS", "0"))
+# Czas "nigdy" w macierzy czasów (dopełnienie krótszych kursów i postój bez kursu)
+NO_TIME = np.iinfo(np.int32).max
+
+SECONDS_PER_DAY = 86400
+
+# Kurs w bloku pojazdu: (odjazd z pierwszego przystanku, wariant, wiersz, przesunięcie czasów:
+# 0 albo -SECONDS_PER_DAY dla kursu z dnia poprzedniego)
+BlockTrip = Tuple[int, int, int, int]
+
+
+class VehicleSimulation:
+    """Pozycje wszystkich pociągów wyliczane z rozkładu jednym krokiem wektorowym na tick.
+
+    Kursy linii kursujące w symulowanym dniu są dzielone po kolei między
+    pociągi linii (pociąg j jeździ kursami j, j + m, j + 2m, ...). Bieżący kurs
+    pojazdu to wiersz macierzy czasów i współrzędnych przystanków (dopełnionych
+    do najdłuższego kursu), więc odcinek, ułamek przejechanej krawędzi
+    i interpolowane współrzędne liczone są naraz dla wszystkich pojazdów.
+    Stan pojazdów to tablice edge_index (pozycja w line.edges), fraction i delay.
+    Między tickami pojazd przejeżdża krawędzie po kolei: kara z nakładki
+    zdarzeń opóźnia go przy wjeździe na każdą mijaną krawędź, a na pierwszej
+    zablokowanej staje i jego opóźnienie rośnie. Pociąg przestawiony ręcznie
+    (inna krawędź niż ustawiona przez symulację) wypada z symulacji do końca dnia.
+    """
+
+    def __init__(self, trains_dict: Dict[int, Train], lines_dict: Dict[int, Line],
+                 store: Optional[TimetableStore] = None):
+        self.store = store or get_timetable_store()
+        self.trains = trains_dict
+        self.lines = lines_dict
+        self.train_ids = np.array(sorted(trains_dict), dtype=np.int64)
+        self.line_ids = np.array([trains_dict[train_id].line_id for train_id in self.train_ids.tolist()],
+                                 dtype=np.int64)
+        self.start_edges: List[int] = [trains_dict[train_id].current_edge for train_id in self.train_ids.tolist()]
+        n = len(self.train_ids)
+
+        # Stan pojazdów
+        self.edge_id = np.full(n, -1, dtype=np.int64)
+        self.edge_index = np.full(n, -1, dtype=np.int32)
+        self.fraction = np.zeros(n, dtype=np.float64)
+        self.delay = np.zeros(n, dtype=np.int64)
+        self.lat = np.zeros(n, dtype=np.float64)
+        self.lon = np.zeros(n, dtype=np.float64)
+
+        # Bieżący kurs pojazdu: czasy i współrzędne przystanków oraz krawędzie odcinków
+        self.trip_id = np.full(n, -1, dtype=np.int64)
+        self.n_stops = np.full(n, 2, dtype=np.int32)
+        self.segment = np.zeros(n, dtype=np.int32)
+        self.parked = np.ones(n, dtype=bool)
+        self.times = np.full((n, 2), NO_TIME, dtype=np.int64)
+        self.stop_lat = np.zeros((n, 2), dtype=np.float64)
+        self.stop_lon = np.zeros((n, 2), dtype=np.float64)
+        self.segment_edges = np.full((n, 2), -1, dtype=np.int64)
+
+        self.manual = np.zeros(n, dtype=bool)
+
+        self.day: Optional[date] = None
+        self.blocks: List[List[BlockTrip]] = [[] for _ in range(n)]
+        self.current: List[Optional[BlockTrip]] = [None] * n
+        self.next_trip: List[int] = [0] * n
+        self._line_edges: Dict[int, Dict[Tuple[int, int], int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.train_ids)
+
+    def tick(self, now: Optional[datetime] = None) -> List[Tuple[int, int]]:
+        """Przesuwa wszystkie pojazdy na chwilę now; zwraca (pociąg, krawędź) pojazdów, które zmieniły krawędź"""
+        now = now or datetime.now()
+        if now.date() != self.day:
+            self._start_day(now.date())
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+        if not len(self):
+            return []
+        rows = np.arange(len(self))
+
+        # Pociąg przestawiony poza symulacją (np. /trains/move_train) zostaje na swojej krawędzi do końca dnia
+        current_edges = np.array([self.trains[train_id].current_edge if train_id in self.trains else -1
+                                  for train_id in self.train_ids.tolist()], dtype=np.int64)
+        self.manual |= (self.edge_id >= 0) & (current_edges != self.edge_id)
+        active = ~self.parked & ~self.manual
+
+        # Pojazdy po końcu kursu przechodzą na kolejny kurs bloku
+        last_time = self.times[rows, self.n_stops - 1]
+        for v in np.flatnonzero(active & (seconds - self.delay >= last_time)).tolist():
+            self._assign_trip(v, seconds)
+        active = ~self.parked & ~self.manual
+
+        # Pojazd na zablokowanej krawędzi czeka na jej początku: opóźnienie to czas od planowego wjazdu
+        held = np.zeros(len(self), dtype=bool)
+        overlay = get_edge_overlay()
+        blocked = [edge_id for edge_id, penalty in overlay.by_edge.items() if penalty == BLOCKED]
+        if blocked:
+            segment = np.maximum(self.segment, 0)
+            held = active & (self.segment >= 0) & np.isin(self.segment_edges[rows, segment], blocked)
+            self.delay = np.where(held, np.maximum(self.delay, seconds - self.times[rows, segment]), self.delay)
+
+        # Odcinek: ostatni przystanek z czasem <= t - opóźnienie; w obrębie kursu pojazd się nie cofa
+        effective = seconds - self.delay
+        reached = (self.times <= effective[:, None]).sum(axis=1) - 1
+        previous = self.segment
+        target = np.maximum(np.clip(reached, 0, self.n_stops - 2), previous)
+        if overlay.active:
+            for v in np.flatnonzero(active & (target != previous)).tolist():
+                target[v] = self._cross_edges(v, int(previous[v]), int(target[v]), seconds, overlay, held)
+        self.segment = target.astype(np.int32)
+        edge_ids = self.segment_edges[rows, self.segment]
+
+        depart = self.times[rows, self.segment]
+        arrive = self.times[rows, self.segment + 1]
+        effective = seconds - self.delay
+        running = active & ~held & (arrive > depart)
+        self.fraction = np.where(running, np.clip((effective - depart) / np.maximum(arrive - depart, 1), 0.0, 1.0),
+                                 0.0)
+
+        from_lat, from_lon = self.stop_lat[rows, self.segment], self.stop_lon[rows, self.segment]
+        to_lat, to_lon = self.stop_lat[rows, self.segment + 1], self.stop_lon[rows, self.segment + 1]
+        self.lat = from_lat + self.fraction * (to_lat - from_lat)
+        self.lon = from_lon + self.fraction * (to_lon - from_lon)
+
+        for v in np.flatnonzero(self.manual).tolist():
+            self._place_manual(v, int(current_edges[v]))
+
+        moved = []
+        for v in np.flatnonzero((edge_ids != self.edge_id) & (edge_ids >= 0) & ~self.manual).tolist():
+            edge_id = int(edge_ids[v])
+            position = edge_position(int(self.line_ids[v]), edge_id)
+            self.edge_id[v] = edge_id
+            self.edge_index[v] = position if position is not None else -1
+            moved.append((int(self.train_ids[v]), edge_id))
+        return moved
+
+    def positions(self) -> List[Dict[str, object]]:
+        """Stan pojazdów po ostatnim ticku"""
+        columns = zip(self.train_ids.tolist(), self.line_ids.tolist(), self.trip_id.tolist(), self.edge_id.tolist(),
+                      self.edge_index.tolist(), self.fraction.tolist(), self.delay.tolist(),
+                      self.lat.tolist(), self.lon.tolist(), self.manual.tolist())
+        return [
+            {"train_id": train_id, "line_id": line_id, "trip_id": trip_id if trip_id >= 0 else None,
+             "edge_id": edge_id if edge_id >= 0 else None, "edge_index": edge_index if edge_index >= 0 else None,
+             "fraction": round(fraction, 4), "delay_seconds": delay, "lat": lat, "lon": lon, "manual": manual}
+            for train_id, line_id, trip_id, edge_id, edge_index, fraction, delay, lat, lon, manual in columns
+        ]
+
+    def _start_day(self, day: date):
+        """Dzieli kursy linii kursujące danego dnia między pociągi linii i ustawia pojazdy na pierwszych kursach.
+
+        Dochodzą kursy dnia poprzedniego kończące się po 24:00 (czasy przesunięte
+        o dobę, jak w widoku dnia planera). Pojazd, który o północy jest w trakcie
+        takiego kursu, dostaje go w nowym bloku i jedzie dalej z tym samym
+        opóźnieniem i odcinkiem.
+        """
+        carried: Dict[int, Tuple[int, int, int]] = {}  # pojazd -> (wariant, wiersz, odcinek) kursu w toku
+        if self.day is not None and day - self.day == timedelta(days=1):
+            for v in np.flatnonzero(~self.parked & ~self.manual).tolist():
+                trip = self.current[v]
+                if trip is not None and not trip[3] and self._trip_times(trip)[-1] >= SECONDS_PER_DAY:
+                    carried[v] = (trip[1], trip[2], int(self.segment[v]))
+        delays = self.delay.copy()
+
+        self.day = day
+        self.manual[:] = False
+        service_days = get_service_days()
+        line_trips: Dict[int, List[BlockTrip]] = {}
+        for pattern in self.store.patterns:
+            if len(pattern.stops) < 2:
+                continue
+            services = service_days.service_indexes(schedule.service_id for schedule in pattern.schedules)
+            for row in np.flatnonzero(service_days.trip_mask(services, day)).tolist():
+                line_trips.setdefault(pattern.line.id, []).append((int(pattern.times[row, 0]), pattern.id, row, 0))
+            previous_day = service_days.trip_mask(services, day - timedelta(days=1))
+            overnight = previous_day & (pattern.times[:, -1] >= SECONDS_PER_DAY)
+            for row in np.flatnonzero(overnight).tolist():
+                line_trips.setdefault(pattern.line.id, []).append(
+                    (int(pattern.times[row, 0]) - SECONDS_PER_DAY, pattern.id, row, -SECONDS_PER_DAY))
+
+        line_vehicles: Dict[int, List[int]] = {}
+        for v, line_id in enumerate(self.line_ids.tolist()):
+            line_vehicles.setdefault(line_id, []).append(v)
+        for line_id, vehicles in line_vehicles.items():
+            trips = sorted(line_trips.get(line_id, []))
+            # Kursy w toku zostają przy swoich pojazdach, resztę dzieli się po kolei
+            kept = {v: next((trip for trip in trips if trip[3] and trip[1:3] == carried[v][:2]), None)
+                    for v in vehicles if v in carried}
+            trips = [trip for trip in trips if trip not in kept.values()]
+            for j, v in enumerate(vehicles):
+                block = trips[j::len(vehicles)]
+                if kept.get(v) is not None:
+                    block = sorted(block + [kept[v]])
+                self.blocks[v] = block
+                self.next_trip[v] = 0
+                if kept.get(v) is None:
+                    self.edge_id[v] = -1
+                self._assign_trip(v, 0)
+                if kept.get(v) is not None and self.current[v] == kept[v]:
+                    self.delay[v] = delays[v]
+                    self.segment[v] = carried[v][2]
+
+    def _assign_trip(self, v: int, seconds: int):
+        """Ustawia pojazd na pierwszym niezakończonym kursie bloku; bez kursów pojazd stoi"""
+        self.delay[v] = 0
+        self.segment[v] = -1  # wjazd na pierwszą krawędź liczy się w najbliższym ticku
+        block = self.blocks[v]
+        i = self.next_trip[v]
+        while i < len(block) and self._trip_times(block[i])[-1] <= seconds:
+            i += 1
+        self.next_trip[v] = i + 1
+
+        if i < len(block):
+            pattern, row = self._pattern(block[i]), block[i][2]
+            stop_ids = pattern.stops.tolist()
+            self.trip_id[v] = int(pattern.trip_ids[row])
+            self.current[v] = block[i]
+            self.parked[v] = False
+            self._set_row(v, self._trip_times(block[i]).tolist(), stop_ids, self._segment_edges(pattern.line, stop_ids))
+            return
+
+        # Po ostatnim kursie pojazd stoi na jego końcu, a bez kursów - na początku swojej krawędzi
+        self.trip_id[v] = -1
+        self.current[v] = None
+        self.parked[v] = True
+        if block:
+            pattern = self._pattern(block[-1])
+            stop_ids = pattern.stops.tolist()[-1:] * 2
+            edge_ids = self._segment_edges(pattern.line, pattern.stops.tolist())[-1:]
+        else:
+            line = self.lines.get(int(self.line_ids[v]))
+            edge = next((edge for edge in (line.edges if line else None) or [] if edge.id == self.start_edges[v]),
+                        None)
+            stop_ids = [edge.from_stop, edge.to_stop] if edge is not None else []
+            edge_ids = [edge.id] if edge is not None else []
+        self._set_row(v, [NO_TIME, NO_TIME], stop_ids, edge_ids)
+
+    def _cross_edges(self, v: int, segment: int, target: int, seconds: int, overlay, held: np.ndarray) -> int:
+        """Wjeżdża na kolejne krawędzie od segment + 1; kary cofają cel, zablokowana krawędź zatrzymuje pojazd"""
+        while segment < target:
+            segment += 1
+            penalty = overlay.get(int(self.segment_edges[v, segment]))
+            if penalty == BLOCKED:
+                self.delay[v] = max(int(self.delay[v]), seconds - int(self.times[v, segment]))
+                held[v] = True
+                return segment
+            if penalty:
+                self.delay[v] += penalty
+                reached = int(np.count_nonzero(self.times[v] <= seconds - self.delay[v])) - 1
+                target = max(min(reached, int(self.n_stops[v]) - 2), segment)
+        return segment
+
+    def _place_manual(self, v: int, edge_id: int):
+        """Stawia pojazd na początku krawędzi ustawionej ręcznie"""
+        edge = edges.get(edge_id)
+        position = edge_position(int(self.line_ids[v]), edge_id)
+        self.edge_id[v] = edge_id
+        self.edge_index[v] = position if position is not None else -1
+        self.fraction[v] = 0.0
+        self.delay[v] = 0
+        if edge is not None and edge.from_stop in stops:
+            self.lat[v], self.lon[v] = stops[edge.from_stop].lat, stops[edge.from_stop].lon
+
+    def _pattern(self, trip: BlockTrip) -> TripPattern:
+        return self.store.patterns[trip[1]]
+
+    def _trip_times(self, trip: BlockTrip) -> np.ndarray:
+        """Czasy kursu w sekundach symulowanego dnia (kurs z dnia poprzedniego przesunięty o dobę)"""
+        return self._pattern(trip).times[trip[2]].astype(np.int64) + trip[3]
+
+    def _segment_edges(self, line: Line, stop_ids: List[int]) -> List[int]:
+        """Krawędzie linii między kolejnymi przystankami kursu (-1, gdy linia nie ma takiej krawędzi)"""
+        line_edges = self._line_edges.get(line.id)
+        if line_edges is None:
+            line_edges = self._line_edges[line.id] = {}
+            for edge in line.edges or []:
+                line_edges[(edge.from_stop, edge.to_stop)] = line_edges[(edge.to_stop, edge.from_stop)] = edge.id
+        return [line_edges.get(pair, -1) for pair in zip(stop_ids, stop_ids[1:])]
+
+    def _set_row(self, v: int, times: List[int], stop_ids: List[int], edge_ids: List[int]):
+        """Wpisuje kurs do wiersza v, poszerzając macierze dla dłuższego kursu"""
+        width = len(times)
+        if width > self.times.shape[1]:
+            pad = ((0, 0), (0, width - self.times.shape[1]))
+            self.times = np.pad(self.times, pad, constant_values=NO_TIME)
+            self.stop_lat = np.pad(self.stop_lat, pad)
+            self.stop_lon = np.pad(self.stop_lon, pad)
+            self.segment_edges = np.pad(self.segment_edges, pad, constant_values=-1)
+        self.times[v] = NO_TIME
+        self.times[v, :width] = times
+        self.n_stops[v] = width
+        located = [stops[stop_id] for stop_id in stop_ids if stop_id in stops]
+        self.stop_lat[v] = 0.0
+        self.stop_lon[v] = 0.0
+        self.stop_lat[v, :len(located)] = [stop.lat for stop in located]
+        self.stop_lon[v, :len(located)] = [stop.lon for stop in located]
+        self.segment_edges[v] = -1
+        self.segment_edges[v, :len(edge_ids)] = edge_ids
+
+
+_simulation: Optional[VehicleSimulation] = None
+
+
+def get_vehicle_simulation() -> VehicleSimulation:
+    """Zwraca silnik symulacji pojazdów, budując go przy pierwszym użyciu"""
+    global _simulation
+    if _simulation is None:
+        _simulation = VehicleSimulation(trains, lines)
+    return _simulation
+
+
+def rebuild_vehicle_simulation() -> VehicleSimulation:
+    """Buduje silnik symulacji od nowa (np. po wczytaniu sieci)"""
+    global _simulation
+    _simulation = VehicleSimulation(trains, lines)
+    return _simulation
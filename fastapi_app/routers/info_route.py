@@ -1,12 +1,22 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, time
+import json
 import uuid
-from models.database_models import Line, LineResponse, Stop, Route, Event, EventCreate, EventVote, IncidentType, LatLng, Notification, User
+from models.database_models import Line, LineResponse, Stop, Route, Event, EventCreate, EventVote, IncidentType, LatLng, Notification, RouteQuery, User
 import db.dicts
-from db.dicts import stops, lines, notifications, edges, users, trains, events
-from repositiories.route_finding import find_nearest_edge, get_best_route
-from repositiories.user_repository import update_user_level
+from db.dicts import stops, lines, edges, users, trains, events
+from repositiories.route_finding import EVENT_EDGE_RADIUS_KM, find_nearest_edge, get_best_route, get_pareto_routes, get_route_alternatives, get_route_profile, get_route_search_stats, get_isochrone, ISOCHRONE_BANDS, ROUTING_ALGORITHMS
+from repositiories.pareto_planner import MAX_TRANSFERS, MAX_WALK_M
+from repositiories.batch_planner import MAX_BATCH_SIZE, BatchQuery, plan_routes_batch
+from repositiories.event_repository import (add_event, event_stats, find_events, get_event_index, refresh_event_index, resolve_event as resolve_stored_event,
+                                            shared_state_writer, sync_shared_state, vote_event as vote_stored_event)
+from repositiories.notification_service import FanOut, get_dispatcher, get_inbox, register_device
+from repositiories.response_cache import cached_json_response
+from repositiories.route_cache import get_route_cache
+from repositiories.trip_transfers import get_trip_transfers
+from repositiories.timetable_store import get_timetable_store, time_to_seconds, seconds_to_time
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
@@ -18,22 +28,12 @@ client = OpenAI(
 
 router = APIRouter(prefix="/info", tags=["info"])
 
-# Events storage (in production this would be a database)
-# Initialize with seed events from db.dicts
-EVENTS_STORAGE: List[Event] = list(events.values())
-
-def notify_user(user_id: str, message: str):
-    notifications.append(Notification(user_id=user_id, message=message, timestamp=datetime.now()))
-
-
 @router.get("/get_stops", response_model=List[Stop])
-async def get_all_stops():
-    """Get all bus stops from CSV data"""
-    return list(stops.values())
+async def get_all_stops(request: Request):
+    """Get all bus stops from CSV data (cached until the network is reloaded, supports ETag)"""
+    return cached_json_response(request, "stops", lambda: list(stops.values()), List[Stop])
 
-@router.get("/get_lines", response_model=List[Line])
-async def get_all_lines():
-    """Get all bus routes from CSV data with stops populated"""
+def _lines_with_stops() -> List[Line]:
     result = []
     for line in lines.values():
         # Extract stops from edges
@@ -65,6 +65,11 @@ async def get_all_lines():
     
     return result
 
+@router.get("/get_lines", response_model=List[Line])
+async def get_all_lines(request: Request):
+    """Get all bus routes from CSV data with stops populated (cached until the network is reloaded, supports ETag)"""
+    return cached_json_response(request, "lines", _lines_with_stops, List[Line])
+
 @router.get("/get_stops_for_line", response_model=List[Stop])
 async def get_stops_for_line(line_id: str = Query(..., description="Line ID")):
     """Get all bus stops for a specific line"""
@@ -93,14 +98,20 @@ async def get_line_with_stops(line_id: int) -> LineResponse:
 
 @router.post("/report_event", response_model=Event)
 async def report_event(event_data: EventCreate):
-    """Report a new event for a route"""
+    """Report a new event for a route.
 
-    edge_id = find_nearest_edge(event_data.location)
+    The event is attached to the nearest edge; a location farther than EVENT_EDGE_RADIUS_KM
+    from every edge is rejected with 422.
+    """
 
-    
-    # Create new event
+    edge_id = find_nearest_edge(event_data.location, EVENT_EDGE_RADIUS_KM)
+    if edge_id is None:
+        raise HTTPException(status_code=422,
+                            detail=f"No route within {EVENT_EDGE_RADIUS_KM:g} km of the reported location")
+
+    # Create new event (the id is assigned by the event store)
     new_event = Event(
-        id=len(EVENTS_STORAGE) + 1,
+        id=0,
         type=event_data.type,
         title=event_data.title,
         description=event_data.description,
@@ -113,28 +124,19 @@ async def report_event(event_data: EventCreate):
         reportedBy=event_data.reportedBy
     )
     
-    # Add to events storage
-    EVENTS_STORAGE.append(new_event)
-
-    edge = edges[edge_id]
-    # todo maybe later
-    all_events_on_edge_with_type = [e for e in EVENTS_STORAGE if 
-                                    e.edge_affected == edge_id and 
-                                    e.type == event_data.type 
-                                    and not e.isResolved]
-    
-    sum_reported_by_level = sum(users[e.reportedBy].level for e in all_events_on_edge_with_type if e.reportedBy in users)
-    all_reporter_ids = [e.reportedBy for e in all_events_on_edge_with_type if e.reportedBy in users]
+    # Add to events storage (also refreshes the event index and its per-edge aggregates)
+    new_event = await add_event(new_event)
+
+    # Running aggregates for unresolved events of this type on the edge
+    sync_shared_state()
+    event_index = get_event_index()
+    sum_reported_by_level = event_index.reporter_level_sum(edge_id, event_data.type)
+    all_reporter_ids = event_index.reporters(edge_id, event_data.type)
 
     print(f"Sum levels of reporters for events on this edge: {sum_reported_by_level}")
     if sum_reported_by_level >= 20:
-        for user in users.values():
-            if user.id in all_reporter_ids:
-                continue  # Don't notify the reporter
-            train = trains[user.current_train_id]
-            line = lines[train.line_id]
-            if edge.id in [e.id for e in line.edges]:
-                notify_user(user.id, f"New event reported on your route {line.name}: {event_data.title}")
+        # Riders are notified in the background (don't notify the reporters)
+        get_dispatcher().submit(FanOut(edge_id, event_data.type, event_data.title, frozenset(all_reporter_ids)))
     
     return new_event
 
@@ -145,24 +147,14 @@ async def get_events(
     is_resolved: Optional[bool] = Query(None, description="Filter by resolved status"),
     limit: int = Query(50, description="Maximum number of events to return")
 ):
-    """Get events with optional filtering"""
-    events = EVENTS_STORAGE.copy()
-    
-    # Apply filters
+    """Get events with optional filtering (filtered, sorted newest first and limited by the event store)"""
+    edge_ids = None
     if route_id is not None:
-        events = [e for e in events if e.routeId == route_id]
-    
-    if incident_type is not None:
-        events = [e for e in events if e.type == incident_type]
-    
-    if is_resolved is not None:
-        events = [e for e in events if e.isResolved == is_resolved]
-    
-    # Sort by timestamp (newest first)
-    events.sort(key=lambda x: x.timestamp, reverse=True)
-    
-    # Apply limit
-    return events[:limit]
+        # A route is a line - its events are the ones on the line's edges
+        line = lines.get(int(route_id)) if route_id.isdigit() else None
+        edge_ids = [e.id for e in line.edges] if line else []
+
+    return await find_events(edge_ids=edge_ids, incident_type=incident_type, is_resolved=is_resolved, limit=limit)
 
 @router.get("/get_events_for_route/{route_id}", response_model=List[Event])
 async def get_events_for_route(route_id: str):
@@ -172,11 +164,8 @@ async def get_events_for_route(route_id: str):
     if not route:
         raise HTTPException(status_code=404, detail=f"Route with ID {route_id} not found")
     
-    # Get events for this route
-    events = [e for e in EVENTS_STORAGE if e.routeId == route_id]
-    events.sort(key=lambda x: x.timestamp, reverse=True)
-    
-    return events
+    # Get events for this route (events on the line's edges, newest first)
+    return await find_events(edge_ids=[e.id for e in route.edges], limit=None)
 
 @router.get("/get_line_info/{line_id}", response_model=Line)
 async def get_line_info(line_id: str):
@@ -196,6 +185,31 @@ async def get_stop_info(stop_id: str):
     
     return stop
 
+@router.get("/get_departures/{stop_id}")
+async def get_departures(
+    stop_id: int,
+    after: Optional[time] = Query(None, description="Earliest departure time (defaults to now)"),
+    limit: int = Query(10, description="Maximum number of departures to return"),
+    service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")
+):
+    """Get the next departures from a stop, read from the columnar timetable"""
+    if stop_id not in stops:
+        raise HTTPException(status_code=404, detail=f"Bus stop with ID {stop_id} not found")
+
+    after = after or datetime.now().time()
+    departures = get_timetable_store().departures(stop_id, time_to_seconds(after), limit,
+                                                  service_date or date.today())
+
+    return [
+        {
+            "line_id": departure.line_id,
+            "line_name": lines[departure.line_id].name,
+            "trip_id": departure.trip_id,
+            "departure": seconds_to_time(departure.departure),
+            "next_stop_id": departure.next_stop_id,
+        } for departure in departures
+    ]
+
 @router.get("/get_lines_for_stop/{stop_id}", response_model=List[Line])
 async def get_lines_for_stop(stop_id: str):
     """Get all lines that pass through a specific stop"""
@@ -210,21 +224,14 @@ async def get_lines_for_stop(stop_id: str):
 @router.post("/vote_event", response_model=Event)
 async def vote_event(vote_data: EventVote):
     """Vote on an event (upvote or downvote)"""
-    # Find the event
-    event = next((e for e in EVENTS_STORAGE if e.id == vote_data.eventId), None)
+    if vote_data.voteType not in ("upvote", "downvote"):
+        raise HTTPException(status_code=400, detail="voteType must be 'upvote' or 'downvote'")
+
+    # Update vote counts (and the voter's level)
+    event = await vote_stored_event(vote_data.eventId, vote_data.userId, vote_data.voteType == "upvote")
     if not event:
         raise HTTPException(status_code=404, detail=f"Event with ID {vote_data.eventId} not found")
-    
-    # Update vote counts
-    if vote_data.voteType == "upvote":
-        event.upvotes += 1
-        update_user_level(vote_data.userId, True)
-    elif vote_data.voteType == "downvote":
-        event.downvotes += 1
-        update_user_level(vote_data.userId, False)
-    else:
-        raise HTTPException(status_code=400, detail="voteType must be 'upvote' or 'downvote'")
-    
+
     return event
 
 @router.patch("/resolve_event/{event_id}", response_model=Event)
@@ -236,35 +243,37 @@ async def resolve_event(event_id: str):
     except ValueError:
         raise HTTPException(status_code=400, detail=f"Invalid event ID: {event_id}")
     
-    event = next((e for e in EVENTS_STORAGE if e.id == event_id_int), None)
+    event = await resolve_stored_event(event_id_int)
     if not event:
         raise HTTPException(status_code=404, detail=f"Event with ID {event_id} not found")
-    
-    event.isResolved = True
+
     return event
 
 @router.get("/stats")
 async def get_stats():
     """Get basic statistics about lines, stops, and events"""
+    counts = await event_stats()
     return {
         "total_lines": len(lines),
         "total_stops": len(stops),
-        "total_events": len(EVENTS_STORAGE),
-        "resolved_events": len([e for e in EVENTS_STORAGE if e.isResolved]),
-        "unresolved_events": len([e for e in EVENTS_STORAGE if not e.isResolved]),
+        "total_events": counts["total"],
+        "resolved_events": counts["resolved"],
+        "unresolved_events": counts["total"] - counts["resolved"],
         "events_by_type": {
-            incident_type.value: len([e for e in EVENTS_STORAGE if e.type == incident_type])
+            incident_type.value: counts["by_type"].get(incident_type.value, 0)
             for incident_type in IncidentType
         },
-        "total_upvotes": sum(e.upvotes for e in EVENTS_STORAGE),
-        "total_downvotes": sum(e.downvotes for e in EVENTS_STORAGE),
-        "csv_data_loaded": len(stops) > 0 and len(lines) > 0
+        "total_upvotes": counts["upvotes"],
+        "total_downvotes": counts["downvotes"],
+        "csv_data_loaded": len(stops) > 0 and len(lines) > 0,
+        "route_cache": get_route_cache().stats()
     }
 
 @router.get("/lines")
-async def get_all_line_numbers():
-    """Get all available line numbers from CSV data"""
-    return [line.number if line.number else str(line.id) for line in lines.values()]
+async def get_all_line_numbers(request: Request):
+    """Get all available line numbers from CSV data (cached until the network is reloaded, supports ETag)"""
+    return cached_json_response(request, "line_numbers",
+                                lambda: [line.number if line.number else str(line.id) for line in lines.values()])
 
 @router.get("/stops_by_name/{stop_name}")
 async def get_stops_by_name(stop_name: str):
@@ -290,17 +299,28 @@ async def get_line_by_number(line_number: str):
 
 @router.get("/notifications/{user_id}")
 async def get_user_notifications(user_id: int) -> list[Notification]:
-    """Get notifications for a specific user (stub implementation)"""
-    user_notifications = [n for n in notifications if n.user_id == user_id]
-    return user_notifications
+    """Get notifications for a specific user (their inbox keeps the most recent ones)"""
+    sync_shared_state()
+    return get_inbox(user_id)
+
+
+@router.post("/register_device/{user_id}")
+async def register_user_device(user_id: int, token: str = Query(..., description="Push notification device token")):
+    """Register a device token for push notifications"""
+    if user_id not in users:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    register_device(user_id, token)
+
+    return {"message": f"Device registered for user {user_id}"}
 
 
 @router.post("/assign_train/{user_id}")
 async def assign_train_to_user(user_id: int, train_id: int):
     """Assign a train to a user (stub implementation)"""
-    user = users[user_id]
-    user.current_train_id = train_id
-    users[user_id] = user
+    if user_id not in users:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    with shared_state_writer() as write:
+        write("assign_train", user_id=user_id, train_id=train_id)
     
     return {"message": f"Train {train_id} assigned to user {user_id}"}
 
@@ -308,6 +328,7 @@ async def assign_train_to_user(user_id: int, train_id: int):
 @router.get("/users")
 async def get_all_users() -> list[User]:
     """Get all users (stub implementation)"""
+    sync_shared_state()
     return list(users.values())
 
 @router.get("/prompt")
@@ -352,8 +373,106 @@ async def get_llm_answer(prompt: str) -> str:
 
     
 @router.post("/get_route")
-async def get_route(start:Stop, end:Stop):
-    return get_best_route(start=start, end=end)
+async def get_route(start:Stop, end:Stop, algorithm: str = Query("csa", description="Routing algorithm: 'csa', 'dijkstra', 'trip_based' (precomputed trip transfers) or goal-directed 'astar', 'alt', 'alt_bidirectional'; all but 'csa' use the timetable only"),
+                    start_time: time = Query(time(6, 0), description="Earliest departure time"),
+                    service_date: Optional[date] = Query(None, description="Travel date; only trips running that day are used (defaults to today)")):
+    """Find the best route between two stops, avoiding active incidents (repeated queries are served from the route cache).
+
+    Walks between nearby stops are segments with line id -1 whose two stops carry the walk's times.
+    """
+    if algorithm not in ROUTING_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"algorithm must be one of {', '.join(ROUTING_ALGORITHMS)}")
+    if algorithm == "trip_based" and get_trip_transfers() is None:
+        raise HTTPException(status_code=503, detail="Trip transfers are not loaded; build them with "
+                                                    "'python -m repositiories.trip_transfers' and set TRIP_TRANSFERS_PATH")
+    # Apply incidents reported on other workers first, so cached routes through them are dropped
+    await refresh_event_index()
+    return get_best_route(start=start, end=end, start_time=start_time, algorithm=algorithm,
+                          service_date=service_date or date.today())
+
+
+@router.post("/get_route_alternatives")
+async def get_route_alternatives_endpoint(start: Stop, end: Stop,
+                                          start_time: time = Query(time(6, 0), description="Earliest departure time"),
+                                          service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")):
+    """Route avoiding active incidents next to the timetable-only route and the disruptions on it"""
+    await refresh_event_index()
+    return get_route_alternatives(start=start, end=end, start_time=start_time, service_date=service_date or date.today())
+
+
+    
 
 
-    
\ No newline at end of file
+@router.post("/get_routes_pareto")
+async def get_routes_pareto(start: Stop, end: Stop,
+                            start_time: time = Query(time(6, 0), description="Earliest departure time"),
+                            max_transfers: int = Query(3, ge=0, le=MAX_TRANSFERS, description="Maximum number of transfers"),
+                            max_walk_m: int = Query(0, ge=0, le=MAX_WALK_M, description="Allow walking between nearby stops up to this many metres in total"),
+                            service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")):
+    """Routes that trade arrival time against transfers (and walking): no option is better in every criterion"""
+    return get_pareto_routes(start=start, end=end, start_time=start_time, max_transfers=max_transfers, max_walk_m=max_walk_m,
+                             service_date=service_date or date.today())
+
+
+@router.post("/get_route_profile")
+async def get_route_profile_endpoint(start: Stop, end: Stop,
+                                     from_time: time = Query(time(6, 0), description="Start of the departure window"),
+                                     to_time: time = Query(time(8, 0), description="End of the departure window"),
+                                     limit: Optional[int] = Query(None, ge=1, le=100, description="Return only the first N departures"),
+                                     service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")):
+    """Next departures from start to end within a time window, each with its earliest arrival.
+
+    Like /get_route, transfers may walk between nearby stops and unresolved incidents delay the trains.
+    """
+    if to_time < from_time:
+        raise HTTPException(status_code=400, detail="to_time must not be earlier than from_time")
+    return get_route_profile(start=start, end=end, from_time=from_time, to_time=to_time, limit=limit,
+                             service_date=service_date or date.today())
+
+
+@router.post("/get_route_search_stats")
+async def get_route_search_stats_endpoint(start: Stop, end: Stop,
+                                          start_time: time = Query(time(6, 0), description="Earliest departure time"),
+                                          service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")):
+    """Stops expanded by the route search with each lower bound (none, haversine, landmarks, bidirectional) for one query"""
+    return get_route_search_stats(start=start, end=end, start_time=start_time, service_date=service_date or date.today())
+
+
+@router.get("/isochrone")
+async def isochrone(start_time: time = Query(time(6, 0), description="Departure time"),
+                    stop_id: Optional[int] = Query(None, description="Start stop"),
+                    lat: Optional[float] = Query(None, description="Start point latitude (instead of stop_id)"),
+                    lng: Optional[float] = Query(None, description="Start point longitude (instead of stop_id)"),
+                    bands: List[int] = Query(list(ISOCHRONE_BANDS), description="Reachability bands in minutes (repeatable)"),
+                    service_date: Optional[date] = Query(None, description="Travel date (defaults to today)")):
+    """Stops reachable from a stop or point within each time band, computed in one search (timetable only)"""
+    if not bands or any(band <= 0 or band > 24 * 60 for band in bands):
+        raise HTTPException(status_code=400, detail="bands must be between 1 and 1440 minutes")
+    service_date = service_date or date.today()
+    if stop_id is not None:
+        if stop_id not in stops:
+            raise HTTPException(status_code=404, detail=f"Bus stop with ID {stop_id} not found")
+        return get_isochrone(start_time, stop_id=stop_id, bands=bands, service_date=service_date)
+    if lat is None or lng is None:
+        raise HTTPException(status_code=400, detail="Provide stop_id or both lat and lng")
+    return get_isochrone(start_time, location=LatLng(lat=lat, lng=lng), bands=bands, service_date=service_date)
+
+
+@router.post("/get_routes_batch")
+async def get_routes_batch(queries: List[RouteQuery]):
+    """Plan many routes at once (timetable only), streamed as NDJSON in completion order.
+
+    Each line carries the index of its query. Queries sharing a start stop and
+    time are answered by one search; large batches run on a process pool.
+    """
+    if len(queries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} queries per batch")
+    missing = sorted({stop_id for query in queries for stop_id in (query.start, query.end) if stop_id not in stops})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown stop IDs: {missing[:20]}")
+
+    today = date.today()
+    batch = [BatchQuery(query.start, query.end, time_to_seconds(query.start_time), query.service_date or today)
+             for query in queries]
+    lines_out = (json.dumps(result, separators=(",", ":")) + "\n" for result in plan_routes_batch(batch))
+    return StreamingResponse(lines_out, media_type="application/x-ndjson")
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import asyncio
+import logging
+from repositiories.event_repository import refresh_event_index, sync_shared_state
+from repositiories.live_hub import format_frame, get_live_hub
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+# Co ile sekund worker dociąga zmiany innych workerów, gdy ktoś słucha strumienia
+LIVE_SYNC_INTERVAL = 1.0
+# Co ile sekund wysyłany jest komentarz podtrzymujący połączenie
+HEARTBEAT_INTERVAL = 15.0
+
+
+def _parse_bbox(bbox: Optional[str]):
+    if bbox is None:
+        return None
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lat,min_lon,max_lat,max_lon")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+@router.get("/stream")
+async def stream(
+    request: Request,
+    line_id: Optional[List[int]] = Query(None, description="Only changes on these lines (repeatable)"),
+    bbox: Optional[str] = Query(None, description="Only changes inside min_lat,min_lon,max_lat,max_lon"),
+):
+    """Server-Sent Events stream of incident and train position changes.
+
+    Events: event_created, event_voted, event_resolved, train_moved. Each carries
+    a compact JSON delta; the client keeps its own copy of the state it loaded once
+    from /info/get_events and /trains/.
+    """
+    hub = get_live_hub()
+    subscription = hub.subscribe(line_id, _parse_bbox(bbox))
+
+    async def frames():
+        try:
+            yield b"retry: 3000\n\n" + format_frame("ready", {"lines": line_id, "bbox": bbox})
+            while not subscription.lagging:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": ping\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(frames(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def live_sync_loop(interval: float = LIVE_SYNC_INTERVAL):
+    """Dociąga zmiany zapisane przez inne workery, by trafiły do subskrybentów tego workera"""
+    while True:
+        await asyncio.sleep(interval)
+        if not get_live_hub().subscribers:
+            continue
+        try:
+            await refresh_event_index()
+            sync_shared_state()
+        except Exception:
+            logger.exception("Live sync failed")
@@ -1,24 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import List, Optional
 from datetime import datetime
 import uuid
 import math
+import asyncio
+import logging
 from models.database_models import Line, Stop, Route, Event, EventCreate, EventVote, IncidentType, LatLng, Notification, Train, Edge
-from db.dicts import stops, lines, notifications, trains, edges
+from db.dicts import stops, lines, trains, edges
+from repositiories.event_repository import shared_state_writer, sync_shared_state, apply_train_move
+from repositiories.response_cache import cached_json_response
+from repositiories.adjacency_index import edge_position
+from repositiories.vehicle_simulation import SIMULATION_TICK_SECONDS, get_vehicle_simulation
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/trains", tags=["trains"])
 
 def get_next_edge_for_train(train: Train) -> Optional[Edge]:
     """Get the next edge for a train on its line"""
     line = lines[train.line_id]
-    current_edge_index = None
-    
-    # Find current edge index in the line
-    for i, edge in enumerate(line.edges):
-        if edge.id == train.current_edge:
-            current_edge_index = i
-            break
-    
+    current_edge_index = edge_position(train.line_id, train.current_edge)
+
     if current_edge_index is None:
         return None
     
@@ -34,20 +36,22 @@ def move_train_to_next_edge(train_id: int) -> dict:
     if train_id not in trains:
         raise HTTPException(status_code=404, detail=f"Train with ID {train_id} not found")
     
-    train = trains[train_id]
-    next_edge = get_next_edge_for_train(train)
-    
-    if next_edge is None:
-        return {
-            "success": False,
-            "message": f"Train {train_id} is at the end of line {train.line_id}",
-            "train_id": train_id,
-            "current_edge": train.current_edge,
-        }
-    
-    # Move train to next edge
-    old_edge = train.current_edge
-    train.current_edge = next_edge.id
+    # Move train to next edge under the shared-state lock (shared with the other workers
+    # and pushed to live subscribers)
+    with shared_state_writer() as write:
+        train = trains[train_id]
+        next_edge = get_next_edge_for_train(train)
+
+        if next_edge is None:
+            return {
+                "success": False,
+                "message": f"Train {train_id} is at the end of line {train.line_id}",
+                "train_id": train_id,
+                "current_edge": train.current_edge,
+            }
+
+        old_edge = train.current_edge
+        write("move_train", train_id=train_id, edge_id=next_edge.id)
     
     # Get stop information
     from_stop = stops[next_edge.from_stop]
@@ -85,11 +89,20 @@ async def move_train(train_id: int):
 @router.get("/", response_model=List[Train])
 async def get_all_trains():
     """Get all trains"""
+    sync_shared_state()
     return list(trains.values())
 
+@router.get("/positions")
+async def get_train_positions():
+    """Simulated positions of all trains: edge, fraction along it, delay and interpolated coordinates"""
+    if not SIMULATION_TICK_SECONDS:
+        advance_vehicles()
+    return get_vehicle_simulation().positions()
+
 @router.get("/{train_id}", response_model=Train)
 async def get_train_info(train_id: int):
     """Get information about a specific train"""
+    sync_shared_state()
     if train_id not in trains:
         raise HTTPException(status_code=404, detail=f"Train with ID {train_id} not found")
     
@@ -98,6 +111,7 @@ async def get_train_info(train_id: int):
 @router.get("/{train_id}/status")
 async def get_train_status(train_id: int):
     """Get detailed status of a train including current location"""
+    sync_shared_state()
     if train_id not in trains:
         raise HTTPException(status_code=404, detail=f"Train with ID {train_id} not found")
     
@@ -127,6 +141,7 @@ async def get_train_status(train_id: int):
 @router.get("/{train_id}/next_stop")
 async def get_train_next_stop(train_id: int):
     """Get the next stop for a train"""
+    sync_shared_state()
     if train_id not in trains:
         raise HTTPException(status_code=404, detail=f"Train with ID {train_id} not found")
     
@@ -148,6 +163,7 @@ async def get_train_next_stop(train_id: int):
 @router.get("/on_line/{line_id}")
 async def get_trains_on_line(line_id: int):
     """Get all trains currently on a specific line"""
+    sync_shared_state()
     if line_id not in lines:
         raise HTTPException(status_code=404, detail=f"Line with ID {line_id} not found")
     
@@ -166,11 +182,14 @@ async def get_trains_on_line(line_id: int):
     }
 
 @router.get("/{train_id}/route")
-async def get_train_route(train_id: int):
-    """Get the complete route for a train"""
+async def get_train_route(request: Request, train_id: int):
+    """Get the complete route for a train (cached until the network is reloaded, supports ETag)"""
     if train_id not in trains:
         raise HTTPException(status_code=404, detail=f"Train with ID {train_id} not found")
-    
+
+    return cached_json_response(request, ("train_route", train_id), lambda: _train_route(train_id))
+
+def _train_route(train_id: int) -> dict:
     train = trains[train_id]
     line = lines[train.line_id]
     
@@ -233,3 +252,23 @@ async def get_train_current_location(train_id: int):
             "lon": to_stop.lon
         }
     }
+
+
+def advance_vehicles(now: Optional[datetime] = None):
+    """Advance the vehicle simulation and move trains that entered a new edge (local to this worker).
+
+    Journaled moves are synced first, so trains moved through /trains/move_train are left where they were put.
+    """
+    sync_shared_state()
+    for train_id, edge_id in get_vehicle_simulation().tick(now):
+        apply_train_move(train_id, edge_id)
+
+
+async def vehicle_simulation_loop(interval: float = SIMULATION_TICK_SECONDS):
+    """Advance all trains by the timetable every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            advance_vehicles()
+        except Exception:
+            logger.exception("Vehicle simulation tick failed")
@@ -0,0 +1,9 @@
+import pytest
+
+from repositiories.network import rebuild_network_indexes
+
+
+@pytest.fixture(scope="session", autouse=True)
+def demo_network():
+    """Indeksy sieci demonstracyjnej z db.dicts (jak przy starcie aplikacji bez GTFS_FEED_PATH)"""
+    rebuild_network_indexes()
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+from db.array_file import map_array_file, write_array_file
+from db.network_snapshot import load_snapshot, write_snapshot
+
+MAGIC = b"JRTESTAR"
+
+
+@pytest.fixture
+def array_file(tmp_path):
+    path = str(tmp_path / "arrays.bin")
+    write_array_file(path, MAGIC, {"version": 1}, {
+        "ids": np.arange(100, dtype=np.int64),
+        "times": np.arange(60, dtype=np.int32).reshape(6, 10),
+    })
+    return path
+
+
+def _truncate(path, size):
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+
+def test_map_array_file_round_trip(array_file):
+    header, arrays = map_array_file(array_file, MAGIC)
+
+    assert header["version"] == 1
+    assert arrays["ids"].tolist() == list(range(100))
+    assert arrays["times"].shape == (6, 10)
+
+
+def test_map_array_file_rejects_other_magic(array_file):
+    assert map_array_file(array_file, b"JROTHER!") is None
+
+
+@pytest.mark.parametrize("size", [len(MAGIC) + 3, len(MAGIC) + 8 + 5])
+def test_map_array_file_rejects_truncated_header(array_file, size):
+    _truncate(array_file, size)
+
+    assert map_array_file(array_file, MAGIC) is None
+
+
+def test_map_array_file_rejects_truncated_arrays(array_file):
+    _truncate(array_file, os.path.getsize(array_file) - 100)
+
+    assert map_array_file(array_file, MAGIC) is None
+
+
+def test_load_snapshot_rejects_truncated_snapshot(tmp_path):
+    path = str(tmp_path / "network.snapshot")
+    write_snapshot(path, "digest")
+    _truncate(path, os.path.getsize(path) // 2)
+
+    assert load_snapshot(path, "digest") is None
@@ -0,0 +1,101 @@
+import repositiories.journey_planner as journey_planner
+from repositiories.batch_planner import BatchQuery, group_queries, plan_routes_batch, shutdown_batch_pool
+from repositiories.footpaths import FootpathGraph
+from repositiories.journey_planner import (JourneyLeg, WalkLeg, find_journey, find_journeys, find_journeys_range,
+                                          leg_times)
+from repositiories.spatial_index import get_spatial_index
+
+START = 1
+MORNING = 6 * 3600
+
+
+def _arrival(legs):
+    return leg_times(legs, MORNING)[-1][1] if legs else None
+
+
+def test_find_journeys_single_target_matches_find_journey():
+    journeys = find_journeys(START, [6], MORNING)
+
+    assert set(journeys) == {6}
+    assert journeys[6]
+    assert _arrival(journeys[6]) == _arrival(find_journey(START, 6, MORNING))
+
+
+def test_find_journeys_many_targets_match_find_journey():
+    targets = [6, 10, 20, 35, START]
+    journeys = find_journeys(START, targets, MORNING)
+
+    assert set(journeys) == set(targets)
+    assert journeys[START] == []
+    for target in targets:
+        expected = find_journey(START, target, MORNING)
+        assert (journeys[target] is None) == (expected is None)
+        assert _arrival(journeys[target]) == _arrival(expected)
+
+
+def test_find_journeys_range_matches_find_journeys_at_each_time():
+    targets = [6, 10, 20, 26, 35, 43, START]
+    times = [MORNING + minutes * 60 for minutes in range(0, 8 * 60, 25)]
+    journeys = find_journeys_range(START, targets, times)
+
+    assert set(journeys) == set(times)
+    for start_seconds in times:
+        expected = find_journeys(START, targets, start_seconds)
+        for target in targets:
+            legs, single = journeys[start_seconds][target], expected[target]
+            assert (legs is None) == (single is None)
+            if legs:
+                assert leg_times(legs, start_seconds)[-1][1] == leg_times(single, start_seconds)[-1][1]
+
+
+def test_find_journeys_range_with_footpaths_matches_single_queries(monkeypatch):
+    graph = FootpathGraph(get_spatial_index(), radius_m=7000)
+    monkeypatch.setattr(journey_planner, "get_footpath_graph", lambda: graph)
+    targets = list(range(20, 44))
+    times = [MORNING + minutes * 60 for minutes in range(0, 10 * 60, 17)]
+
+    for start_id in (22, 30):
+        journeys = find_journeys_range(start_id, targets, times)
+        for start_seconds in times:
+            expected = find_journeys(start_id, targets, start_seconds)
+            for target in targets:
+                legs, single = journeys[start_seconds][target], expected[target]
+                assert (legs is None) == (single is None)
+                if not legs:
+                    continue
+                # Między kursami co najwyżej jedno dojście, a każdy odcinek startuje po końcu poprzedniego
+                assert not any(isinstance(a, WalkLeg) and isinstance(b, WalkLeg) for a, b in zip(legs, legs[1:]))
+                times_of_legs = leg_times(legs, start_seconds)
+                assert all(end <= departure for (_, end), (departure, _) in zip(times_of_legs, times_of_legs[1:]))
+                assert all(departure >= start_seconds for leg, (departure, _) in zip(legs, times_of_legs)
+                           if isinstance(leg, JourneyLeg))
+                if single:
+                    assert times_of_legs[-1][1] == leg_times(single, start_seconds)[-1][1]
+
+
+def test_group_queries_by_start_and_day():
+    queries = [BatchQuery(START, 6, MORNING), BatchQuery(START, 10, MORNING + 3600), BatchQuery(2, 6, MORNING)]
+
+    assert group_queries(queries) == [(START, None, [(0, 6, MORNING), (1, 10, MORNING + 3600)]),
+                                      (2, None, [(2, 6, MORNING)])]
+
+
+def test_plan_routes_batch_groups_queries_and_keeps_indexes():
+    queries = [BatchQuery(START, 6, MORNING), BatchQuery(START, 10, MORNING), BatchQuery(2, 6, MORNING)]
+    results = sorted(plan_routes_batch(queries, workers=1), key=lambda result: result["index"])
+
+    assert [(result["start"], result["end"]) for result in results] == [(1, 6), (1, 10), (2, 6)]
+    for query, result in zip(queries, results):
+        assert result["found"] == (find_journey(query.start_id, query.end_id, query.start_seconds) is not None)
+
+
+def test_plan_routes_batch_process_pool_matches_single_process():
+    queries = [BatchQuery(start, end, MORNING + hour * 3600) for start in range(1, 41) for end in (6, 20)
+               for hour in (0, 2)]
+    single = sorted(plan_routes_batch(queries, workers=1), key=lambda result: result["index"])
+    try:
+        pooled = sorted(plan_routes_batch(queries, workers=2), key=lambda result: result["index"])
+    finally:
+        shutdown_batch_pool()
+
+    assert pooled == single
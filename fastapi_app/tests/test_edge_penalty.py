@@ -0,0 +1,31 @@
+from repositiories.journey_planner import JourneyLeg, find_journey, get_compiled_timetable
+
+# Z przystanku 22 do 26 jadą linia 2 (kurs od 8:30: przystanek 22 o 9:35, 26 o 9:55)
+# i linia 1 (kurs od 8:00: przystanek 22 o 9:45, 26 o 10:05). Krawędź 31 leży na
+# linii 2 przed przystankiem 22.
+START, END = 22, 26
+UPSTREAM_EDGE = 31
+
+
+def penalties(edge_id: int, seconds: int):
+    slots = get_compiled_timetable().edge_slots
+    penalty = [0] * (len(slots) + 1)
+    penalty[slots[edge_id]] = seconds
+    return penalty
+
+
+def first_line(legs) -> int:
+    return next(leg.line.id for leg in legs if isinstance(leg, JourneyLeg))
+
+
+def test_penalty_before_boarding_delays_the_train():
+    assert first_line(find_journey(START, END, 9 * 3600 + 30 * 60)) == 2
+    # 15 minut opóźnienia przed przystankiem wejścia: linia 2 dojeżdża o 10:10, później niż linia 1
+    assert first_line(find_journey(START, END, 9 * 3600 + 30 * 60, penalties(UPSTREAM_EDGE, 900))) == 1
+
+
+def test_delayed_train_can_be_caught_after_its_planned_departure():
+    start = 9 * 3600 + 36 * 60  # po planowym odjeździe linii 2 z przystanku 22
+    assert first_line(find_journey(START, END, start)) == 1
+    # Z 5 minutami opóźnienia linia 2 odjeżdża o 9:40 i dojeżdża o 10:00
+    assert first_line(find_journey(START, END, start, penalties(UPSTREAM_EDGE, 300))) == 2
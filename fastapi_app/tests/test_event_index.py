@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import repositiories.event_repository as event_repository
+from db.dicts import users
+from models.database_models import Event, IncidentType, LatLng
+from repositiories.edge_overlay import get_edge_overlay
+from repositiories.event_index import EventIndex
+from repositiories.route_cache import get_route_cache
+
+TYPES = [IncidentType.DELAY, IncidentType.ACCIDENT]
+
+
+def make_event(event_id: int, edge_id, incident_type=IncidentType.DELAY, reporter: int = 1,
+               resolved: bool = False, upvotes: int = 0) -> Event:
+    return Event(id=event_id, type=incident_type, title=f"Event {event_id}", description="Report",
+                 timestamp=datetime(2026, 10, 19, 8) + timedelta(minutes=event_id % 7 * 10 + event_id),
+                 location=LatLng(lat=50.06, lng=19.94), reportedBy=reporter, edge_affected=edge_id,
+                 isResolved=resolved, upvotes=upvotes)
+
+
+def sample_events():
+    return [make_event(i, [23, 31, None][i % 3], TYPES[i % 2], reporter=i % 4, resolved=i % 5 == 0, upvotes=i % 3)
+            for i in range(1, 31)]
+
+
+def newest_first(events):
+    return sorted(events, key=lambda event: (event.timestamp, event.id), reverse=True)
+
+
+def test_query_matches_filtering_every_event():
+    events = sample_events()
+    index = EventIndex()
+    index.apply(enumerate(events, start=1))
+
+    for edge_ids in (None, [23], [23, 31], [99]):
+        for incident_type in (None, *TYPES):
+            for is_resolved in (None, True, False):
+                expected = newest_first(
+                    event for event in events
+                    if (edge_ids is None or event.edge_affected in edge_ids)
+                    and (incident_type is None or event.type == incident_type)
+                    and (is_resolved is None or event.isResolved == is_resolved))
+                assert index.query(edge_ids, incident_type, is_resolved, limit=None) == expected
+                assert index.query(edge_ids, incident_type, is_resolved, limit=5) == expected[:5]
+    assert index.query(limit=0) == []
+
+
+def test_lookups_and_stats():
+    events = sample_events()
+    index = EventIndex()
+    index.apply(enumerate(events, start=1))
+
+    assert len(index) == len(events) and index.get(7) == events[6] and index.get(99) is None
+    assert {e.id for e in index.unresolved_on_edge(23)} == {
+        e.id for e in events if e.edge_affected == 23 and not e.isResolved}
+    assert {e.id for e in index.active_on_edge(31, IncidentType.ACCIDENT)} == {
+        e.id for e in events if e.edge_affected == 31 and e.type == IncidentType.ACCIDENT and not e.isResolved}
+    assert index.stats() == {
+        "total": len(events),
+        "resolved": sum(e.isResolved for e in events),
+        "upvotes": sum(e.upvotes for e in events),
+        "downvotes": 0,
+        "by_type": {t.value: sum(e.type == t for e in events) for t in TYPES},
+    }
+
+
+def test_newer_revision_replaces_event_and_older_is_ignored():
+    index = EventIndex()
+    index.apply([(1, make_event(1, 23)), (2, make_event(2, 23))])
+
+    updated = make_event(1, 31, upvotes=2, resolved=True)
+    assert index.apply([(3, updated), (1, make_event(1, 23))]) == [(updated, make_event(1, 23))]
+    assert index.revision == 3 and index.get(1) == updated
+    assert [e.id for e in index.query([23], limit=None)] == [2]
+    assert index.query([31], is_resolved=True, limit=None) == [updated]
+    assert index.stats()["upvotes"] == 2 and index.stats()["resolved"] == 1
+
+
+def level_sum(index: EventIndex, levels, edge_id: int, incident_type: IncidentType) -> int:
+    """Suma poziomów policzona od zera z nierozwiązanych zdarzeń"""
+    return sum(levels[event.reportedBy] for event in index.active_on_edge(edge_id, incident_type)
+               if event.reportedBy in levels)
+
+
+def test_level_aggregates_follow_reports_votes_and_resolution():
+    levels = {1: 5, 2: 3}
+    index = EventIndex(level_of=levels.get)
+    events = [make_event(1, 23, reporter=1), make_event(2, 23, reporter=1), make_event(3, 23, reporter=2),
+              make_event(4, 23, reporter=9), make_event(5, 23, IncidentType.ACCIDENT, reporter=2),
+              make_event(6, 31, reporter=1)]
+    index.apply(enumerate(events, start=1))
+    revision = len(events)
+
+    def check(expected: int, reporters):
+        assert index.reporter_level_sum(23, IncidentType.DELAY) == expected == level_sum(
+            index, levels, 23, IncidentType.DELAY)
+        assert index.reporters(23, IncidentType.DELAY) == reporters
+
+    def change(event: Event):
+        nonlocal revision
+        revision += 1
+        index.apply([(revision, event)])
+
+    check(5 + 5 + 3, {1, 2})
+    assert index.reporter_level_sum(23, IncidentType.ACCIDENT) == 3
+    assert index.reporter_level_sum(31, IncidentType.DELAY) == 5
+
+    # Głos zmienia poziom głosującego (tu zgłaszającego 1) - sumy poprawia on_level_change
+    change(make_event(3, 23, reporter=2, upvotes=1))
+    levels[1] = 7
+    index.on_level_change(1, 5, 7)
+    check(7 + 7 + 3, {1, 2})
+    assert index.reporter_level_sum(31, IncidentType.DELAY) == 7
+
+    change(make_event(1, 23, reporter=1, resolved=True))
+    check(7 + 3, {1, 2})
+    change(make_event(3, 23, reporter=2, resolved=True))
+    check(7, {1})
+    assert index.reporter_level_sum(23, IncidentType.ACCIDENT) == 3
+
+    for event_id, reporter in ((2, 1), (4, 9)):
+        change(make_event(event_id, 23, reporter=reporter, resolved=True))
+    check(0, set())
+    assert (23, IncidentType.DELAY) not in index.level_sums
+    assert (23, IncidentType.DELAY) not in index.reporter_keys.get(1, ())
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    """Repozytorium zdarzeń z pustym indeksem; poziomy użytkowników i kary krawędzi wracają po teście.
+
+    Magazyn otwiera test w swojej pętli zdarzeń - należy do niej kolejka zapisów.
+    """
+    monkeypatch.setattr(event_repository, "_store", None)
+    monkeypatch.setattr(event_repository, "EVENTS_DB_PATH", str(tmp_path / "events.db"))
+    monkeypatch.setattr(event_repository, "_index", EventIndex(level_of=event_repository._user_level))
+    saved_users = {user_id: (user.level, user.reputation) for user_id, user in users.items()}
+    overlay = get_edge_overlay()
+    saved_penalties = dict(overlay.by_edge)
+    yield event_repository
+    for user_id, (level, reputation) in saved_users.items():
+        users[user_id].level, users[user_id].reputation = level, reputation
+    for edge_id in set(overlay.by_edge) | set(saved_penalties):
+        overlay.set_edge(edge_id, saved_penalties.get(edge_id, 0))
+    get_route_cache().invalidate_penalized()
+
+
+def test_repository_keeps_aggregates_across_vote_and_resolve(repository):
+    reporter, edge_id = 2, 23
+    levels = {user_id: user.level for user_id, user in users.items()}
+
+    async def scenario():
+        await repository.open_event_store(repository.EVENTS_DB_PATH)
+        try:
+            await check_aggregates()
+        finally:
+            await repository.close_event_store()
+
+    async def check_aggregates():
+        index = repository.get_event_index()
+        before = index.reporter_level_sum(edge_id, IncidentType.DELAY)
+        assert before == level_sum(index, levels, edge_id, IncidentType.DELAY)
+
+        event = await repository.add_event(make_event(0, edge_id, reporter=reporter))
+        assert index.reporter_level_sum(edge_id, IncidentType.DELAY) == before + levels[reporter]
+        assert reporter in index.reporters(edge_id, IncidentType.DELAY)
+
+        # Zgłaszający głosuje na inne zdarzenie - jego wyższy poziom wchodzi do sumy
+        voted = await repository.vote_event(event.id, user_id=reporter, upvote=True)
+        assert voted.upvotes == 1 and users[reporter].level == levels[reporter] + 1
+        levels[reporter] += 1
+        assert index.reporter_level_sum(edge_id, IncidentType.DELAY) == level_sum(
+            index, levels, edge_id, IncidentType.DELAY)
+
+        await repository.resolve_event(event.id)
+        assert index.reporter_level_sum(edge_id, IncidentType.DELAY) == level_sum(
+            index, levels, edge_id, IncidentType.DELAY)
+        assert event.id not in {e.id for e in index.active_on_edge(edge_id, IncidentType.DELAY)}
+
+    asyncio.run(scenario())
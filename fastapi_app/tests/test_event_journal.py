@@ -0,0 +1,53 @@
+import os
+
+from db.event_journal import EventJournal
+
+
+class Counter:
+    """Stan klucz -> wartość zmieniany wpisami "set"; liczy odtworzone wpisy"""
+
+    def __init__(self, path, checkpoint_bytes=200):
+        self.state = {}
+        self.applied = 0
+        self.journal = EventJournal(path, {"set": self.apply}, {"set": self.dump}, checkpoint_bytes)
+
+    def apply(self, record):
+        self.applied += 1
+        self.state[record["key"]] = record["value"]
+
+    def dump(self):
+        for key, value in self.state.items():
+            yield {"key": key, "value": value}
+
+    def write(self, n):
+        for i in range(n):
+            with self.journal.writer() as write:
+                write("set", key=f"k{i % 3}", value=i)
+
+
+def test_new_worker_starts_from_checkpoint(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    writer = Counter(path)
+    writer.write(50)
+    assert os.path.exists(f"{path}.checkpoint")
+
+    reader = Counter(path)
+    reader.journal.sync()
+    assert reader.state == writer.state == {"k0": 48, "k1": 49, "k2": 47}
+    # Trzy wpisy punktu kontrolnego i tylko wiersze dopisane po nim, nie cała historia
+    assert reader.applied < 15
+
+    writer.write(4)
+    reader.journal.sync()
+    assert reader.state == writer.state
+
+
+def test_checkpoint_of_another_journal_is_ignored(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    Counter(path).write(50)
+    os.remove(path)
+    Counter(path, checkpoint_bytes=0).write(2)
+
+    reader = Counter(path)
+    reader.journal.sync()
+    assert reader.state == {"k0": 0, "k1": 1}
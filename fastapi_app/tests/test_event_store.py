@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime
+
+from db.event_store import EventStore
+from models.database_models import Event, IncidentType, LatLng
+
+SEED = [
+    Event(id=1, type=IncidentType.DELAY, title="Delay", description="Train late", timestamp=datetime(2026, 10, 19, 8),
+          location=LatLng(lat=50.06, lng=19.94), reportedBy=1, edge_affected=23),
+    Event(id=2, type=IncidentType.ACCIDENT, title="Accident", description="Blocked track",
+          timestamp=datetime(2026, 10, 19, 9), location=LatLng(lat=50.07, lng=19.95), reportedBy=2, edge_affected=31),
+]
+
+
+def new_event(title: str) -> Event:
+    return Event(id=0, type=IncidentType.DELAY, title=title, description="Report", timestamp=datetime(2026, 10, 19, 10),
+                 location=LatLng(lat=50.06, lng=19.94), reportedBy=3, edge_affected=23)
+
+
+def run(path, scenario):
+    async def main():
+        store = EventStore(str(path))
+        await store.open(seed=SEED)
+        try:
+            return await scenario(store)
+        finally:
+            await store.close()
+    return asyncio.run(main())
+
+
+def test_changes_since_round_trip(tmp_path):
+    async def scenario(store):
+        seeded = await store.changes_since(0)
+        assert [event for _, event in seeded] == SEED
+        revision = seeded[-1][0]
+
+        added = await store.add(new_event("New"))
+        assert added.id == 3
+        (change,) = await store.changes_since(revision)
+        assert change[0] > revision and change[1] == added
+        revision = change[0]
+
+        await store.vote(1, upvote=True)
+        await store.resolve(2)
+        changes = await store.changes_since(revision)
+        assert [event.id for _, event in changes] == [1, 2]
+        assert [rev for rev, _ in changes] == sorted(rev for rev, _ in changes)
+        assert changes[0][1].upvotes == 1 and changes[1][1].isResolved
+        assert await store.changes_since(changes[-1][0]) == []
+
+    run(tmp_path / "events.db", scenario)
+
+
+def test_missing_event_updates_return_none(tmp_path):
+    async def scenario(store):
+        revision = (await store.changes_since(0))[-1][0]
+        assert await store.vote(99, upvote=False) is None
+        assert await store.resolve(99) is None
+        assert await store.get(99) is None
+        assert await store.changes_since(revision) == []
+
+    run(tmp_path / "events.db", scenario)
+
+
+def test_events_survive_reopening(tmp_path):
+    path = tmp_path / "events.db"
+
+    async def write(store):
+        added = await store.add(new_event("Persisted"))
+        await store.vote(added.id, upvote=False)
+        return added.id
+
+    async def read(store):
+        # Ponowne otwarcie z tym samym seedem nie dubluje zdarzeń
+        changes = await store.changes_since(0)
+        assert [event.id for _, event in changes] == [1, 2, event_id]
+        event = await store.get(event_id)
+        assert event.title == "Persisted" and event.downvotes == 1
+
+    event_id = run(path, write)
+    run(path, read)
+
+
+def test_writers_sharing_a_file_see_each_others_changes(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def main():
+        first, second = EventStore(path), EventStore(path)
+        await first.open(seed=SEED)
+        await second.open(seed=SEED)
+        try:
+            revision = (await second.changes_since(0))[-1][0]
+            added = await first.add(new_event("From first"))
+            await second.vote(added.id, upvote=True)
+            changes = await first.changes_since(revision)
+            assert [(event.id, event.upvotes) for _, event in changes] == [(added.id, 1)]
+        finally:
+            await first.close()
+            await second.close()
+
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+import pytest
+
+import repositiories.goal_directed as goal_directed
+import repositiories.journey_planner as journey_planner
+from db.dicts import stops
+from repositiories.footpaths import FootpathGraph
+from repositiories.geo import get_stop_coordinates
+from repositiories.goal_directed import GOAL_HEURISTICS, LowerBounds, find_journey_goal_directed
+from repositiories.journey_planner import find_journeys, get_compiled_timetable, leg_times
+from repositiories.spatial_index import get_spatial_index
+
+ORIGINS = [1, 22, 30, 43, 50]
+TIMES = [6 * 3600, 9 * 3600 + 30 * 60, 13 * 3600]
+
+
+def arrival(legs, start_seconds: int):
+    return None if legs is None else leg_times(legs, start_seconds)[-1][1] if legs else start_seconds
+
+
+def expansions_matching_csa():
+    """Porównuje każdą heurystykę z CSA; zwraca heurystyka -> suma rozwiniętych przystanków"""
+    expanded = dict.fromkeys(GOAL_HEURISTICS, 0)
+    compared = 0
+    for start_id in ORIGINS:
+        for start_seconds in TIMES:
+            expected = find_journeys(start_id, stops, start_seconds)
+            for end_id in stops:
+                csa = arrival(expected[end_id], start_seconds)
+                for heuristic in GOAL_HEURISTICS:
+                    result = find_journey_goal_directed(start_id, end_id, start_seconds, heuristic)
+                    assert result.arrival == arrival(result.legs, start_seconds) == csa, (start_id, end_id, heuristic)
+                    expanded[heuristic] += result.nodes_expanded
+                compared += csa is not None
+    assert compared > 100
+    return expanded
+
+
+def test_every_heuristic_matches_csa():
+    expanded = expansions_matching_csa()
+
+    # Dokładniejsze ograniczenie nie rozwija więcej przystanków
+    assert expanded["landmarks"] <= expanded["haversine"] <= expanded["none"]
+    assert expanded["bidirectional"] <= expanded["landmarks"] < expanded["none"]
+
+
+def test_every_heuristic_matches_csa_with_footpaths(monkeypatch):
+    graph = FootpathGraph(get_spatial_index(), radius_m=7000)
+    monkeypatch.setattr(journey_planner, "get_footpath_graph", lambda: graph)
+    monkeypatch.setattr(goal_directed, "get_footpath_graph", lambda: graph)
+    # Ograniczenia muszą znać dojścia, inaczej przestają być dolne
+    monkeypatch.setattr(goal_directed, "_bounds", LowerBounds(get_compiled_timetable(), graph, get_stop_coordinates()))
+
+    expansions_matching_csa()
+
+
+def test_bidirectional_search_settles_backward():
+    result = find_journey_goal_directed(1, 43, TIMES[0], "bidirectional")
+
+    assert result.legs and result.backward_settled > 0
+    assert find_journey_goal_directed(1, 43, TIMES[0], "landmarks").backward_settled == 0
+
+
+def test_unknown_heuristic_is_rejected():
+    with pytest.raises(ValueError):
+        find_journey_goal_directed(1, 43, TIMES[0], "dijkstra")
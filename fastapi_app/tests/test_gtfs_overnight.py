@@ -0,0 +1,121 @@
+from datetime import date, datetime
+
+import pytest
+
+from db.dicts import calendars, edges, lines, schedules, stops, trains
+from db.gtfs_import import load_gtfs_feed
+from repositiories.batch_planner import _result
+from repositiories.journey_planner import earliest_arrivals, find_journey, leg_times, timetable_for_date
+from repositiories.network import rebuild_network_indexes
+from repositiories.pareto_planner import find_pareto_journeys
+from repositiories.timetable_store import get_timetable_store
+from repositiories.vehicle_simulation import VehicleSimulation
+
+MONDAY = date(2026, 10, 19)
+TUESDAY = date(2026, 10, 20)
+WEDNESDAY = date(2026, 10, 21)
+
+FEED = {
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\nA,Alpha,50.00,19.90\nB,Beta,50.05,19.95\n",
+    "routes.txt": "route_id,route_short_name,route_long_name,route_type\nR,1,Night,3\n",
+    "trips.txt": "route_id,service_id,trip_id\nR,MON,T1\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                      "T1,24:30:00,24:30:00,A,1\nT1,24:50:00,24:50:00,B,2\n",
+    "calendar.txt": "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "MON,1,0,0,0,0,0,0,20260101,20261231\n",
+}
+
+
+def _load_feed(tmp_path, feed):
+    """Wczytuje feed zamiast sieci demonstracyjnej, a po teście ją przywraca"""
+    saved = [(table, dict(table)) for table in (stops, edges, lines, schedules, calendars, trains)]
+    for name, content in feed.items():
+        (tmp_path / name).write_text(content)
+    load_gtfs_feed(str(tmp_path))
+    rebuild_network_indexes()
+    yield {stop.name: stop.id for stop in stops.values()}
+    for table, content in saved:
+        table.clear()
+        table.update(content)
+    rebuild_network_indexes()
+
+
+@pytest.fixture
+def night_feed(tmp_path):
+    """Feed z kursem odjeżdżającym o 24:30 w usłudze poniedziałkowej"""
+    yield from _load_feed(tmp_path, FEED)
+
+
+@pytest.fixture
+def late_feed(tmp_path):
+    """Feed z kursem 23:50 - 24:30 w usłudze poniedziałkowej (przekracza północ w trakcie jazdy)"""
+    yield from _load_feed(tmp_path, dict(FEED, **{
+        "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                          "T1,23:50:00,23:50:00,A,1\nT1,24:30:00,24:30:00,B,2\n",
+    }))
+
+
+def test_trip_after_midnight_keeps_its_day_offset(night_feed):
+    (schedule,) = schedules.values()
+
+    assert schedule.day_offset == 1
+    assert timetable_for_date(MONDAY).dep_time == [24 * 3600 + 30 * 60]
+    assert timetable_for_date(TUESDAY).dep_time == [30 * 60]
+
+
+def test_trip_after_midnight_runs_early_next_day(night_feed):
+    start, end = night_feed["Alpha"], night_feed["Beta"]
+
+    assert end not in earliest_arrivals({start: 0}, 24 * 3600 - 1, MONDAY)
+    assert earliest_arrivals({start: 0}, 3600, TUESDAY)[end] == 50 * 60
+
+
+def test_leg_times_do_not_wrap_at_midnight(night_feed):
+    start, end = night_feed["Alpha"], night_feed["Beta"]
+    evening = 23 * 3600
+
+    legs = find_journey(start, end, evening, service_date=MONDAY)
+    assert leg_times(legs, evening) == [(24 * 3600 + 30 * 60, 24 * 3600 + 50 * 60)]
+    result = _result(0, start, end, evening, MONDAY, legs)
+    assert result["arrival"] == "00:50:00" and result["duration_minutes"] == 110.0
+
+    # Ten sam kurs widziany we wtorek (przesunięty o dobę) ma czasy wtorkowe
+    legs = find_journey(start, end, 0, service_date=TUESDAY)
+    assert leg_times(legs, 0) == [(30 * 60, 50 * 60)]
+
+
+def test_departures_follow_service_date(night_feed):
+    store = get_timetable_store()
+    start = night_feed["Alpha"]
+
+    assert [d.departure for d in store.departures(start, 0, service_date=MONDAY)] == [24 * 3600 + 30 * 60]
+    assert [d.departure for d in store.departures(start, 0, service_date=TUESDAY)] == [30 * 60]
+    assert store.departures(start, 0, service_date=WEDNESDAY) == []
+
+
+def test_pareto_follows_service_date(night_feed):
+    start, end = night_feed["Alpha"], night_feed["Beta"]
+
+    (journey,) = find_pareto_journeys(start, end, 0, service_date=TUESDAY)
+    assert journey.arrival == 50 * 60
+    assert find_pareto_journeys(start, end, 0, service_date=WEDNESDAY) == []
+
+
+def test_vehicle_keeps_running_its_trip_past_midnight(late_feed):
+    simulation = VehicleSimulation(trains, lines)
+
+    simulation.tick(datetime(2026, 10, 19, 23, 55))
+    (position,) = simulation.positions()
+    assert position["trip_id"] is not None and position["fraction"] == 0.125
+
+    simulation.delay[0] = 5 * 60
+    simulation.tick(datetime(2026, 10, 20, 0, 10))
+    assert simulation.positions()[0]["trip_id"] == position["trip_id"]
+    # O północy pojazd zachowuje kurs i opóźnienie: 0:10 - 5 minut to 15 z 40 minut jazdy
+    assert simulation.positions()[0]["delay_seconds"] == 5 * 60
+    assert simulation.positions()[0]["fraction"] == 0.375
+
+    # Wtorkowa symulacja od zera też widzi poniedziałkowy kurs nocny
+    simulation = VehicleSimulation(trains, lines)
+    simulation.tick(datetime(2026, 10, 20, 0, 10))
+    assert simulation.positions()[0]["fraction"] == 0.5
@@ -0,0 +1,61 @@
+from db.dicts import schedules, stops
+from repositiories.journey_planner import JourneyLeg, find_journey, find_journeys, leg_times
+from repositiories.timetable_store import time_to_seconds
+
+ORIGINS = [1, 22, 30, 43, 50]
+TIMES = [6 * 3600, 9 * 3600 + 30 * 60, 13 * 3600]
+
+
+def reference_arrivals(start_id: int, start_seconds: int):
+    """Najwcześniejsze przyjazdy z przejazdów między kolejnymi przystankami kursów, liczone do skutku"""
+    hops = []
+    for schedule in schedules.values():
+        times = sorted((time_to_seconds(at), stop_id) for stop_id, at in schedule.stop_to_time.items())
+        hops.extend((dep_stop, dep, arr_stop, arr) for (dep, dep_stop), (arr, arr_stop) in zip(times, times[1:]))
+
+    earliest = {start_id: start_seconds}
+    changed = True
+    while changed:
+        changed = False
+        for dep_stop, dep, arr_stop, arr in hops:
+            if earliest.get(dep_stop, float('inf')) <= dep and arr < earliest.get(arr_stop, float('inf')):
+                earliest[arr_stop] = arr
+                changed = True
+    return earliest
+
+
+def test_csa_matches_reference_arrivals():
+    for start_id in ORIGINS:
+        for start_seconds in TIMES:
+            expected = reference_arrivals(start_id, start_seconds)
+            journeys = find_journeys(start_id, stops, start_seconds)
+            for end_id, legs in journeys.items():
+                if end_id == start_id:
+                    assert legs == []
+                    continue
+                assert (legs is None) == (end_id not in expected)
+                if legs:
+                    assert leg_times(legs, start_seconds)[-1][1] == expected[end_id]
+
+
+def test_csa_legs_connect_in_time():
+    for start_id in ORIGINS:
+        for start_seconds in TIMES:
+            for end_id in (6, 26, 43, 59):
+                legs = find_journey(start_id, end_id, start_seconds)
+                if not legs:
+                    continue
+                assert all(isinstance(leg, JourneyLeg) for leg in legs)
+                assert legs[0].stop_ids[0] == start_id and legs[-1].stop_ids[-1] == end_id
+                assert legs[0].departure >= start_seconds
+                for previous, leg in zip(legs, legs[1:]):
+                    assert previous.stop_ids[-1] == leg.stop_ids[0]
+                    assert previous.arrival <= leg.departure
+                for leg in legs:
+                    stop_times = leg.schedule.stop_to_time
+                    assert time_to_seconds(stop_times[leg.stop_ids[0]]) == leg.departure
+                    assert time_to_seconds(stop_times[leg.stop_ids[-1]]) == leg.arrival
+
+
+def test_unreachable_after_last_trip():
+    assert find_journey(1, 43, 22 * 3600) is None
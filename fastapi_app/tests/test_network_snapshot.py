@@ -0,0 +1,58 @@
+import pytest
+
+import repositiories.adjacency_index as adjacency_index
+from db.dicts import calendars, edges, lines, schedules, stops, trains
+from db.network_snapshot import load_snapshot, write_snapshot
+from repositiories.adjacency_index import get_adjacency_index
+from repositiories.footpaths import FootpathGraph, get_footpath_graph
+from repositiories.goal_directed import LowerBounds, get_lower_bounds
+from repositiories.network import rebuild_network_indexes
+from repositiories.spatial_index import SpatialIndex, get_spatial_index
+
+
+def index_state():
+    spatial, graph, bounds = get_spatial_index(), get_footpath_graph(), get_lower_bounds()
+    return (dict(get_adjacency_index()),
+            {cell: members.tolist() for cell, members in spatial.stop_cells.items()},
+            {cell: members.tolist() for cell, members in spatial.edge_cells.items()},
+            spatial.edge_ids.tolist(), spatial.edge_segments.tolist(),
+            graph.offsets.tolist(), graph.targets.tolist(), graph.seconds.tolist(),
+            bounds.forward, bounds.backward, bounds.max_speed, bounds.landmarks,
+            bounds.from_landmark.tolist(), bounds.to_landmark.tolist())
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    """Migawka sieci demonstracyjnej; po teście tabele i indeksy wracają do stanu sprzed wczytania"""
+    saved = [(table, dict(table)) for table in (stops, edges, lines, schedules, calendars, trains)]
+    path = str(tmp_path / "network.snapshot")
+    write_snapshot(path, "digest")
+    yield path
+    for table, content in saved:
+        table.clear()
+        table.update(content)
+    rebuild_network_indexes()
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("index rebuilt instead of loaded from the snapshot")
+
+
+def test_snapshot_restores_indexes_without_rebuilding(snapshot, monkeypatch):
+    built = index_state()
+    store, arrays = load_snapshot(snapshot, "digest")
+    for cls in (SpatialIndex, FootpathGraph, LowerBounds):
+        monkeypatch.setattr(cls, "__init__", fail)
+    monkeypatch.setattr(adjacency_index, "build_adjacency_index", fail)
+
+    rebuild_network_indexes(store, arrays)
+    assert index_state() == built
+
+
+def test_snapshot_indexes_for_other_footpath_radius_are_rebuilt(snapshot):
+    store, arrays = load_snapshot(snapshot, "digest")
+    arrays = dict(arrays, footpath_radius_m=arrays["footpath_radius_m"] + 100)
+
+    rebuild_network_indexes(store, arrays)
+    assert get_footpath_graph().radius_m != arrays["footpath_radius_m"][0]
+    assert get_lower_bounds().footpath_radius_m == get_footpath_graph().radius_m
@@ -0,0 +1,16 @@
+import pytest
+
+from repositiories.notification_service import LogBackend, NotificationBackend
+
+
+def test_backend_without_deliver_fails_at_construction():
+    class SilentBackend(NotificationBackend):
+        async def close(self):
+            pass
+
+    with pytest.raises(TypeError):
+        SilentBackend()
+
+
+def test_log_backend_is_a_complete_backend():
+    assert isinstance(LogBackend(), NotificationBackend)
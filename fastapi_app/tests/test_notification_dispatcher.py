@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import repositiories.notification_service as notification_service
+from models.database_models import IncidentType
+from repositiories.notification_service import COALESCE_WINDOW, FanOut, LogBackend, NotificationDispatcher
+
+JOB = FanOut(edge_id=31, incident_type=IncidentType.DELAY, title="Delay", exclude=frozenset())
+
+
+def test_fan_out_runs_off_the_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(NotificationDispatcher, "fan_out", lambda self, job: threads.append(threading.get_ident()) or [])
+
+    async def run():
+        dispatcher = NotificationDispatcher(LogBackend())
+        dispatcher.start()
+        assert dispatcher.submit(JOB)
+        await dispatcher.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert threads and threads[0] != loop_thread
+
+
+def test_fan_out_forgets_alerts_outside_coalesce_window(monkeypatch):
+    now = datetime(2026, 10, 19, 12, 0)
+    monkeypatch.setattr(notification_service, "_pruned_at", None)
+    monkeypatch.setattr(notification_service, "_last_alert", {
+        (1, 31, "delay"): now - COALESCE_WINDOW,
+        (2, 31, "delay"): now - COALESCE_WINDOW / 2,
+    })
+
+    NotificationDispatcher(LogBackend()).fan_out(JOB._replace(edge_id=-1), now)
+    assert list(notification_service._last_alert) == [(2, 31, "delay")]
@@ -0,0 +1,77 @@
+import repositiories.pareto_planner as pareto_planner
+from repositiories.footpaths import FootpathGraph
+from repositiories.journey_planner import WalkLeg, find_journey, leg_times
+from repositiories.pareto_planner import RideLeg, find_pareto_journeys
+from repositiories.spatial_index import get_spatial_index
+from repositiories.timetable_store import time_to_seconds
+
+# Z przystanku 22 do 50 o 6:00: z przesiadką na 7:25 albo bez przesiadki na 7:30
+START, END = 22, 50
+MORNING = 6 * 3600
+
+
+def criteria(journey):
+    return journey.arrival, journey.transfers, journey.walk_m
+
+
+def dominates(a, b) -> bool:
+    return all(x <= y for x, y in zip(criteria(a), criteria(b))) and criteria(a) != criteria(b)
+
+
+def check_legs(journey, start_id: int, end_id: int, start_seconds: int):
+    """Odcinki łączą się w miejscu i czasie, a kryteria zgadzają się z odcinkami"""
+    rides = [leg for leg in journey.legs if isinstance(leg, RideLeg)]
+    assert journey.transfers == len(rides) - 1
+    assert journey.walk_m == sum(leg.distance_m for leg in journey.legs if isinstance(leg, WalkLeg))
+
+    at, ready = start_id, start_seconds
+    for leg in journey.legs:
+        if isinstance(leg, WalkLeg):
+            assert leg.from_stop == at
+            at, ready = leg.to_stop, ready + leg.seconds
+            continue
+        assert leg.stop_ids[0] == at
+        departure = time_to_seconds(leg.schedule.stop_to_time[leg.stop_ids[0]])
+        assert departure >= ready
+        at, ready = leg.stop_ids[-1], time_to_seconds(leg.schedule.stop_to_time[leg.stop_ids[-1]])
+    assert at == end_id and ready == journey.arrival
+
+
+def test_pareto_set_keeps_later_journey_without_transfers():
+    journeys = find_pareto_journeys(START, END, MORNING)
+
+    assert [criteria(journey) for journey in journeys] == [(7 * 3600 + 25 * 60, 1, 0), (7 * 3600 + 30 * 60, 0, 0)]
+    assert journeys[0].arrival == leg_times(find_journey(START, END, MORNING), MORNING)[-1][1]
+    for journey in journeys:
+        check_legs(journey, START, END, MORNING)
+
+
+def test_max_transfers_limits_the_set():
+    (direct,) = find_pareto_journeys(START, END, MORNING, max_transfers=0)
+
+    assert criteria(direct) == (7 * 3600 + 30 * 60, 0, 0)
+
+
+def test_no_journey_dominates_another():
+    for start_id, end_id in [(1, 43), (30, 59), (43, 1), (50, 20), (START, END)]:
+        journeys = find_pareto_journeys(start_id, end_id, MORNING)
+        assert journeys and journeys == sorted(journeys, key=lambda journey: journey.arrival)
+        assert not any(dominates(a, b) for a in journeys for b in journeys)
+        assert journeys[0].arrival == leg_times(find_journey(start_id, end_id, MORNING), MORNING)[-1][1]
+        for journey in journeys:
+            check_legs(journey, start_id, end_id, MORNING)
+
+
+def test_walking_is_a_third_criterion(monkeypatch):
+    graph = FootpathGraph(get_spatial_index(), radius_m=7000)
+    monkeypatch.setattr(pareto_planner, "get_footpath_graph", lambda: graph)
+
+    journeys = find_pareto_journeys(START, END, MORNING, max_walk_m=2000)
+    # Dojście daje przyjazd jak z przesiadką, ale bez niej - wszystkie trzy są niezdominowane
+    assert {criteria(journey)[1:] for journey in journeys} >= {(1, 0), (0, 0)}
+    assert any(journey.walk_m > 0 and journey.transfers == 0 for journey in journeys)
+    assert all(journey.walk_m <= 2000 for journey in journeys)
+    assert not any(dominates(a, b) for a in journeys for b in journeys)
+    for journey in journeys:
+        check_legs(journey, START, END, MORNING)
+    assert all(journey.walk_m == 0 for journey in find_pareto_journeys(START, END, MORNING))
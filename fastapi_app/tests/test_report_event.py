@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from models.database_models import EventCreate, IncidentType, LatLng
+from repositiories.route_finding import EVENT_EDGE_RADIUS_KM, find_nearest_edge
+from routers.info_route import report_event
+
+# Kraków Główny leży na krawędzi 23 sieci demonstracyjnej; Gdańsk jest daleko od każdej linii
+ON_ROUTE = LatLng(lat=50.0683947, lng=19.9475035)
+FAR_AWAY = LatLng(lat=54.3520, lng=18.6466)
+
+
+def test_nearest_edge_respects_max_distance():
+    assert find_nearest_edge(ON_ROUTE, EVENT_EDGE_RADIUS_KM) == 23
+    assert find_nearest_edge(FAR_AWAY) is not None
+    assert find_nearest_edge(FAR_AWAY, EVENT_EDGE_RADIUS_KM) is None
+
+
+def test_report_event_far_from_every_route_is_rejected():
+    event = EventCreate(type=IncidentType.DELAY, title="Delay", description="Train late", location=FAR_AWAY,
+                        reportedBy=1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(report_event(event))
+    assert error.value.status_code == 422
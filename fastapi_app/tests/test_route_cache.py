@@ -0,0 +1,148 @@
+from datetime import time
+
+import pytest
+
+from db.dicts import edges, stops
+from repositiories.edge_overlay import get_edge_overlay
+from repositiories.route_cache import (DEPARTURE_BUCKET, RouteCache, get_route_cache, rebuild_route_cache,
+                                      route_departure)
+from repositiories.route_finding import _find_route, get_best_route
+from repositiories.timetable_store import time_to_seconds
+
+# Z przystanku 22 do 26 o 9:30 najlepsza jest linia 2; krawędź 31 leży na niej przed przystankiem 22
+START, END = 22, 26
+MORNING = time(9, 30)
+UPSTREAM_EDGE = 31
+
+
+@pytest.fixture
+def overlay():
+    overlay = get_edge_overlay()
+    saved = dict(overlay.by_edge)
+    get_route_cache().invalidate_penalized()
+    yield overlay
+    for edge_id in set(overlay.by_edge) | set(saved):
+        overlay.set_edge(edge_id, saved.get(edge_id, 0))
+    get_route_cache().invalidate_penalized()
+
+
+def set_penalty(overlay, edge_id: int, seconds: int):
+    """Jak refresh_event_index: zmiana kary unieważnia trasy wyznaczone z karami"""
+    if overlay.set_edge(edge_id, seconds):
+        get_route_cache().invalidate_penalized()
+
+
+def first_line(route) -> int:
+    return next(segment.id for segment in route.values() if segment.id > 0)
+
+
+def test_upstream_penalty_invalidates_cached_route(overlay):
+    assert first_line(get_best_route(stops[START], stops[END], MORNING)) == 2
+
+    set_penalty(overlay, UPSTREAM_EDGE, 900)
+    assert first_line(get_best_route(stops[START], stops[END], MORNING)) == 1
+
+    set_penalty(overlay, UPSTREAM_EDGE, 0)
+    assert first_line(get_best_route(stops[START], stops[END], MORNING)) == 2
+
+
+def test_scheduled_routes_survive_penalty_changes(overlay):
+    cache = get_route_cache()
+    get_best_route(stops[START], stops[END], MORNING, avoid_incidents=False)
+    set_penalty(overlay, UPSTREAM_EDGE, 900)
+    hits = cache.hits
+    assert first_line(get_best_route(stops[START], stops[END], MORNING, avoid_incidents=False)) == 2
+    assert cache.hits == hits + 1
+
+
+def scheduled_route(start_seconds: int):
+    return _find_route(stops[START], stops[END], time(start_seconds // 3600, start_seconds % 3600 // 60), "csa",
+                       avoid_incidents=False)
+
+
+def test_hit_until_the_route_departs():
+    # Linia 2 odjeżdża z przystanku 22 o 9:35 - zapytanie o 9:35 trafia do przedziału 9:35-9:40
+    departure = route_departure(scheduled_route(time_to_seconds(MORNING)))
+    route = scheduled_route(departure)
+    assert route_departure(route) == departure and departure % DEPARTURE_BUCKET == 0
+
+    cache = RouteCache(1, edges)
+    assert cache.get(START, END, departure, "csa") is None
+    cache.put(START, END, departure, "csa", route)
+    assert cache.get(START, END, departure, "csa").route is route
+    # Sekundę później ten kurs już odjechał - w tym samym przedziale trzeba szukać od nowa
+    assert cache.get(START, END, departure + 1, "csa") is None
+    assert cache.get(START, END, departure, "trip_based") is None
+    assert cache.get(START, END, departure - 1, "csa") is None
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_later_start_before_departure_hits():
+    start = time_to_seconds(MORNING)
+    route = scheduled_route(start)
+    cache = RouteCache(1, edges)
+    cache.put(START, END, start, "csa", route)
+
+    assert cache.get(START, END, start + DEPARTURE_BUCKET - 1, "csa").route is route
+    assert cache.get(START, END, start - 1, "csa") is None
+
+
+def test_missing_route_is_cached_for_the_whole_bucket():
+    cache = RouteCache(1, edges)
+    start = 22 * 3600
+    cache.put(START, END, start, "csa", None)
+
+    cached = cache.get(START, END, start + DEPARTURE_BUCKET - 1, "csa")
+    assert cached is not None and cached.route is None
+
+
+def test_expired_and_evicted_entries_miss():
+    route = scheduled_route(time_to_seconds(MORNING))
+    start = time_to_seconds(MORNING)
+
+    expired = RouteCache(1, edges, ttl=0)
+    expired.put(START, END, start, "csa", route)
+    assert expired.get(START, END, start, "csa") is None and not expired.entries
+
+    cache = RouteCache(1, edges, size=2)
+    for end_id in (END, 25, 24):
+        cache.put(START, end_id, start, "csa", route)
+    assert cache.get(START, END, start, "csa") is None
+    assert cache.get(START, 25, start, "csa") is not None
+    cache.put(START, 23, start, "csa", route)
+    # 25 był użyty niedawno, więc usunięty zostaje 24
+    assert cache.get(START, 25, start, "csa") is not None and cache.get(START, 24, start, "csa") is None
+    assert cache.evictions == 2
+
+
+def test_invalidate_penalized_keeps_scheduled_routes():
+    start = time_to_seconds(MORNING)
+    route = scheduled_route(start)
+    cache = RouteCache(1, edges)
+    cache.put(START, END, start, "csa", route, penalized=True)
+    cache.put(START, END, start, "csa:scheduled", route)
+
+    assert cache.invalidate_penalized() == 1
+    assert cache.get(START, END, start, "csa") is None
+    assert cache.get(START, END, start, "csa:scheduled") is not None
+    assert cache.invalidate_penalized() == 0 and cache.stats()["invalidations"] == 1
+
+
+def test_route_edges_follow_ridden_segments():
+    route = scheduled_route(time_to_seconds(MORNING))
+    ridden = RouteCache(1, edges).route_edges(route)
+
+    assert ridden
+    assert all({edges[edge_id].from_stop, edges[edge_id].to_stop} <= set(range(22, 27)) for edge_id in ridden)
+    assert UPSTREAM_EDGE not in ridden
+
+
+def test_get_best_route_hits_cache_and_rebuild_starts_a_new_version(overlay):
+    cache = rebuild_route_cache()
+    first = get_best_route(stops[START], stops[END], MORNING)
+    assert get_best_route(stops[START], stops[END], MORNING) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    rebuilt = rebuild_route_cache()
+    assert rebuilt.version == cache.version + 1 and not rebuilt.entries
+    assert get_best_route(stops[START], stops[END], MORNING) is not first
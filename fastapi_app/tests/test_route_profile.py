@@ -0,0 +1,72 @@
+import repositiories.journey_planner as journey_planner
+from repositiories.footpaths import FootpathGraph
+from repositiories.journey_planner import (_footpaths, _scan, _scan_with_penalty, find_profile,
+                                          get_compiled_timetable, timetable_for_date)
+from repositiories.spatial_index import get_spatial_index
+
+# Pary przystanków sieci demonstracyjnej, także z przesiadkami między liniami
+QUERIES = [(1, 26), (30, 26), (50, 20), (1, 43), (22, 26), (43, 1)]
+WINDOW = (6 * 3600, 14 * 3600)
+
+
+def penalties(*edge_costs):
+    slots = get_compiled_timetable().edge_slots
+    penalty = [0] * (len(slots) + 1)
+    for edge_id, seconds in edge_costs:
+        penalty[slots[edge_id]] = seconds
+    return penalty
+
+
+def earliest_arrival(start_id, end_id, start_seconds, penalty=None):
+    """Przyjazd do celu z przebiegu find_journey (z karami i dojściami pieszymi)"""
+    tt, earliest = timetable_for_date(None), {}
+    if penalty is not None:
+        _scan_with_penalty(tt, start_id, end_id, start_seconds, penalty, _footpaths(), earliest)
+    else:
+        _scan(tt, start_id, end_id, start_seconds, _footpaths(), earliest)
+    return earliest.get(end_id)
+
+
+def profile_arrivals(queries, penalty=None):
+    for start_id, end_id in queries:
+        entries = find_profile(start_id, end_id, *WINDOW, penalty=penalty)
+        assert entries
+        for entry, legs in entries:
+            assert legs
+            yield start_id, end_id, entry, earliest_arrival(start_id, end_id, entry.departure, penalty)
+
+
+def test_profile_matches_find_journey():
+    for _, _, entry, arrival in profile_arrivals(QUERIES):
+        assert arrival == entry.arrival
+
+
+def test_profile_rides_through_without_splitting_legs():
+    for entry, legs in find_profile(1, 26, *WINDOW):
+        assert [(leg.stop_ids[0], leg.stop_ids[-1]) for leg in legs] == [(1, 26)]
+
+
+def test_profile_applies_edge_penalties():
+    penalty = penalties((31, 900), (23, 600))
+    scheduled = find_profile(22, 26, *WINDOW)
+    delayed = find_profile(22, 26, *WINDOW, penalty=penalty)
+    assert [entry.arrival for entry, _ in delayed] != [entry.arrival for entry, _ in scheduled]
+
+    for start_id, end_id, entry, arrival in profile_arrivals(QUERIES, penalty):
+        if start_id in (22, 30):
+            assert arrival == entry.arrival
+        else:
+            # Profil przegląda połączenia po odjazdach z opóźnieniem, więc łapie też opóźniony
+            # kurs odjeżdżający po przesiadce, który przebieg find_journey pomija
+            assert arrival is None or entry.arrival <= arrival
+
+
+def test_profile_walks_between_stops(monkeypatch):
+    graph = FootpathGraph(get_spatial_index(), radius_m=7000)
+    monkeypatch.setattr(journey_planner, "get_footpath_graph", lambda: graph)
+    assert any(graph.walks(stop_id) for stop_id, _ in QUERIES)
+
+    for start_id, end_id, entry, arrival in profile_arrivals(QUERIES):
+        # Podróż w całości pieszo nie ma odjazdu pociągu, więc nie trafia do profilu
+        walk = dict(graph.walks(start_id)).get(end_id)
+        assert arrival == min(entry.arrival, entry.departure + walk if walk is not None else entry.arrival)
@@ -0,0 +1,66 @@
+from datetime import time
+
+from db.dicts import lines, schedules
+from repositiories.timetable_store import TimetableStore, _rolling_seconds, get_timetable_store, time_to_seconds
+
+STOP = 22
+MORNING = 9 * 3600
+
+
+def test_every_schedule_is_one_row_of_its_pattern():
+    store = get_timetable_store()
+
+    assert set(store.trip_index) == {schedule.id for line in lines.values() for schedule in line.time_table}
+    for trip_id, ref in store.trip_index.items():
+        pattern = store.patterns[ref.pattern]
+        schedule = schedules[trip_id]
+        assert pattern.trip_ids[ref.row] == trip_id and pattern.schedules[ref.row] is schedule
+        assert pattern.stops.tolist() == list(schedule.stop_to_time)
+        assert pattern.times[ref.row].tolist() == [time_to_seconds(t) for t in schedule.stop_to_time.values()]
+
+
+def test_pattern_trips_are_sorted_by_first_departure():
+    for pattern in get_timetable_store().patterns:
+        first = pattern.times[:, 0].tolist()
+        assert first == sorted(first)
+
+
+def test_stop_time_and_first_trip_after():
+    store = get_timetable_store()
+    trip_id, ref = next(iter(store.trip_index.items()))
+    pattern = store.patterns[ref.pattern]
+    stop_id = int(pattern.stops[1])
+
+    assert store.stop_time(trip_id, stop_id) == time_to_seconds(schedules[trip_id].stop_to_time[stop_id])
+    assert store.stop_time(trip_id, -1) is None
+    assert store.stop_time(-1, stop_id) is None
+
+    column = pattern.times[:, 1].tolist()
+    row = pattern.first_trip_after(1, column[0] + 1)
+    assert row == next((i for i, seconds in enumerate(column) if seconds >= column[0] + 1), None)
+    assert pattern.first_trip_after(1, column[-1] + 1) is None
+
+
+def test_departures_match_schedules():
+    expected = sorted(
+        (time_to_seconds(schedule.stop_to_time[STOP]), line.id, schedule.id)
+        for line in lines.values() for schedule in line.time_table
+        if STOP in schedule.stop_to_time and list(schedule.stop_to_time)[-1] != STOP
+        and time_to_seconds(schedule.stop_to_time[STOP]) >= MORNING
+    )
+    departures = get_timetable_store().departures(STOP, MORNING, limit=len(expected) + 1)
+
+    assert sorted((d.departure, d.line_id, d.trip_id) for d in departures) == expected
+    assert [d.departure for d in departures] == sorted(d.departure for d in departures)
+    assert len(get_timetable_store().departures(STOP, MORNING, limit=2)) == 2
+
+
+def test_rolling_seconds_continue_past_midnight():
+    assert _rolling_seconds([time(23, 50), time(0, 10)]) == [85800, 87000]
+    assert _rolling_seconds([time(0, 30)], day_offset=1) == [88200]
+
+
+def test_empty_store():
+    store = TimetableStore({})
+
+    assert store.patterns == [] and store.departures(STOP, 0) == []
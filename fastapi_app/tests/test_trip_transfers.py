@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import repositiories.journey_planner as journey_planner
+import repositiories.trip_transfers as trip_transfers
+from db.dicts import stops
+from repositiories.footpaths import FootpathGraph
+from repositiories.journey_planner import find_journeys, leg_times
+from repositiories.spatial_index import get_spatial_index
+from repositiories.trip_transfers import build_trip_transfers, find_trip_based_journey, load_trip_transfers
+
+ORIGINS = [1, 22, 30, 43, 50]
+TIMES = [6 * 3600, 9 * 3600 + 30 * 60, 13 * 3600]
+
+
+@pytest.fixture(scope="module")
+def transfers():
+    return build_trip_transfers(workers=1)
+
+
+def arrival(legs, start_seconds: int):
+    return None if legs is None else leg_times(legs, start_seconds)[-1][1] if legs else start_seconds
+
+
+def assert_matches_csa(transfers):
+    compared = 0
+    for start_id in ORIGINS:
+        for start_seconds in TIMES:
+            expected = find_journeys(start_id, stops, start_seconds)
+            for end_id in stops:
+                legs = find_trip_based_journey(start_id, end_id, start_seconds, transfers=transfers)
+                assert arrival(legs, start_seconds) == arrival(expected[end_id], start_seconds), (start_id, end_id)
+                compared += legs is not None
+    assert compared > 100
+
+
+def test_trip_based_matches_csa(transfers):
+    assert len(transfers) > 0
+    assert_matches_csa(transfers)
+
+
+def test_trip_based_matches_csa_with_footpaths(monkeypatch):
+    graph = FootpathGraph(get_spatial_index(), radius_m=7000)
+    monkeypatch.setattr(journey_planner, "get_footpath_graph", lambda: graph)
+    monkeypatch.setattr(trip_transfers, "get_footpath_graph", lambda: graph)
+
+    assert_matches_csa(build_trip_transfers(footpaths=graph, workers=1))
+
+
+def test_pool_build_matches_single_process(transfers, monkeypatch):
+    monkeypatch.setattr(trip_transfers, "BUILD_CHUNK_SIZE", 8)
+    pooled = build_trip_transfers(workers=2)
+
+    for name in ("offsets", "target", "position"):
+        assert np.array_equal(getattr(pooled, name), getattr(transfers, name))
+
+
+def test_saved_transfers_load_only_for_the_same_network(transfers, tmp_path):
+    path = str(tmp_path / "transfers.bin")
+    transfers.save(path)
+
+    loaded = load_trip_transfers(path)
+    assert loaded is not None and loaded.digest == transfers.digest
+    assert np.array_equal(loaded.target, transfers.target) and np.array_equal(loaded.offsets, transfers.offsets)
+    assert find_trip_based_journey(1, 43, TIMES[0], transfers=loaded) is not None
+
+    other_footpaths = FootpathGraph(get_spatial_index(), radius_m=7000)
+    assert load_trip_transfers(path, footpaths=other_footpaths) is None
+    assert load_trip_transfers(str(tmp_path / "missing.bin")) is None
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from db.dicts import lines, trains
+from repositiories.edge_overlay import get_edge_overlay
+from repositiories.journey_planner import BLOCKED
+from repositiories.vehicle_simulation import VehicleSimulation
+
+# Pociąg 102 (linia 2) jeździ w poniedziałek kursem od 8:30, 5 minut na krawędź: 30, 31, 32, 33, ...
+TRAIN_ID = 102
+DAY = datetime(2026, 10, 19)
+
+
+def at(hour: int, minute: int) -> datetime:
+    return DAY.replace(hour=hour, minute=minute)
+
+
+def advance(simulation: VehicleSimulation, now: datetime):
+    """Tick z przeniesieniem ruchów do db.dicts, jak advance_vehicles"""
+    moved = simulation.tick(now)
+    for train_id, edge_id in moved:
+        trains[train_id].current_edge = edge_id
+    return moved
+
+
+@pytest.fixture
+def overlay():
+    overlay = get_edge_overlay()
+    saved = dict(overlay.by_edge)
+    yield overlay
+    for edge_id in set(overlay.by_edge) | set(saved):
+        overlay.set_edge(edge_id, saved.get(edge_id, 0))
+
+
+@pytest.fixture
+def simulation():
+    saved = {train_id: train.current_edge for train_id, train in trains.items()}
+    simulation = VehicleSimulation(trains, lines)
+    advance(simulation, at(8, 29))
+    yield simulation
+    for train_id, edge_id in saved.items():
+        trains[train_id].current_edge = edge_id
+
+
+def vehicle(simulation: VehicleSimulation) -> int:
+    return simulation.train_ids.tolist().index(TRAIN_ID)
+
+
+def test_penalties_of_every_crossed_edge_delay_the_vehicle(simulation, overlay):
+    overlay.set_edge(31, 60)
+    overlay.set_edge(32, 60)
+    advance(simulation, at(8, 50))
+    v = vehicle(simulation)
+    # Bez kar pojazd byłby na krawędzi 34; dwie kary po minucie cofają go na 33
+    assert simulation.delay[v] == 120
+    assert simulation.edge_id[v] == 33
+
+
+def test_vehicle_stops_at_first_blocked_edge(simulation, overlay):
+    overlay.set_edge(33, BLOCKED)
+    advance(simulation, at(9, 0))
+    v = vehicle(simulation)
+    assert simulation.edge_id[v] == 33
+    assert simulation.fraction[v] == 0.0
+    assert simulation.delay[v] == 15 * 60  # planowy wjazd na krawędź 33 o 8:45
+
+    advance(simulation, at(9, 10))
+    assert simulation.delay[v] == 25 * 60
+
+    overlay.set_edge(33, 0)
+    advance(simulation, at(9, 20))
+    assert simulation.edge_id[v] == 35
+
+
+def test_manual_move_is_not_overwritten(simulation):
+    v = vehicle(simulation)
+    assert simulation.edge_id[v] == 30
+    trains[TRAIN_ID].current_edge = 40
+    moved = advance(simulation, at(8, 50))
+    assert TRAIN_ID not in [train_id for train_id, _ in moved]
+    assert trains[TRAIN_ID].current_edge == 40
+    position = simulation.positions()[v]
+    assert position["manual"] and position["edge_id"] == 40
+    # Pozostałe pociągi jadą dalej według rozkładu
+    assert not any(position["manual"] for position in simulation.positions() if position["train_id"] != TRAIN_ID)
@@ -0,0 +1,82 @@
+import pytest
+
+from repositiories.footpaths import FootpathGraph
+from repositiories.journey_planner import JourneyLeg, WalkLeg, add_walk_legs, find_journey, leg_times
+from repositiories.route_cache import RouteCache, route_departure
+from repositiories.route_finding import _create_line_segment, _create_walk_segment
+from repositiories.spatial_index import get_spatial_index
+from repositiories.timetable_store import time_to_seconds
+from repositiories.user_repository import get_stop_by_id
+from db.dicts import edges
+
+MORNING = 6 * 3600
+
+
+@pytest.fixture(scope="module")
+def footpaths():
+    # Przystanki sieci demonstracyjnej leżą kilka km od siebie - szeroki promień daje dojścia
+    return FootpathGraph(get_spatial_index(), radius_m=10000)
+
+
+@pytest.fixture(scope="module")
+def ride():
+    legs = find_journey(1, 6, MORNING)
+    assert legs and all(isinstance(leg, JourneyLeg) for leg in legs)
+    return legs
+
+
+def _neighbour(footpaths, stop_id):
+    neighbours = footpaths.neighbours(stop_id)
+    assert neighbours
+    return neighbours[0]
+
+
+def test_walk_only_journey_is_one_walk_leg(footpaths):
+    to_stop, distance_m, seconds = _neighbour(footpaths, 1)
+
+    legs = add_walk_legs(1, to_stop, [], footpaths)
+
+    assert legs == [WalkLeg(1, to_stop, distance_m, seconds)]
+    assert leg_times(legs, MORNING) == [(MORNING, MORNING + seconds)]
+
+
+def test_access_walk_ends_at_first_departure(footpaths, ride):
+    board = ride[0].stop_ids[0]
+    origin, _, seconds = _neighbour(footpaths, board)
+    # Dojście z przystanku origin do board ma ten sam czas co z board do origin
+    seconds = next(s for neighbour, _, s in footpaths.neighbours(origin) if neighbour == board)
+
+    legs = add_walk_legs(origin, ride[-1].stop_ids[-1], ride, footpaths)
+    times = leg_times(legs, MORNING)
+
+    assert isinstance(legs[0], WalkLeg) and legs[1:] == ride
+    departure = time_to_seconds(ride[0].schedule.stop_to_time[board])
+    assert times[0] == (departure - seconds, departure)
+
+
+def test_route_cache_does_not_serve_walk_first_route_after_walk_departure(footpaths, ride):
+    board = ride[0].stop_ids[0]
+    origin = _neighbour(footpaths, board)[0]
+    legs = add_walk_legs(origin, ride[-1].stop_ids[-1], ride, footpaths)
+    times = leg_times(legs, MORNING)
+    route = {
+        i: _create_line_segment(leg.line, [get_stop_by_id(stop_id) for stop_id in leg.stop_ids], leg.schedule)
+        if isinstance(leg, JourneyLeg) else _create_walk_segment(leg, departure, arrival)
+        for i, (leg, (departure, arrival)) in enumerate(zip(legs, times), start=1)
+    }
+    walk_departure = times[0][0]
+    assert route_departure(route) == walk_departure
+
+    cache = RouteCache(1, edges)
+    start = walk_departure - 60
+    cache.put(origin, 6, start, "csa", route)
+    assert cache.get(origin, 6, walk_departure, "csa") is not None
+    assert cache.get(origin, 6, walk_departure + 1, "csa") is None
+
+
+def test_footpath_graph_matches_radius_search(footpaths):
+    index = get_spatial_index()
+    for stop_id, lat, lon in zip(index.coords.ids.tolist(), index.coords.lat.tolist(), index.coords.lon.tolist()):
+        expected = [(neighbour, round(distance_km * 1000))
+                    for neighbour, distance_km in index.stops_within_radius(lat, lon, 10.0) if neighbour != stop_id]
+        assert [(neighbour, distance_m) for neighbour, distance_m, _ in footpaths.neighbours(stop_id)] == expected